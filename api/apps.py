@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        if settings.WARM_CACHE_ON_STARTUP:
+            from .warming import warm_on_startup
+
+            request_started.connect(warm_on_startup, dispatch_uid="api.warming.warm_on_startup")
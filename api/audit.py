@@ -0,0 +1,118 @@
+"""
+Audit log of admin actions.
+
+Recording an action costs the request no query: events are queued in memory
+once the action's transaction commits, and a background thread writes them
+with one bulk INSERT when AUDIT_BATCH_SIZE are pending or every
+AUDIT_FLUSH_INTERVAL seconds, and once more when the process exits.
+
+Events still queued when a process is killed are lost. If the database
+cannot take a batch it is kept for the next flush; past AUDIT_MAX_PENDING
+events the requests adding more write the queue themselves, so a stalled
+flusher slows admin writes down instead of growing without bound.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .models import AuditEvent
+
+logger = logging.getLogger('api.audit')
+
+
+class AuditLog:
+    """
+    Queue of audit events written in batches by a background thread.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self._pending = deque()
+        self._lock = threading.Lock()
+        # Serializes flushes, so batches are written in order.
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, request, action, sku=None, target_user_id=None, changes=None):
+        """
+        Queue an event for the action the request's user is doing, once the
+        current transaction commits.
+        """
+        user = request.user
+        event = AuditEvent(
+            at=timezone.now(),
+            actor_id=user.pk,
+            actor=user.get_username() if user.is_authenticated else '',
+            action=action,
+            sku=sku,
+            target_user_id=target_user_id,
+            changes=changes or {},
+        )
+        transaction.on_commit(lambda: self._enqueue(event))
+
+    def _enqueue(self, event):
+        with self._lock:
+            self._pending.append(event)
+            pending = len(self._pending)
+        if pending >= settings.AUDIT_MAX_PENDING:
+            self.flush()
+        elif self.background:
+            self._ensure_thread()
+            if pending >= settings.AUDIT_BATCH_SIZE:
+                self._wake.set()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit_log', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+            # Do not hold a connection between flushes.
+            connections.close_all()
+
+    def flush(self):
+        """
+        Write the pending events, AUDIT_BATCH_SIZE per INSERT. Returns the
+        number of events written.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._pending.popleft() for _ in range(min(len(self._pending), settings.AUDIT_BATCH_SIZE))]
+                if not batch:
+                    return written
+                try:
+                    AuditEvent.objects.bulk_create(batch)
+                except DatabaseError:
+                    logger.exception("Could not write %d audit events, retrying on the next flush.", len(batch))
+                    with self._lock:
+                        self._pending.extendleft(reversed(batch))
+                    return written
+                written += len(batch)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+
+log = AuditLog()
+
+
+def record(request, action, **kwargs):
+    """
+    Record an admin action, see AuditLog.record.
+    """
+    log.record(request, action, **kwargs)
@@ -0,0 +1,214 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+from django.urls import Resolver404, URLResolver, include, path
+from django.urls.resolvers import RegexPattern
+from rest_framework.request import Request
+
+from .models import COUNT_STRATEGIES, Product, ProductCount
+from .partitioning import create_product_table
+from .routing import SegmentDispatchResolver
+from .sku import encode_sku
+from .throttling import TokenBucketThrottle
+
+
+def _resolver(urlpatterns):
+    """
+    Build a standalone root resolver over the given patterns.
+    """
+    return URLResolver(RegexPattern(r'^/'), urlpatterns)
+
+
+def _resolves(resolver, url):
+    try:
+        resolver.resolve(url)
+    except Resolver404:
+        return False
+    return True
+
+
+def _mean_microseconds(func, items, iterations):
+    """
+    Call func for every item, iterations times, and return the mean cost of
+    one call in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for item in items:
+            func(item)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(items)) * 1_000_000
+
+
+def benchmark_routing(iterations=2000, **options):
+    """
+    Compare URL resolution of the legacy routes and the /api/v1/ routes,
+    dispatched by path segments and with a plain include(), through the
+    project's root URLconf as requests are, and count unknown paths each
+    one wrongly accepts.
+    """
+    from server.urls import legacy_urlpatterns, urlpatterns
+
+    sku = uuid.uuid4()
+    routes = urlpatterns if settings.LEGACY_ROUTES else [*urlpatterns, *legacy_urlpatterns]
+    root = _resolver(routes)
+    include_root = _resolver([
+        path('api/v1/', include(('api.urls', 'api'), namespace='v1'))
+        if isinstance(route, SegmentDispatchResolver) else route
+        for route in routes
+    ])
+
+    legacy_urls = [
+        '/login', '/catalogue', f'/product/{sku}/', f'/updateproduct/{sku}',
+        f'/deleteproduct/{sku}', '/newproduct', '/admins', '/updateadmin/1',
+        '/deleteadmin/1',
+    ]
+    v1_urls = [
+        '/api/v1/auth/login/', '/api/v1/catalogue/', f'/api/v1/products/{sku}/',
+        f'/api/v1/products/{sku}/update/', f'/api/v1/products/{sku}/delete/',
+        '/api/v1/products/new/', '/api/v1/admins/', '/api/v1/admins/1/update/',
+        '/api/v1/admins/1/delete/',
+    ]
+    legacy_unknown = ['/loginpage', '/catalogue/old/', '/admins/1/secret', '/product/not-a-sku!/']
+    v1_unknown = [
+        '/api/v1/loginpage', '/api/v1/catalogue/old/', '/api/v1/admins/x/update/',
+        f'/api/v1/products/{encode_sku(sku)}x/', '/api/v1/products/not-a-sku!/',
+    ]
+
+    def mean(resolver, urls):
+        # Best of five runs, resolution being too quick for one to be stable.
+        return round(min(_mean_microseconds(resolver.resolve, urls, iterations) for _ in range(5)), 2)
+
+    def worst(resolver, urls):
+        return max(mean(resolver, [url]) for url in urls)
+
+    return [
+        ("legacy resolve, mean (us/request)", mean(root, legacy_urls)),
+        ("v1 resolve, mean (us/request)", mean(root, v1_urls)),
+        ("v1 resolve with a plain include(), mean (us/request)", mean(include_root, v1_urls)),
+        ("legacy resolve, worst route (us/request)", worst(root, legacy_urls)),
+        ("v1 resolve, worst route (us/request)", worst(root, v1_urls)),
+        ("v1 resolve with a plain include(), worst route (us/request)", worst(include_root, v1_urls)),
+        ("legacy unknown paths accepted", sum(_resolves(root, url) for url in legacy_unknown)),
+        ("v1 unknown paths accepted", sum(_resolves(root, url) for url in v1_unknown)),
+    ]
+
+
+def benchmark_partitioning(iterations=200, rows=1_000_000, partitions=16, **options):
+    """
+    Load the same rows in a plain and a hash partitioned scratch copy of the
+    product table, then time SKU lookups and brand-filtered catalogue pages
+    (iterations times per sample), counts (iterations / 20 times) and a
+    vacuum after updating 5% of the rows, of the whole plain table against
+    one partition, which is the unit of maintenance once partitioned.
+    """
+    plain, partitioned = 'bench_product_plain', 'bench_product_hash'
+    results = []
+    with connection.cursor() as cursor:
+        def query(sql, params=()):
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+        try:
+            for table, table_partitions in ((plain, 0), (partitioned, partitions)):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                create_product_table(cursor, table, table_partitions)
+            cursor.execute(f"""
+                INSERT INTO {plain} (sku, name, brand, price, views, version)
+                SELECT gen_random_uuid(), 'Product ' || i, 'Brand ' || (i %% 100), i %% 1000 + 0.99, 0, 1
+                FROM generate_series(1, %s) AS i
+            """, [rows])
+            cursor.execute(f"INSERT INTO {partitioned} SELECT * FROM {plain}")
+            for table in (plain, partitioned):
+                cursor.execute(f"ANALYZE {table}")
+
+            skus = [sku for sku, in query(f"SELECT sku FROM {plain} ORDER BY random() LIMIT 100")]
+            brands = [f"Brand {i}" for i in range(0, 100, 10)]
+            count_iterations = max(1, iterations // 20)
+            for label, table in (("plain", plain), (f"{partitions} partitions", partitioned)):
+                plan = query(f"EXPLAIN SELECT * FROM {table} WHERE sku = %s", [skus[0]])
+                results += [
+                    (f"{label}: tables scanned by SKU lookup", sum(" on " in line for line, in plan)),
+                    (f"{label}: SKU lookup (us/query)", round(_mean_microseconds(
+                        lambda sku: query(f"SELECT * FROM {table} WHERE sku = %s", [sku]), skus, iterations), 1)),
+                    (f"{label}: brand page (us/query)", round(_mean_microseconds(
+                        lambda brand: query(
+                            f"SELECT * FROM {table} WHERE brand = %s ORDER BY sku LIMIT 10 OFFSET 50", [brand]),
+                        brands, iterations), 1)),
+                    (f"{label}: brand count (us/query)", round(_mean_microseconds(
+                        lambda brand: query(f"SELECT count(*) FROM {table} WHERE brand = %s", [brand]),
+                        brands, count_iterations), 1)),
+                    (f"{label}: full count (us/query)", round(_mean_microseconds(
+                        lambda _: query(f"SELECT count(*) FROM {table}"), [None], count_iterations), 1)),
+                ]
+
+            for table in (plain, partitioned):
+                cursor.execute(f"UPDATE {table} SET views = views + 1 WHERE price < 50")
+            results += [
+                ("plain: vacuum table (ms)", round(_mean_microseconds(
+                    lambda _: cursor.execute(f"VACUUM {plain}"), [None], 1) / 1000, 1)),
+                (f"{partitions} partitions: vacuum one partition (ms)", round(_mean_microseconds(
+                    lambda _: cursor.execute(f"VACUUM {partitioned}_p0"), [None], 1) / 1000, 1)),
+            ]
+        finally:
+            for table in (plain, partitioned):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    return results
+
+
+def benchmark_counting(iterations=20, **options):
+    """
+    Time every count strategy on the product table as it is, for the whole
+    catalogue and for its largest brand, with the cached counts fresh.
+    """
+    ProductCount.refresh()
+    brand = Product.objects.order_by().values_list('brand').annotate(
+        products=Count('sku')).order_by('-products').values_list('brand', flat=True).first() or ''
+    querysets = [("catalogue", '', Product.objects.all()), ("largest brand", brand, Product.objects.filter(brand=brand))]
+    return [
+        (f"{label}, {strategy} (us/count)", round(_mean_microseconds(
+            lambda queryset: count(queryset, key), [queryset], iterations), 1))
+        for label, key, queryset in querysets
+        for strategy, count in COUNT_STRATEGIES.items()
+    ]
+
+
+def benchmark_throttling(iterations=5, rows=100_000, **options):
+    """
+    Time TokenBucketThrottle.allow_request against the configured cache, for
+    `rows` requests of one client and of as many distinct clients, to show
+    the cost does not grow with the number of clients. Clients use the
+    198.18.0.0/15 benchmarking addresses and their buckets are deleted after.
+    """
+    throttle = TokenBucketThrottle()
+    factory = RequestFactory()
+    addresses = [f'198.{18 + (i >> 16 & 1)}.{i >> 8 & 255}.{i & 255}' for i in range(rows)]
+    rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'anon_read': f'{iterations * rows + 1}/s'}}
+    results = []
+    try:
+        for label, clients in (("1 client", addresses[:1] * rows), (f"{rows} clients", addresses)):
+            requests = []
+            for address in clients:
+                request = Request(factory.get('/api/v1/catalogue/', REMOTE_ADDR=address))
+                request.user = AnonymousUser()
+                requests.append(request)
+            with override_settings(REST_FRAMEWORK=rates):
+                cost = _mean_microseconds(lambda request: throttle.allow_request(request, None), requests, iterations)
+            results.append((f"{label} (us/request)", round(cost, 2)))
+    finally:
+        cache.delete_many([f'throttle:anon_read:ip:{address}' for address in addresses])
+    return results
+
+
+SUITES = {
+    'counting': benchmark_counting,
+    'routing': benchmark_routing,
+    'partitioning': benchmark_partitioning,
+    'throttling': benchmark_throttling,
+}
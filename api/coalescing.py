@@ -0,0 +1,118 @@
+"""
+Single-flight coalescing of identical reads within a worker.
+
+Concurrent requests for the same product or catalogue page share one
+in-flight query: the first runs it and the others wait for its result
+instead of sending the same query to the database. This only helps workers
+serving requests from several threads (e.g. gunicorn --threads).
+
+Results can also be kept for COALESCE_FRESH_SECONDS and then, for
+COALESCE_STALE_SECONDS more, served stale while one background thread
+refreshes them (stale-while-revalidate). Both default to 0: only queries
+already in flight are shared, so responses are never older than the query
+they wait for.
+
+Requests pinned to the primary after a write bypass coalescing, so they
+read their own writes. Results are shared between threads and must be
+treated as read-only.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connections
+
+from .replicas import is_pinned
+
+
+class SingleFlight:
+    """
+    Run a function once per key at a time and share its result with every
+    caller asking for the same key meanwhile.
+    """
+    timer = time.monotonic
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # key -> (result, monotonic time it was computed), oldest first
+        self._results = OrderedDict()
+        self.stats = Counter()
+
+    def do(self, key, func):
+        """
+        Return func(), or the result of the identical call in flight, or
+        a recent enough result of it.
+        """
+        if is_pinned():
+            return func()
+        fresh = settings.COALESCE_FRESH_SECONDS
+        stale = settings.COALESCE_STALE_SECONDS
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                result, computed_at = entry
+                age = self.timer() - computed_at
+                if age < fresh:
+                    self.stats['fresh'] += 1
+                    return result
+                if age < fresh + stale:
+                    self.stats['stale'] += 1
+                    if key not in self._calls:
+                        self.stats['refreshes'] += 1
+                        self._calls[key] = Future()
+                        threading.Thread(target=self._refresh, args=(key, func), daemon=True).start()
+                    return result
+                del self._results[key]
+
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+            else:
+                self.stats['queries'] += 1
+                self._calls[key] = Future()
+        if future is not None:
+            return future.result()
+        return self._run(key, func)
+
+    def _run(self, key, func):
+        future = self._calls[key]
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if settings.COALESCE_FRESH_SECONDS or settings.COALESCE_STALE_SECONDS:
+                self._results[key] = (result, self.timer())
+                self._results.move_to_end(key)
+                while len(self._results) > settings.COALESCE_MAX_ENTRIES:
+                    self._results.popitem(last=False)
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def _refresh(self, key, func):
+        try:
+            self._run(key, func)
+        except Exception:
+            # The stale result keeps being served until it expires.
+            pass
+        finally:
+            connections.close_all()
+
+    def clear(self):
+        """
+        Forget the kept results and reset the stats.
+        """
+        with self._lock:
+            self._results.clear()
+            self.stats.clear()
+
+
+reads = SingleFlight()
@@ -0,0 +1,110 @@
+"""
+Response compression negotiated with Accept-Encoding.
+
+gzip is always available; brotli ("br") and zstandard ("zstd") are used when
+the `brotli` and `zstandard` packages are installed. COMPRESSION_ENCODINGS
+lists the encodings in server preference order and COMPRESSION_MIN_SIZE the
+smallest body, in bytes, worth compressing.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSORS = {
+    'gzip': lambda data: gzip.compress(data, compresslevel=6, mtime=0),
+}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    # Compressor objects are not thread-safe, so one is made per response.
+    COMPRESSORS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+COMPRESSIBLE_TYPE = re.compile(
+    r'^(text/|application/(json|xml|javascript|yaml|[\w.-]+\+(json|xml))\b)', re.IGNORECASE)
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into {coding: quality}.
+    """
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def choose_encoding(header, encodings):
+    """
+    Pick the encoding the client rates highest among the given ones, in
+    server preference order on ties. Returns None if none is acceptable.
+    """
+    accepted = parse_accept_encoding(header)
+    candidates = [
+        (accepted.get(name, accepted.get('*', 0.0)), -index, name)
+        for index, name in enumerate(encodings)
+    ]
+    quality, _, name = max(candidates, default=(0.0, 0, None))
+    return name if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """
+    Compress large enough text and JSON responses with the best encoding
+    both sides support.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encodings = [name for name in settings.COMPRESSION_ENCODINGS if name in COMPRESSORS]
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or response.status_code == 206
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+            or not COMPRESSIBLE_TYPE.match(response.get('Content-Type', ''))
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), self.encodings)
+        if encoding is None:
+            return response
+
+        compressed = COMPRESSORS[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed body is no longer byte-identical to the entity.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
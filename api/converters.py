@@ -0,0 +1,25 @@
+from django.urls import register_converter
+
+from .sku import SHORT_SKU_LENGTH, SKU_PATTERN, parse_sku
+
+
+class SkuConverter:
+    """
+    Path converter for product SKUs.
+    Accepts a UUID or its base62 short form and hands the view a UUID, so
+    malformed SKUs are rejected with a 404 before any query runs.
+    """
+    regex = SKU_PATTERN
+
+    def to_python(self, value):
+        return parse_sku(value)
+
+    def to_url(self, value):
+        sku = parse_sku(value)
+        if isinstance(value, str) and len(value) <= SHORT_SKU_LENGTH:
+            return value
+        return str(sku)
+
+
+# Registered on import, by every URLconf using <sku:>.
+register_converter(SkuConverter, 'sku')
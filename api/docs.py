@@ -0,0 +1,29 @@
+"""
+Swagger annotations for the API views.
+
+drf_yasg is only imported when it is in INSTALLED_APPS. Profiles that don't
+serve API docs (see server/settings_api.py) get inert stand-ins instead, so
+workers boot without loading the Swagger stack.
+"""
+from django.apps import apps
+
+if apps.is_installed("drf_yasg"):
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+else:
+    class _Undocumented:
+        """
+        Stand-in for the drf_yasg.openapi module: every attribute and call
+        returns another placeholder.
+        """
+
+        def __getattr__(self, name):
+            return self
+
+        def __call__(self, *args, **kwargs):
+            return self
+
+    openapi = _Undocumented()
+
+    def swagger_auto_schema(**kwargs):
+        return lambda view: view
@@ -0,0 +1,336 @@
+"""
+Product change events, streamed to admins with Server-Sent Events.
+
+Product creates, updates and deletes are published to a broker once their
+transaction commits. Every process keeps the last EVENTS_BUFFER_SIZE events
+in a ring buffer and hands new ones to its connected streams, so a client
+reconnecting with Last-Event-ID gets the events it missed.
+
+EVENTS_BROKER picks how events travel:
+
+- "local": within the process that made the write. Enough when one
+  process serves both the API and the streams.
+- "postgres": through PostgreSQL LISTEN/NOTIFY, so every process streams
+  the writes of all of them. Needs psycopg 3 for the listener.
+
+Under ASGI a stream is a coroutine waiting on a queue, so thousands of idle
+clients cost no thread; under WSGI (e.g. runserver) each stream holds one.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+
+CHANNEL = 'product_events'
+# Event ids of the postgres broker: the database clock in microseconds.
+CLOCK_ID = "(extract(epoch FROM clock_timestamp()) * 1000000)::bigint"
+# Bytes of event data one NOTIFY may carry: PostgreSQL refuses payloads of
+# 8000 bytes or more, and the id and type are added around the data.
+MAX_PAYLOAD = 7800
+
+logger = logging.getLogger('api.events')
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    type: str
+    data: dict
+
+    def encode(self):
+        """
+        Format the event as an SSE message.
+        """
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+
+RESYNC = Event(0, 'resync', {"detail": "Events were missed, reload the products."})
+
+
+class _AsyncSubscriber:
+    """
+    Stream served by a coroutine: events are handed to its event loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: end the stream right away, the client
+            # resumes from the last event it got.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class _ThreadSubscriber:
+    """
+    Stream served by a thread blocked on its queue.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            self.queue.put_nowait(None)
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+
+class LocalBroker:
+    """
+    Deliver events to the streams of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=settings.EVENTS_BUFFER_SIZE)
+        self._subscribers = set()
+        self._last_id = 0
+        # Id of the latest event known to be missing from the buffer: a
+        # client resuming from an earlier one must resync.
+        self._lost = None
+        # Set while events may be missed and it isn't known which yet.
+        self._gap = False
+
+    def publish(self, type, data):
+        """
+        Publish an event once the current transaction commits.
+        """
+        transaction.on_commit(lambda: self._publish(type, data))
+
+    def _publish(self, type, data):
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, type, data)
+        self.deliver(event)
+
+    def deliver(self, event):
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._lost = self._buffer[0].id
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def subscribe(self, subscriber, last_event_id=None):
+        """
+        Register a stream and return the buffered events it missed since
+        last_event_id, starting with RESYNC if some already left the buffer.
+        """
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if last_event_id is None:
+                return []
+            missed = [event for event in self._buffer if event.id > last_event_id]
+            lost = self._gap or (self._lost is not None and last_event_id < self._lost)
+        return [RESYNC, *missed] if lost else missed
+
+    def resync(self, lost, notify=True):
+        """
+        Drop the buffer after events up to id `lost` may have been missed:
+        clients resuming from before it get RESYNC, and so do the connected
+        streams if notify is set.
+        """
+        with self._lock:
+            self._buffer.clear()
+            self._lost = lost
+            self._gap = False
+            subscribers = list(self._subscribers) if notify else []
+        for subscriber in subscribers:
+            subscriber.put(RESYNC)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Deliver events to the streams of every process through LISTEN/NOTIFY.
+    NOTIFY is transactional, so events of rolled back writes never leave.
+    """
+
+    def __init__(self):
+        try:
+            import psycopg  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured("EVENTS_BROKER = 'postgres' requires psycopg 3.")
+        super().__init__()
+        self._listener = None
+        # Nothing is received before the listener is up.
+        self._gap = True
+
+    def publish(self, type, data):
+        # Event ids are the database clock in microseconds, so they are
+        # ordered the same way in every process. A failed NOTIFY only rolls
+        # back its savepoint: the event is lost, not the write.
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                for payload in payloads(data):
+                    cursor.execute(
+                        f"SELECT pg_notify(%s, json_build_object('id', {CLOCK_ID}, "
+                        "'type', %s::text, 'data', %s::json)::text)",
+                        [CHANNEL, type, payload])
+        except DatabaseError:
+            logger.exception("Could not publish a %s event.", type)
+
+    def subscribe(self, subscriber, last_event_id=None):
+        self._ensure_listener()
+        return super().subscribe(subscriber, last_event_id)
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events_listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import psycopg
+
+        params = settings.DATABASES['default']
+        reconnecting = False
+        while True:
+            try:
+                with psycopg.connect(
+                    dbname=params['NAME'], user=params['USER'], password=params['PASSWORD'],
+                    host=params['HOST'] or None, port=params['PORT'] or None, autocommit=True,
+                ) as listener:
+                    listener.execute(f"LISTEN {CHANNEL}")
+                    # Events published before now may have been missed,
+                    # before the process listened or while reconnecting;
+                    # the connected streams only need telling after a
+                    # reconnect.
+                    self.resync(listener.execute(f"SELECT {CLOCK_ID}").fetchone()[0], notify=reconnecting)
+                    for notify in listener.notifies():
+                        payload = json.loads(notify.payload)
+                        self.deliver(Event(payload['id'], payload['type'], payload['data']))
+            except psycopg.Error:
+                with self._lock:
+                    self._gap = True
+                reconnecting = True
+                time.sleep(1)
+
+
+def payloads(data):
+    """
+    Encode event data in payloads of at most MAX_PAYLOAD bytes. The SKUs of
+    a large products.deleted event are split over several events; other
+    events too large to send are sent without their `changes`, marked
+    `truncated`, and subscribers fetch the product instead.
+    """
+    encoded = json.dumps(data, cls=DjangoJSONEncoder)
+    if len(encoded.encode()) <= MAX_PAYLOAD:
+        return [encoded]
+    skus = data.get('skus')
+    if isinstance(skus, list) and len(skus) > 1:
+        half = len(skus) // 2
+        return payloads({**data, 'skus': skus[:half]}) + payloads({**data, 'skus': skus[half:]})
+    data = {key: value for key, value in data.items() if key != 'changes'}
+    return [json.dumps({**data, 'truncated': True}, cls=DjangoJSONEncoder)]
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = BROKERS[settings.EVENTS_BROKER]()
+        return _broker
+
+
+def publish(type, data):
+    """
+    Publish a product event, delivered if and when the current transaction
+    commits.
+    """
+    get_broker().publish(type, data)
+
+
+def _preamble(missed):
+    yield f"retry: {settings.EVENTS_RETRY_MS}\n\n".encode()
+    for event in missed:
+        yield event.encode()
+
+
+async def stream_async(last_event_id=None, broker=None):
+    """
+    Yield the SSE messages of a stream served by a coroutine.
+    """
+    broker = broker or get_broker()
+    subscriber = _AsyncSubscriber()
+    missed = broker.subscribe(subscriber, last_event_id)
+    try:
+        for message in _preamble(missed):
+            yield message
+        while True:
+            try:
+                event = await subscriber.get(settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            if event is None:
+                return
+            yield event.encode()
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+def stream_sync(last_event_id=None, broker=None):
+    """
+    Yield the SSE messages of a stream served by a thread.
+    """
+    broker = broker or get_broker()
+    subscriber = _ThreadSubscriber()
+    missed = broker.subscribe(subscriber, last_event_id)
+    try:
+        yield from _preamble(missed)
+        while True:
+            try:
+                event = subscriber.get(settings.EVENTS_HEARTBEAT)
+            except queue.Empty:
+                yield b": heartbeat\n\n"
+                continue
+            if event is None:
+                return
+            yield event.encode()
+    finally:
+        broker.unsubscribe(subscriber)
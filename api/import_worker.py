@@ -0,0 +1,31 @@
+"""
+Entry points for import worker processes.
+
+Workers are spawned, so they unpickle these functions before Django is set
+up: this module must not import models at import time. They don't query
+the database either: spawned, they would connect to the configured one,
+not necessarily the writer's (e.g. a test database). The exchange rates
+currencies are validated against are passed in by the writer instead.
+"""
+import django
+
+# Exchange rates given by the writer, see setup.
+_exchange_rates = None
+
+
+def setup(exchange_rates):
+    """
+    Set up Django in a freshly spawned worker.
+    """
+    global _exchange_rates
+    django.setup()
+    _exchange_rates = exchange_rates
+
+
+def validate_chunk(chunk):
+    """
+    Validate one chunk of (line_number, row) pairs, see validate_rows.
+    """
+    from .importer import validate_rows
+
+    return validate_rows(chunk, exchange_rates=_exchange_rates)
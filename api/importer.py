@@ -0,0 +1,279 @@
+import csv
+import json
+import multiprocessing
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from . import import_worker
+from .models import CatalogueFacets, ExchangeRate, Product, ProductPriceHistory
+from .serializers import ProductImportSerializer
+
+# Columns written on insert and overwritten when the SKU already exists;
+# importing a soft-deleted SKU brings it back.
+UPSERT_FIELDS = ["code", "name", "brand", "price", "currency", "attributes", "version", "deleted_at"]
+# Columns compared to tell whether an existing product changed.
+CHANGED_FIELDS = [field for field in UPSERT_FIELDS if field != "version"]
+# Columns a row may leave out.
+OPTIONAL_FIELDS = ["code", "currency", "attributes"]
+
+
+def detect_format(path):
+    """
+    Guess the input format from the file extension.
+    """
+    return 'csv' if str(path).lower().endswith('.csv') else 'ndjson'
+
+
+def read_rows(stream, format):
+    """
+    Yield (line_number, row) pairs from a CSV or NDJSON stream without
+    loading it in memory. CSV rows are dicts; NDJSON rows are left as raw
+    strings and decoded during validation.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size items.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def validate_rows(rows, exchange_rates=None):
+    """
+    Validate (line_number, row) pairs with the ProductSerializer rules,
+    against the given exchange rates or the current ones.
+    Returns the valid records, keyed by SKU so a SKU repeated in the chunk
+    keeps its last row, and a list of (line_number, row, errors) rejects.
+    """
+    if exchange_rates is None:
+        exchange_rates = ExchangeRate.rates()
+    validator = ProductImportSerializer(context={"exchange_rates": exchange_rates})
+    records = {}
+    rejects = []
+    for line_number, row in rows:
+        try:
+            data = json.loads(row) if isinstance(row, str) else row
+            if not isinstance(data, dict):
+                raise serializers.ValidationError("Row must be an object.")
+            # CSV has no nulls, an empty cell means "not provided".
+            data = {key: value for key, value in data.items() if value not in ("", None)}
+            record = validator.run_validation(data)
+        except json.JSONDecodeError as e:
+            rejects.append((line_number, row, {"row": [f"Invalid JSON: {e.msg}"]}))
+            continue
+        except serializers.ValidationError as e:
+            rejects.append((line_number, row, e.detail))
+            continue
+
+        record.setdefault("sku", uuid.uuid4())
+        records[record["sku"]] = (line_number, row, record)
+    return list(records.values()), rejects
+
+
+def _upsert(records):
+    """
+    Insert or update the given records with one INSERT ... ON CONFLICT,
+    bumping the version of the products that changed, and append the new
+    and changed prices (or currencies) to the price history. Products
+    already matching their record are left alone, so writing the same
+    records twice (e.g. a chunk replayed after a crash) changes nothing.
+    Optional fields missing from a record keep their current value, or
+    take their default for new products.
+    Returns the number of products that already existed.
+    """
+    skus = [record["sku"] for record in records]
+    existing = {
+        row["sku"]: row
+        for row in Product.all_objects.filter(sku__in=skus).values("sku", "version", *CHANGED_FIELDS)
+    }
+    products = []
+    for record in records:
+        current = existing.get(record["sku"])
+        if current is None:
+            defaults = {"code": None, "currency": settings.BASE_CURRENCY, "attributes": {}}
+        else:
+            defaults = {field: current[field] for field in OPTIONAL_FIELDS}
+        product = Product(**{**defaults, **record})
+        if current is not None and all(current[field] == getattr(product, field) for field in CHANGED_FIELDS):
+            continue
+        product.version = (current["version"] if current else 0) + 1
+        products.append(product)
+    if products:
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=UPSERT_FIELDS,
+        )
+    ProductPriceHistory.record(
+        [product for product in products
+         if product.sku not in existing
+         or (existing[product.sku]["price"], existing[product.sku]["currency"]) != (product.price, product.currency)],
+        ProductPriceHistory.Source.IMPORT,
+    )
+    return len(existing)
+
+
+def write_records(records):
+    """
+    Upsert validated (line_number, row, record) entries in one transaction.
+    If the batch violates a constraint (e.g. a duplicate code), the rows are
+    retried one by one so only the offending rows are rejected.
+    Returns (created, updated, rejects).
+    """
+    try:
+        with transaction.atomic():
+            updated = _upsert([record for _, _, record in records])
+            # Facets are refreshed as each chunk commits, not only at the
+            # end of the import.
+            CatalogueFacets.invalidate_on_commit()
+        return len(records) - updated, updated, []
+    except IntegrityError:
+        pass
+
+    created = updated = 0
+    rejects = []
+    with transaction.atomic():
+        CatalogueFacets.invalidate_on_commit()
+        for line_number, row, record in records:
+            try:
+                with transaction.atomic():
+                    row_updated = _upsert([record])
+            except IntegrityError as e:
+                rejects.append((line_number, row, {"row": [str(e).strip()]}))
+                continue
+            updated += row_updated
+            created += 1 - row_updated
+    return created, updated, rejects
+
+
+def format_reject(line_number, row, errors):
+    """
+    Serialize a rejected row as one NDJSON line for the rejects file.
+    """
+    return json.dumps({"line": line_number, "row": row, "errors": errors}, default=str) + "\n"
+
+
+class Checkpoint:
+    """
+    Progress of an import, persisted after every committed chunk so an
+    interrupted import can resume from the next one.
+    """
+
+    def __init__(self, path, source, chunk_size):
+        self.path = path
+        self.state = {
+            "source": os.path.abspath(source),
+            "chunk_size": chunk_size,
+            "chunks": 0,
+            "processed": 0,
+            "created": 0,
+            "updated": 0,
+            "rejected": 0,
+            # Bytes of the rejects file belonging to the committed chunks.
+            "rejects_size": 0,
+        }
+
+    def load(self):
+        """
+        Restore the saved progress. Raises ValueError if the checkpoint was
+        written for another file or chunk size.
+        """
+        with open(self.path, encoding='utf-8') as f:
+            state = json.load(f)
+        for key in ("source", "chunk_size"):
+            if state.get(key) != self.state[key]:
+                raise ValueError(f"Checkpoint {self.path} was written for a different {key}.")
+        self.state = state
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_import(source, format, rejects_file, checkpoint, workers=1, max_pending=None, progress=None):
+    """
+    Import rows from an open source stream.
+
+    Parsing and validation of chunks is fanned out over a pool of worker
+    processes while this process is the single writer, committing chunks in
+    file order. At most max_pending chunks are in flight, so a slow database
+    applies back-pressure to the readers. After each commit the rejects are
+    written and the checkpoint saved; chunks already recorded in the
+    checkpoint are skipped, so re-running after a crash resumes where the
+    last commit left off. A chunk committed but not checkpointed yet when
+    the crash happened is replayed: the rejects written for it are dropped
+    first, and its products, already up to date, are not written again.
+    Returns the checkpoint state.
+    """
+    state = checkpoint.state
+    if "rejects_size" in state:
+        rejects_file.truncate(state["rejects_size"])
+    chunks = chunked(read_rows(source, format), state["chunk_size"])
+    chunks = islice(chunks, state["chunks"], None)
+    exchange_rates = ExchangeRate.rates()
+
+    def commit(chunk, records, rejects):
+        created, updated, write_rejects = write_records(records) if records else (0, 0, [])
+        for reject in rejects + write_rejects:
+            rejects_file.write(format_reject(*reject))
+        rejects_file.flush()
+
+        state["rejects_size"] = rejects_file.tell()
+        state["chunks"] += 1
+        state["processed"] += len(chunk)
+        state["created"] += created
+        state["updated"] += updated
+        state["rejected"] += len(rejects) + len(write_rejects)
+        checkpoint.save()
+        if progress:
+            progress(state)
+
+    if workers <= 1:
+        for chunk in chunks:
+            commit(chunk, *validate_rows(chunk, exchange_rates))
+        return state
+
+    # Spawned rather than forked, so workers never inherit the writer's open
+    # database connection or transaction; they get the exchange rates instead
+    # of querying them.
+    context = multiprocessing.get_context('spawn')
+    max_pending = max_pending or workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=import_worker.setup, initargs=(exchange_rates,)) as pool:
+        for chunk in chunks:
+            if len(pending) >= max_pending:
+                done_chunk, future = pending.popleft()
+                commit(done_chunk, *future.result())
+            pending.append((chunk, pool.submit(import_worker.validate_chunk, chunk)))
+
+        while pending:
+            done_chunk, future = pending.popleft()
+            commit(done_chunk, *future.result())
+    return state
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark suite and print its measurements."
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument(
+            '--iterations', type=int, default=None,
+            help="Number of times each measured operation is repeated (default: per suite).")
+        parser.add_argument(
+            '--rows', type=int, default=None,
+            help="Rows loaded by suites that measure the database (default: per suite).")
+        parser.add_argument(
+            '--partitions', type=int, default=None,
+            help="Hash partitions compared against a plain table (default: per suite).")
+
+    def handle(self, *args, **options):
+        suite = options.pop('suite')
+        options = {name: value for name, value in options.items() if value is not None}
+        for label, value in SUITES[suite](**options):
+            self.stdout.write(f"{label}: {value}")
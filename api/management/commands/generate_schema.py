@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema import generate_schema, schema_is_current
+
+
+class Command(BaseCommand):
+    help = "Write the OpenAPI schema to disk so it is served without introspecting views per request."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir', default=None,
+            help="Directory to write the schema to (default: OPENAPI_SCHEMA_DIR).")
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Regenerate even if the schema on disk matches the current code.")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only check whether the schema on disk is up to date.")
+
+    def handle(self, *args, **options):
+        schema_dir = options['output_dir'] or settings.OPENAPI_SCHEMA_DIR
+        current = schema_is_current(schema_dir)
+
+        if options['check']:
+            if not current:
+                raise CommandError(f"OpenAPI schema in {schema_dir} is out of date.")
+            self.stdout.write(f"OpenAPI schema in {schema_dir} is up to date.")
+            return
+
+        if current and not options['force']:
+            self.stdout.write(f"OpenAPI schema in {schema_dir} is up to date, nothing to do.")
+            return
+
+        generate_schema(schema_dir)
+        self.stdout.write(self.style.SUCCESS(f"OpenAPI schema written to {schema_dir}."))
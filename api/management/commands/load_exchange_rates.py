@@ -0,0 +1,36 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import ExchangeRate
+from api.serializers import ExchangeRatesSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load exchange rates, as units of each currency worth one BASE_CURRENCY, from a JSON object "
+        "({\"EUR\": \"0.92\"}) or a CSV file with currency and rate columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSON or CSV (with a header row) file of rates.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, newline='', encoding='utf-8') as source:
+                if path.endswith('.csv'):
+                    rates = {row['currency']: row['rate'] for row in csv.DictReader(source)}
+                else:
+                    rates = json.load(source)
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        serializer = ExchangeRatesSerializer(data={"rates": rates})
+        if not serializer.is_valid():
+            raise CommandError(f"Invalid rates: {serializer.errors['rates']}")
+        ExchangeRate.load(serializer.validated_data['rates'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {len(serializer.validated_data['rates'])} exchange rates against {settings.BASE_CURRENCY}."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.partitioning import partition_count, repartition_product_table
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product table hash partitioned by SKU, or as a plain table with 0 partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'partitions', type=int, nargs='?',
+            help="Number of hash partitions, 0 for a plain table (default: only show the current layout).")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning requires PostgreSQL.")
+
+        partitions = options['partitions']
+        if partitions is not None:
+            if partitions < 0:
+                raise CommandError("partitions must be 0 or positive.")
+            repartition_product_table(connection, partitions)
+
+        current = partition_count(connection)
+        self.stdout.write(f"Product table: {f'{current} hash partitions' if current else 'not partitioned'}.")
@@ -0,0 +1,88 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Boot a worker the way the WSGI server does, including the lazy URLconf
+# import that otherwise happens on the first request.
+STARTUP_SCRIPT = (
+    "import server.wsgi\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_import_times(output):
+    """
+    Parse `python -X importtime` output into (module, self_us, cumulative_us,
+    depth) tuples.
+    """
+    modules = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Profile import time and cold start of a WSGI worker for one or more settings modules."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'settings_modules', nargs='*',
+            help="Settings modules to profile (default: the current DJANGO_SETTINGS_MODULE).")
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help="Number of modules and packages to list.")
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Number of cold starts to time per settings module.")
+
+    def _run(self, settings_module, *python_args):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings_module}
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *python_args, "-c", STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode:
+            raise CommandError(f"Worker startup with {settings_module} failed:\n{result.stderr}")
+        return elapsed, result.stderr
+
+    def handle(self, *args, **options):
+        settings_modules = options['settings_modules'] or [os.environ["DJANGO_SETTINGS_MODULE"]]
+        top = options['top']
+
+        for settings_module in settings_modules:
+            _, output = self._run(settings_module, "-X", "importtime")
+            modules = parse_import_times(output)
+
+            packages = {}
+            for module, self_us, _, _ in modules:
+                package = module.split('.', 1)[0]
+                packages[package] = packages.get(package, 0) + self_us
+
+            timings = [self._run(settings_module)[0] for _ in range(options['repeat'])]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{settings_module}"))
+            self.stdout.write(
+                f"  cold start: median {statistics.median(timings) * 1000:.0f} ms, "
+                f"min {min(timings) * 1000:.0f} ms over {len(timings)} runs")
+            self.stdout.write(f"  total import time: {sum(packages.values()) / 1000:.0f} ms")
+
+            self.stdout.write("  packages by import time (self):")
+            for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+                self.stdout.write(f"    {self_us / 1000:8.1f} ms  {package}")
+
+            self.stdout.write("  modules by cumulative import time:")
+            for module, _, cumulative_us, depth in sorted(modules, key=lambda item: -item[2])[:top]:
+                self.stdout.write(f"    {cumulative_us / 1000:8.1f} ms  {'  ' * depth}{module}")
@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Hard delete soft-deleted products in small batches, each in a short transaction, "
+        "so the purge never holds many locks at once. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=None,
+            help="Only purge products deleted this many days ago (default: PRODUCT_PURGE_AFTER_DAYS).")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Products deleted per transaction.")
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help="Seconds to sleep between batches, letting vacuum and replicas keep up.")
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Stop after purging this many products (default: all candidates).")
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days is None:
+            days = settings.PRODUCT_PURGE_AFTER_DAYS
+        if days < 0:
+            raise CommandError("--older-than-days must be 0 or positive.")
+        for option in ('batch_size', 'limit'):
+            if options[option] is not None and options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be positive.")
+
+        deleted_before = timezone.now() - timedelta(days=days)
+        limit = options['limit']
+        purged = 0
+        while limit is None or purged < limit:
+            batch_size = options['batch_size'] if limit is None else min(options['batch_size'], limit - purged)
+            deleted = Product.purge_batch(deleted_before, batch_size)
+            purged += deleted
+            if deleted < batch_size:
+                break
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} products deleted before {deleted_before:%Y-%m-%d %H:%M}."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ProductCount
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached catalogue counts used by the 'cached' count strategy."
+
+    def handle(self, *args, **options):
+        ProductCount.refresh()
+        total = ProductCount.objects.get(brand='').count
+        brands = ProductCount.objects.exclude(brand='').count()
+        self.stdout.write(self.style.SUCCESS(f"Counted {total} products in {brands} brands."))
@@ -0,0 +1,84 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.querylog import queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Send requests to API paths in this process and report their queries by fingerprint, "
+        "then the slow ones with their plans. Running workers report theirs at /api/v1/metrics/queries/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Paths to request, e.g. '/api/v1/catalogue/?page=100'.")
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST', 'PUT', 'DELETE'])
+        parser.add_argument('--data', default=None, help="JSON request body.")
+        parser.add_argument('--user', default=None, help="Authenticate the requests as this user.")
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help="Allow --method POST, PUT and DELETE, which change the configured database.")
+        parser.add_argument(
+            '--requests', type=int, default=None,
+            help="Requests sent to each path (default: 10, and 1 for writes).")
+        parser.add_argument(
+            '--threshold-ms', type=float, default=None,
+            help="Report queries at least this slow (default: SLOW_QUERY_THRESHOLD_MS).")
+        parser.add_argument(
+            '--explain-rate', type=float, default=1.0,
+            help="Share of the slow SELECTs run again under EXPLAIN ANALYZE.")
+        parser.add_argument('--limit', type=int, default=10, help="Fingerprints to report.")
+        parser.add_argument('--order', choices=['total', 'count', 'max'], default='total')
+
+    def handle(self, *args, **options):
+        writes = options['method'] != 'GET'
+        if writes and not options['allow_writes']:
+            raise CommandError(
+                f"--method {options['method']} changes the configured database, pass --allow-writes to send it.")
+        requests = options['requests']
+        if requests is None:
+            requests = 1 if writes else 10
+        if requests < 1:
+            raise CommandError("--requests must be positive.")
+        # A second POST creates another product, a second DELETE gets a 404.
+        if writes and requests > 1:
+            raise CommandError(f"--method {options['method']} is sent once per path, --requests must be 1.")
+        headers = {}
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}.")
+            headers['Authorization'] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        try:
+            data = json.loads(options['data']) if options['data'] else None
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Invalid --data: {e}")
+
+        overrides = {'SLOW_QUERY_LOG': True, 'SLOW_QUERY_EXPLAIN_RATE': options['explain_rate']}
+        if options['threshold_ms'] is not None:
+            overrides['SLOW_QUERY_THRESHOLD_MS'] = options['threshold_ms']
+        client = Client(headers=headers)
+        queries.clear()
+        with override_settings(**overrides):
+            for path in options['paths']:
+                for _ in range(requests):
+                    response = client.generic(
+                        options['method'], path, json.dumps(data) if data is not None else '',
+                        content_type='application/json')
+                    if response.status_code >= 400:
+                        raise CommandError(f"{options['method']} {path} answered {response.status_code}.")
+
+        self.stdout.write(f"{'count':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}  fingerprint")
+        for row in queries.fingerprints(options['order'], options['limit']):
+            self.stdout.write(
+                f"{row['count']:>7} {row['total_ms']:>10} {row['mean_ms']:>9} {row['max_ms']:>9}  {row['fingerprint']}")
+        for entry in queries.slow():
+            self.stdout.write(self.style.WARNING(f"\n{entry['duration_ms']} ms in {entry['view']}: {entry['sql']}"))
+            if entry['plan']:
+                self.stdout.write(entry['plan'])
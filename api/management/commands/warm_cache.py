@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.warming import warm
+
+
+class Command(BaseCommand):
+    help = (
+        "Warm the database buffers for the first catalogue pages and the most viewed products, "
+        "and the catalogue counts and facets, e.g. after a deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=None,
+            help="Catalogue pages to read (default: WARM_CACHE_PAGES).")
+        parser.add_argument(
+            '--page-size', type=int, default=None,
+            help="Products per catalogue page (default: the API's page size).")
+        parser.add_argument(
+            '--top', type=int, default=None,
+            help="Most viewed products to read (default: WARM_CACHE_TOP_PRODUCTS).")
+        parser.add_argument(
+            '--budget', type=float, default=None,
+            help="Seconds allowed; queries still running then are cancelled (default: WARM_CACHE_BUDGET).")
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Warming tasks run concurrently.")
+
+    def handle(self, *args, **options):
+        for option in ('pages', 'page_size', 'top', 'budget', 'workers'):
+            if options[option] is not None and options[option] <= 0:
+                raise CommandError(f"--{option.replace('_', '-')} must be positive.")
+
+        results = warm(
+            pages=options['pages'], page_size=options['page_size'], top=options['top'],
+            budget=options['budget'], workers=options['workers'])
+        for task, outcome, seconds in results:
+            style = self.style.WARNING if outcome == "timed out" or outcome.startswith("failed") else self.style.SUCCESS
+            self.stdout.write(style(f"{task}: {outcome} ({seconds}s)"))
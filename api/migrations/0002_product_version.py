@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-19 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
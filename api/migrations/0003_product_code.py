@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-19 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_product_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="code",
+            field=models.SlugField(
+                blank=True,
+                help_text="Optional human-readable secondary SKU.",
+                max_length=64,
+                null=True,
+                unique=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-19 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Formerly 0004_product_brand_partitioning, which also partitioned the
+    # table when PRODUCT_PARTITIONS was set; partition with
+    # `manage.py partition_products` instead.
+    replaces = [
+        ("api", "0004_product_brand_partitioning"),
+    ]
+
+    dependencies = [
+        ("api", "0003_product_code"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["brand", "sku"], name="product_brand_sku_idx"),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-19 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_product_brand_sku_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCount",
+            fields=[
+                (
+                    "brand",
+                    models.CharField(
+                        blank=True, max_length=255, primary_key=True, serialize=False
+                    ),
+                ),
+                ("count", models.BigIntegerField()),
+                ("refreshed_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-19 06:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_product_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductPriceHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sku", models.UUIDField()),
+                ("price", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "effective_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "source",
+                    models.PositiveSmallIntegerField(
+                        choices=[(1, "Create"), (2, "Update"), (3, "Import")]
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["sku", "effective_at"],
+                        name="price_history_sku_time_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-19 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_product_price_history"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="product_brand_sku_idx",
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["brand", "sku"],
+                name="product_brand_sku_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", False)),
+                fields=["deleted_at"],
+                name="product_deleted_at_idx",
+            ),
+        ),
+    ]
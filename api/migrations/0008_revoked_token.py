@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-19 06:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_product_soft_delete"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jti", models.CharField(blank=True, max_length=255)),
+                ("user_id", models.IntegerField()),
+                ("revoked_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("expires_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["jti"], name="revoked_token_jti_idx"),
+                    models.Index(fields=["user_id"], name="revoked_token_user_idx"),
+                    models.Index(
+                        fields=["expires_at"], name="revoked_token_expiry_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
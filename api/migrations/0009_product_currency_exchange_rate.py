@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:01
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_revoked_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                (
+                    "currency",
+                    models.CharField(max_length=3, primary_key=True, serialize=False),
+                ),
+                ("rate", models.DecimalField(decimal_places=8, max_digits=20)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="currency",
+            field=models.CharField(
+                default=api.models.default_currency,
+                help_text="ISO 4217 code of the price's currency.",
+                max_length=3,
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:06
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_product_currency_exchange_rate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="attributes",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text='Free-form text attributes, e.g. {"color": "red"}.',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["attributes"],
+                name="product_attributes_idx",
+                opclasses=["jsonb_path_ops"],
+            ),
+        ),
+    ]
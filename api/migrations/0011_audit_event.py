@@ -0,0 +1,67 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:18
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_product_attributes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("at", models.DateTimeField()),
+                ("actor_id", models.IntegerField(null=True)),
+                ("actor", models.CharField(blank=True, max_length=150)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("product.create", "Product Create"),
+                            ("product.update", "Product Update"),
+                            ("product.delete", "Product Delete"),
+                            ("admin.create", "Admin Create"),
+                            ("admin.update", "Admin Update"),
+                            ("admin.delete", "Admin Delete"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("sku", models.UUIDField(null=True)),
+                ("target_user_id", models.IntegerField(null=True)),
+                (
+                    "changes",
+                    models.JSONField(
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["at"], name="audit_event_at_idx"),
+                    models.Index(
+                        fields=["actor_id", "at"], name="audit_event_actor_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("sku__isnull", False)),
+                        fields=["sku", "at"],
+                        name="audit_event_sku_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
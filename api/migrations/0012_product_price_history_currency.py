@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:45
+
+import api.models
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+
+
+def backfill_currency(apps, schema_editor):
+    """
+    Give existing entries the current currency of their product: the
+    history did not record it, and most products never changed it.
+    """
+    Product = apps.get_model("api", "Product")
+    ProductPriceHistory = apps.get_model("api", "ProductPriceHistory")
+    product = Product._base_manager.filter(sku=OuterRef("sku"))
+    ProductPriceHistory.objects.filter(Exists(product.exclude(currency=OuterRef("currency")))).update(
+        currency=Subquery(product.values("currency")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_audit_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productpricehistory",
+            name="currency",
+            field=models.CharField(default=api.models.default_currency, max_length=3),
+        ),
+        migrations.RunPython(backfill_currency, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-19 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_product_price_history_currency"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="auditevent",
+            name="audit_event_at_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="auditevent",
+            name="audit_event_actor_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="auditevent",
+            name="audit_event_sku_idx",
+        ),
+        migrations.AddIndex(
+            model_name="auditevent",
+            index=models.Index(fields=["at", "id"], name="audit_event_at_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="auditevent",
+            index=models.Index(
+                fields=["actor_id", "at", "id"], name="audit_event_actor_at_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="auditevent",
+            index=models.Index(
+                condition=models.Q(("sku__isnull", False)),
+                fields=["sku", "at", "id"],
+                name="audit_event_sku_at_id_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-19 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_audit_event_id_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="productpricehistory",
+            name="price_history_sku_time_idx",
+        ),
+        migrations.AddIndex(
+            model_name="productpricehistory",
+            index=models.Index(
+                fields=["sku", "effective_at", "id"],
+                name="price_history_sku_time_id_idx",
+            ),
+        ),
+    ]
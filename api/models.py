@@ -1,19 +1,92 @@
-from django.db import models
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, DecimalField, F, Func, IntegerField, Max, Min, Q, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+from django.utils.functional import cached_property
 import uuid
-from rest_framework.pagination import PageNumberPagination
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP, Decimal
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from . import events
+
+logger = logging.getLogger('api.exchange_rates')
+
+
+class LiveProductManager(models.Manager):
+    """
+    Manager that leaves out soft-deleted products.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+def default_currency():
+    return settings.BASE_CURRENCY
 
 
 class Product(models.Model):
     """
     Model for Product.
+
+    Deleting a product only marks it deleted: `objects` hides it right away
+    and `purge_products` removes it later in small batches. `all_objects`
+    sees every row.
     """
+    # Query parameters filtering the catalogue by attribute, e.g. ?attr.color=red
+    ATTRIBUTE_FILTER_PREFIX = 'attr.'
+
     sku = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, unique=True)
+    # Once the table is hash partitioned (partition_products), PostgreSQL
+    # can't enforce this unique constraint: a trigger keeps every code in
+    # the api_product_code side table instead, whose primary key still makes
+    # a duplicate raise IntegrityError. Migration state is unaware of it.
+    code = models.SlugField(
+        max_length=64, unique=True, null=True, blank=True,
+        help_text="Optional human-readable secondary SKU.")
     name = models.CharField(max_length=255, null=False, blank=False)
     brand = models.CharField(max_length=255, null=False, blank=False)
     price = models.DecimalField(
         max_digits=10, decimal_places=2, null=False, blank=False)
+    currency = models.CharField(
+        max_length=3, default=default_currency, help_text="ISO 4217 code of the price's currency.")
     views = models.IntegerField(default=0)
+    version = models.PositiveIntegerField(default=1)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    attributes = models.JSONField(
+        default=dict, blank=True, help_text="Free-form text attributes, e.g. {\"color\": \"red\"}.")
+
+    objects = LiveProductManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Brand-filtered catalogue pages, ordered by SKU.
+            models.Index(
+                fields=["brand", "sku"], name="product_brand_sku_idx", condition=Q(deleted_at__isnull=True)),
+            # Purge candidates, kept small by indexing deleted rows only.
+            models.Index(
+                fields=["deleted_at"], name="product_deleted_at_idx", condition=Q(deleted_at__isnull=False)),
+            # Attribute filters (attributes @> {...}); jsonb_path_ops only
+            # serves containment, with a smaller index than the default.
+            GinIndex(
+                fields=["attributes"], name="product_attributes_idx", opclasses=["jsonb_path_ops"],
+                condition=Q(deleted_at__isnull=True)),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -26,16 +99,632 @@ class Product(models.Model):
         if self.sku is None:
             self.sku = uuid.uuid4()
 
+        adding = self._state.adding
         super(Product, self).save(*args, **kwargs)
+        if adding:
+            ProductCount.adjust(self.brand, 1)
+            CatalogueFacets.invalidate_on_commit()
+            ProductPriceHistory.record([self], ProductPriceHistory.Source.CREATE)
+            events.publish('product.created', {
+                "sku": self.sku, "name": self.name, "brand": self.brand,
+                "price": self.price, "currency": self.currency})
+
+    def delete(self, *args, **kwargs):
+        """
+        Soft delete the product, see soft_delete.
+        """
+        deleted = Product.soft_delete([self.sku])
+        if deleted:
+            self.deleted_at = timezone.now()
+            self.code = None
+        return len(deleted), {self._meta.label: len(deleted)}
+
+    @staticmethod
+    def soft_delete(skus):
+        """
+        Mark the live products with the given SKUs deleted with one UPDATE,
+        releasing their codes for reuse, and keep the cached counts in step.
+        Returns the SKUs that were deleted.
+        """
+        with transaction.atomic():
+            rows = list(Product.objects.filter(sku__in=skus).select_for_update().values_list('sku', 'brand'))
+            deleted = [sku for sku, _ in rows]
+            Product.all_objects.filter(sku__in=deleted).update(
+                deleted_at=timezone.now(), code=None, version=F('version') + 1)
+            for brand, count in Counter(brand for _, brand in rows).items():
+                ProductCount.adjust(brand, -count, include_total=False)
+            if deleted:
+                ProductCount.adjust('', -len(deleted), include_total=False)
+                CatalogueFacets.invalidate_on_commit()
+                events.publish('products.deleted', {"skus": deleted})
+        return deleted
+
+    @staticmethod
+    def purge_batch(deleted_before, batch_size):
+        """
+        Hard delete up to batch_size products soft-deleted before the given
+        time, in a short transaction of its own. Rows locked by another purge
+        are skipped. Returns the number of deleted rows.
+        """
+        with transaction.atomic():
+            skus = list(
+                Product.all_objects.filter(deleted_at__lt=deleted_before)
+                .order_by('deleted_at')
+                .select_for_update(skip_locked=True)
+                .values_list('sku', flat=True)[:batch_size]
+            )
+            if not skus:
+                return 0
+            deleted, _ = Product.all_objects.filter(sku__in=skus).delete()
+        return deleted
+
+    def apply_changes(self, changes, expected_version=None):
+        """
+        Write only the changed columns with a single UPDATE statement.
+
+        When expected_version is given the UPDATE is conditional on the stored
+        version, so a concurrent write makes this return False instead of being
+        silently overwritten. The version is bumped on every successful write.
+        Like save(), negative views are stored as 0.
+        """
+        if changes.get('views', 0) < 0:
+            changes = {**changes, 'views': 0}
+        queryset = Product.objects.filter(sku=self.sku)
+        if expected_version is not None:
+            queryset = queryset.filter(version=expected_version)
+
+        with transaction.atomic():
+            if not queryset.update(version=F('version') + 1, **changes):
+                return False
+            price, currency = changes.get('price', self.price), changes.get('currency', self.currency)
+            if (price, currency) != (self.price, self.currency):
+                ProductPriceHistory.record(
+                    [Product(sku=self.sku, price=price, currency=currency)], ProductPriceHistory.Source.UPDATE)
+            if changes.get('brand', self.brand) != self.brand:
+                ProductCount.adjust(self.brand, -1, include_total=False)
+                ProductCount.adjust(changes['brand'], 1, include_total=False)
+            if (price, currency, changes.get('brand', self.brand)) != (self.price, self.currency, self.brand):
+                CatalogueFacets.invalidate_on_commit()
+            events.publish('product.updated', {"sku": self.sku, "changes": changes})
+
+        for field, value in changes.items():
+            setattr(self, field, value)
+
+        if expected_version is not None:
+            self.version = expected_version + 1
+        else:
+            self.refresh_from_db(fields=['version'])
+        return True
+
+    @staticmethod
+    def increment_views(sku, amount=1):
+        """
+        Atomically increment the views counter without touching other columns.
+        The version is left untouched since views are not an admin edit.
+        """
+        return Product.objects.filter(sku=sku).update(views=F('views') + amount)
+
+    @staticmethod
+    def increment_views_many(skus):
+        """
+        Increment the views counter of several products with one UPDATE.
+        """
+        return Product.objects.filter(sku__in=skus).update(views=F('views') + 1)
 
     def __str__(self):
         return self.name
 
 
+class ProductPriceHistory(models.Model):
+    """
+    Append-only log of product prices: one row each time a product gets a
+    new price or currency. Rows are keyed by SKU without a foreign key so the history of
+    deleted products is kept for audits.
+    """
+
+    class Source(models.IntegerChoices):
+        CREATE = 1
+        UPDATE = 2
+        IMPORT = 3
+
+    sku = models.UUIDField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default=default_currency)
+    effective_at = models.DateTimeField(default=timezone.now)
+    source = models.PositiveSmallIntegerField(choices=Source.choices)
+
+    class Meta:
+        indexes = [
+            # Prices recorded at the same time are ordered by id.
+            models.Index(fields=["sku", "effective_at", "id"], name="price_history_sku_time_id_idx"),
+        ]
+
+    @staticmethod
+    def record(products, source):
+        """
+        Append the current price of the given products with one INSERT.
+        """
+        now = timezone.now()
+        ProductPriceHistory.objects.bulk_create([
+            ProductPriceHistory(
+                sku=product.sku, price=product.price, currency=product.currency, effective_at=now, source=source)
+            for product in products
+        ])
+
+    @staticmethod
+    def prices_at(skus, at):
+        """
+        Return {sku: (price, currency, effective_at)} with the price each SKU had at
+        the given time, None for SKUs without a price then. A single query
+        reading at most one index entry per SKU.
+        """
+        table = ProductPriceHistory._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT s.sku, h.price, h.currency, h.effective_at
+                FROM unnest(%s::uuid[]) AS s (sku)
+                LEFT JOIN LATERAL (
+                    SELECT price, currency, effective_at FROM {table}
+                    WHERE sku = s.sku AND effective_at <= %s
+                    ORDER BY effective_at DESC, id DESC
+                    LIMIT 1
+                ) h ON true
+            """, [list(skus), at])
+            return {sku: (price, currency, effective_at) if price is not None else None
+                    for sku, price, currency, effective_at in cursor.fetchall()}
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked refresh token, or with a blank jti every refresh token of the
+    user issued before revoked_at. Rows are useless once expires_at passes,
+    when every token they could match has expired too.
+    """
+    jti = models.CharField(max_length=255, blank=True)
+    user_id = models.IntegerField()
+    revoked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["jti"], name="revoked_token_jti_idx"),
+            models.Index(fields=["user_id"], name="revoked_token_user_idx"),
+            models.Index(fields=["expires_at"], name="revoked_token_expiry_idx"),
+        ]
+
+
+class AuditEvent(models.Model):
+    """
+    An admin action, written in batches by api.audit. The actor is kept by
+    id and username so events outlive deleted users.
+    """
+    class Action(models.TextChoices):
+        PRODUCT_CREATE = 'product.create'
+        PRODUCT_UPDATE = 'product.update'
+        PRODUCT_DELETE = 'product.delete'
+        ADMIN_CREATE = 'admin.create'
+        ADMIN_UPDATE = 'admin.update'
+        ADMIN_DELETE = 'admin.delete'
+
+    at = models.DateTimeField()
+    actor_id = models.IntegerField(null=True)
+    actor = models.CharField(max_length=150, blank=True)
+    action = models.CharField(max_length=32, choices=Action.choices)
+    sku = models.UUIDField(null=True)
+    target_user_id = models.IntegerField(null=True)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            # id breaks ties between events written in the same batch.
+            models.Index(fields=["at", "id"], name="audit_event_at_id_idx"),
+            models.Index(fields=["actor_id", "at", "id"], name="audit_event_actor_at_id_idx"),
+            models.Index(
+                fields=["sku", "at", "id"], name="audit_event_sku_at_id_idx", condition=Q(sku__isnull=False)),
+        ]
+
+
+class ExchangeRate(models.Model):
+    """
+    Units of a currency worth one BASE_CURRENCY. Read through rates(), which
+    caches the whole table, so converting prices costs no query.
+    """
+    CACHE_KEY = 'exchange_rates'
+    # ISO 4217 currencies without minor units; the others have two.
+    ZERO_DECIMAL_CURRENCIES = {'CLP', 'ISK', 'JPY', 'KRW', 'PYG', 'UGX', 'VND'}
+
+    currency = models.CharField(max_length=3, primary_key=True)
+    rate = models.DecimalField(max_digits=20, decimal_places=8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def rates():
+        """
+        Return every known currency with its rate, BASE_CURRENCY included.
+        """
+        rates = cache.get(ExchangeRate.CACHE_KEY)
+        if rates is None:
+            rates = dict(ExchangeRate.objects.values_list('currency', 'rate'))
+            rates[settings.BASE_CURRENCY] = Decimal(1)
+            cache.set(ExchangeRate.CACHE_KEY, rates, settings.EXCHANGE_RATES_CACHE_TTL)
+        return rates
+
+    @staticmethod
+    def load(rates):
+        """
+        Insert or update the given {currency: rate} with one statement.
+        Currencies left out keep their rate.
+        """
+        now = timezone.now()
+        ExchangeRate.objects.bulk_create(
+            [ExchangeRate(currency=currency, rate=rate, updated_at=now) for currency, rate in rates.items()],
+            update_conflicts=True,
+            unique_fields=['currency'],
+            update_fields=['rate', 'updated_at'],
+        )
+        transaction.on_commit(lambda: cache.delete(ExchangeRate.CACHE_KEY))
+        # Facet prices are in BASE_CURRENCY.
+        CatalogueFacets.invalidate_on_commit()
+
+    @staticmethod
+    def in_base_currency(field='price'):
+        """
+        Expression of a product price converted to BASE_CURRENCY in the
+        database, NULL for currencies without a rate.
+        """
+        return Case(
+            *[When(currency=currency, then=F(field) if currency == settings.BASE_CURRENCY else F(field) / Value(rate))
+              for currency, rate in ExchangeRate.rates().items()],
+            default=None, output_field=DecimalField())
+
+    @staticmethod
+    def convert(products, currency):
+        """
+        Convert the prices of serialized products to the given currency in
+        place, rounding half up to its minor unit once from the exact rate.
+        Products without a price (see ?fields=) are left alone, and so are
+        products priced in a currency without a rate (e.g. removed, or after
+        BASE_CURRENCY changed): they keep their own price and currency, and
+        the missing rate is logged.
+        """
+        rates = ExchangeRate.rates()
+        exponent = Decimal(1) if currency in ExchangeRate.ZERO_DECIMAL_CURRENCIES else Decimal('0.01')
+        factors = {}
+        for product in products:
+            if product is None or 'price' not in product:
+                continue
+            source = product['currency']
+            if source not in factors:
+                factors[source] = rates[currency] / rates[source] if source in rates else None
+                if factors[source] is None:
+                    logger.error("No exchange rate for %s, prices in it are not converted to %s.", source, currency)
+            if factors[source] is None:
+                continue
+            price = Decimal(product['price']) * factors[source]
+            product['price'] = str(price.quantize(exponent, rounding=ROUND_HALF_UP))
+            product['currency'] = currency
+        return products
+
+
+class ProductCount(models.Model):
+    """
+    Cached number of products, in the whole catalogue (blank brand) or of
+    one brand. Adjusted when products are created, deleted or change brand
+    through the model, and recomputed once older than PRODUCT_COUNT_TTL to
+    absorb bulk writes that bypass it.
+    """
+    brand = models.CharField(max_length=255, primary_key=True, blank=True)
+    count = models.BigIntegerField()
+    refreshed_at = models.DateTimeField()
+
+    @staticmethod
+    def adjust(brand, delta, include_total=True):
+        """
+        Add delta to the cached counts that exist; missing ones are computed
+        on their next read.
+        """
+        brands = [brand, ''] if include_total else [brand]
+        ProductCount.objects.filter(brand__in=brands).update(count=F('count') + delta)
+
+    @staticmethod
+    def store(counts):
+        """
+        Save {brand: count} pairs as freshly computed.
+        """
+        now = timezone.now()
+        ProductCount.objects.bulk_create(
+            [ProductCount(brand=brand, count=count, refreshed_at=now) for brand, count in counts.items()],
+            update_conflicts=True,
+            unique_fields=['brand'],
+            update_fields=['count', 'refreshed_at'],
+        )
+
+    @staticmethod
+    def refresh():
+        """
+        Recompute every count with a single scan of the product table.
+        """
+        counts = dict(Product.objects.order_by().values_list('brand').annotate(Count('sku')))
+        ProductCount.objects.exclude(brand__in=['', *counts]).delete()
+        ProductCount.store({'': sum(counts.values()), **counts})
+
+
+def count_exact(queryset, brand=''):
+    """
+    Count with SELECT COUNT(*).
+    """
+    return queryset.count()
+
+
+def count_cached(queryset, brand=''):
+    """
+    Read the count from ProductCount, counting exactly when it is missing
+    or older than PRODUCT_COUNT_TTL seconds. A None brand means the query
+    has filters no cached count covers, and is counted exactly.
+    """
+    if brand is None:
+        return queryset.count()
+    fresh_after = timezone.now() - timedelta(seconds=settings.PRODUCT_COUNT_TTL)
+    counter = ProductCount.objects.filter(brand=brand, refreshed_at__gte=fresh_after).first()
+    if counter is not None:
+        return counter.count
+    count = queryset.count()
+    ProductCount.store({brand: count})
+    return count
+
+
+def count_approximate(queryset, brand=''):
+    """
+    Estimate the count from the planner statistics: pg_class.reltuples for
+    the whole table, the estimated row count of the query when filtered.
+    Below APPROXIMATE_COUNT_MIN the estimate is replaced by an exact count,
+    which is cheap at that size and where estimates are least reliable.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    queryset = queryset.order_by()
+    if queryset.query.has_filters():
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = plan[0]['Plan']['Plan Rows']
+    else:
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            # Autovacuum only analyzes the partitions of a partitioned table.
+            cursor.execute("""
+                SELECT CASE WHEN c.relkind = 'p' THEN (
+                    SELECT coalesce(sum(greatest(p.reltuples, 0)), 0)
+                    FROM pg_inherits i JOIN pg_class p ON p.oid = i.inhrelid
+                    WHERE i.inhparent = c.oid
+                ) ELSE greatest(c.reltuples, 0) END
+                FROM pg_class c WHERE c.oid = to_regclass(%s)
+            """, [table])
+            estimate = cursor.fetchone()[0]
+
+    if estimate < APPROXIMATE_COUNT_MIN:
+        return queryset.count()
+    return int(estimate)
+
+
+APPROXIMATE_COUNT_MIN = 10000
+
+COUNT_STRATEGIES = {
+    'exact': count_exact,
+    'cached': count_cached,
+    'approximate': count_approximate,
+}
+
+
+class EstimatedPage(Page):
+    """
+    Page whose successor is known from the rows fetched, not from the count.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator that counts its objects with the given count function.
+
+    Unless the count is exact, pages are not bounded by it: one extra row is
+    fetched to tell whether a next page exists, and only a page with no rows
+    at all is out of range.
+    """
+
+    def __init__(self, object_list, per_page, count_func=count_exact, count_key='', **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_func = count_func
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return self.count_func(self.object_list, self.count_key)
+
+    def validate_number(self, number):
+        if self.count_func is count_exact:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        if self.count_func is count_exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return EstimatedPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
 class ProductPagination(PageNumberPagination):
     """
     Pagination class for Product model.
+
+    The total is counted with the strategy named by the `count` query
+    parameter, or PRODUCT_COUNT_STRATEGY, see COUNT_STRATEGIES.
     """
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Paginate with the requested count strategy. Raises ValueError for an
+        unknown strategy.
+        """
+        strategy = request.query_params.get(self.count_query_param, settings.PRODUCT_COUNT_STRATEGY)
+        if strategy not in COUNT_STRATEGIES:
+            raise ValueError(f"Unknown count strategy: {strategy}")
+        self.count_strategy = strategy
+        self.django_paginator_class = partial(
+            CountingPaginator,
+            count_func=COUNT_STRATEGIES[strategy],
+            # Only counts per brand are cached, not per attribute filter. The
+            # total is kept under '', an empty brand meaning no brand filter.
+            count_key=None if self.has_attribute_filters(request) else request.query_params.get('brand') or '',
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    @staticmethod
+    def has_attribute_filters(request):
+        return any(param.startswith(Product.ATTRIBUTE_FILTER_PREFIX) for param in request.query_params)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response['X-Count-Strategy'] = self.count_strategy
+        return response
+
+
+class AuditPagination(CursorPagination):
+    """
+    Pagination class for the audit log, newest first. Cursors seek through
+    the (actor, at, id), (sku, at, id) and (at, id) indexes instead of
+    counting and offsetting, so deep pages of a large log cost as much as
+    the first. Events of one batch share their time: the id orders them, so
+    pages neither repeat nor skip any.
+    """
+    ordering = ('-at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class CatalogueFacets:
+    """
+    Brand counts and price histogram of the catalogue, kept in the cache.
+    Prices are converted to BASE_CURRENCY; products priced in a currency
+    without a rate are counted but left out of the prices.
+
+    Cache keys carry a version number that is bumped after every committed
+    product write changing brands, prices or currencies, every imported
+    chunk and every rates update, so stale facets are never read again and
+    simply expire; FACETS_CACHE_TTL bounds the staleness of writes made
+    outside the model (e.g. raw SQL).
+    """
+    VERSION_KEY = 'catalogue:facets:version'
+    MAX_BUCKETS = 50
+
+    @staticmethod
+    def invalidate():
+        """
+        Make every cached facet stale.
+        """
+        try:
+            cache.incr(CatalogueFacets.VERSION_KEY)
+        except ValueError:
+            cache.set(CatalogueFacets.VERSION_KEY, time.time_ns(), None)
+
+    @staticmethod
+    def invalidate_on_commit():
+        """
+        Invalidate once the current transaction commits, so no reader can
+        cache facets computed from the rows it is about to replace.
+        """
+        transaction.on_commit(CatalogueFacets.invalidate)
+
+    @staticmethod
+    def get(brand=None, buckets=10):
+        """
+        Return the facets, from the cache when computed since the last write.
+        """
+        version = cache.get(CatalogueFacets.VERSION_KEY)
+        if version is None:
+            version = time.time_ns()
+            cache.add(CatalogueFacets.VERSION_KEY, version, None)
+        scope = '' if brand is None else hashlib.md5(brand.encode()).hexdigest()
+        key = f'catalogue:facets:{version}:{buckets}:{scope}'
+        facets = cache.get(key)
+        if facets is None:
+            facets = CatalogueFacets.compute(brand, buckets)
+            cache.set(key, facets, settings.FACETS_CACHE_TTL)
+        return facets
+
+    @staticmethod
+    def compute(brand=None, buckets=10):
+        """
+        Compute the facets, prices formatted like the API renders them, with
+        two grouped queries: products and price bounds per brand, then
+        products per equal-width price bucket. Prices are limited to the
+        given brand, brand counts always cover the whole catalogue.
+        """
+        price = ExchangeRate.in_base_currency()
+        per_brand = list(
+            Product.objects.order_by().values('brand')
+            .annotate(count=Count('sku'), priced=Count(price), min=Min(price), max=Max(price))
+            .order_by('-count', 'brand'))
+        scope = [row for row in per_brand if brand is None or row['brand'] == brand]
+        count = sum(row['count'] for row in scope)
+        # Converted prices have more decimals: widen the bounds to cents.
+        low = min((row['min'] for row in scope if row['min'] is not None), default=None)
+        high = max((row['max'] for row in scope if row['max'] is not None), default=None)
+        if low is not None:
+            low = low.quantize(Decimal('0.01'), rounding=ROUND_FLOOR)
+            high = high.quantize(Decimal('0.01'), rounding=ROUND_CEILING)
+        priced = sum(row['priced'] for row in scope)
+        products = Product.objects.order_by()
+        if brand is not None:
+            products = products.filter(brand=brand)
+
+        histogram = []
+        if low is not None and low == high:
+            histogram = [{'min': str(low), 'max': str(high), 'count': priced}]
+        elif low is not None:
+            # width_bucket puts the maximum price in an extra bucket, folded into the last one.
+            bucket = Least(
+                Func(price, Value(low), Value(high), Value(buckets), function='width_bucket'),
+                Value(buckets), output_field=IntegerField())
+            counts = dict(products.annotate(bucket=bucket).values('bucket').annotate(count=Count('sku'))
+                          .values_list('bucket', 'count'))
+            width = (high - low) / buckets
+            histogram = [
+                {
+                    'min': str((low + width * i).quantize(low)),
+                    'max': str(high if i == buckets - 1 else (low + width * (i + 1)).quantize(low)),
+                    'count': counts.get(i + 1, 0),
+                }
+                for i in range(buckets)
+            ]
+
+        return {
+            'count': count,
+            'price': {
+                'currency': settings.BASE_CURRENCY,
+                'min': None if low is None else str(low),
+                'max': None if high is None else str(high),
+                'buckets': histogram,
+            },
+            'brands': [{'brand': row['brand'], 'count': row['count']} for row in per_brand],
+        }
@@ -0,0 +1,146 @@
+"""
+Hash partitioning of the product table (PostgreSQL only).
+
+The table can be switched between a plain table and one hash partitioned by
+SKU, which keeps every SKU lookup, update and upsert on a single partition
+and lets vacuum and index rebuilds work one partition at a time. Partitioning
+by brand is not offered: PostgreSQL requires the partition key in every
+unique constraint, which would rule out the SKU primary key the API, the
+importer and foreign keys rely on.
+
+For the same reason a partitioned table can't carry the unique constraint on
+`code`. Uniqueness is then enforced by a side table holding every code,
+kept in sync by a trigger, so a duplicate code still raises IntegrityError.
+"""
+from django.db import transaction
+
+TABLE = 'api_product'
+CODE_TABLE = 'api_product_code'
+BRAND_INDEX = 'product_brand_sku_idx'
+DELETED_INDEX = 'product_deleted_at_idx'
+ATTRIBUTES_INDEX = 'product_attributes_idx'
+
+CODE_SYNC_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION {CODE_TABLE}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' AND OLD.code IS NOT NULL THEN
+            DELETE FROM {CODE_TABLE} WHERE code = OLD.code;
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.code IS NOT NULL THEN
+            INSERT INTO {CODE_TABLE} (code, sku) VALUES (NEW.code, NEW.sku);
+        END IF;
+        RETURN NULL;
+    END
+    $$
+"""
+
+
+def partition_count(connection, table=TABLE):
+    """
+    Return the number of partitions of the table, 0 for a plain table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT count(i.inhrelid)
+            FROM pg_class c LEFT JOIN pg_inherits i ON i.inhparent = c.oid
+            WHERE c.oid = to_regclass(%s) AND c.relkind = 'p'
+        """, [table])
+        return cursor.fetchone()[0]
+
+
+def create_product_table(cursor, name, partitions, like=TABLE):
+    """
+    Create an empty table with the columns of `like`, hash partitioned by SKU
+    into the given number of partitions, or a plain table for 0.
+    Indexes created on a partitioned table cascade to its partitions.
+    """
+    partition_by = " PARTITION BY HASH (sku)" if partitions else ""
+    cursor.execute(f"CREATE TABLE {name} (LIKE {like} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_by}")
+    cursor.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_pkey PRIMARY KEY (sku)")
+    if partitions:
+        cursor.execute(f"CREATE INDEX {name}_code_idx ON {name} (code)")
+    else:
+        cursor.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_code_key UNIQUE (code)")
+    # Products migrated before soft deletes have no deleted_at column yet.
+    columns = {column.name for column in cursor.db.introspection.get_table_description(cursor, like)}
+    if 'deleted_at' in columns:
+        cursor.execute(f"CREATE INDEX {name}_brand_sku ON {name} (brand, sku) WHERE deleted_at IS NULL")
+        cursor.execute(f"CREATE INDEX {name}_deleted_at ON {name} (deleted_at) WHERE deleted_at IS NOT NULL")
+    else:
+        cursor.execute(f"CREATE INDEX {name}_brand_sku ON {name} (brand, sku)")
+    if 'attributes' in columns:
+        cursor.execute(
+            f"CREATE INDEX {name}_attributes ON {name} USING gin (attributes jsonb_path_ops) WHERE deleted_at IS NULL")
+    for remainder in range(partitions):
+        cursor.execute(
+            f"CREATE TABLE {name}_p{remainder} PARTITION OF {name} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})")
+
+
+def _referencing_foreign_keys(cursor):
+    """
+    Return (table, name, definition) of the foreign keys pointing at the table.
+    """
+    cursor.execute("""
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = to_regclass(%s) AND conparentid = 0
+    """, [TABLE])
+    return cursor.fetchall()
+
+
+def _rename_relations(cursor, old_prefix, new_prefix):
+    """
+    Rename the tables, partitions and indexes named with old_prefix.
+    """
+    cursor.execute("""
+        SELECT relname, relkind IN ('i', 'I') FROM pg_class
+        WHERE starts_with(relname, %s) AND relnamespace = current_schema()::regnamespace
+    """, [old_prefix])
+    for name, is_index in cursor.fetchall():
+        kind = "INDEX" if is_index else "TABLE"
+        cursor.execute(f"ALTER {kind} {name} RENAME TO {new_prefix}{name[len(old_prefix):]}")
+
+
+def repartition_product_table(connection, partitions):
+    """
+    Rebuild the product table with the given number of hash partitions
+    (0 for a plain table), copying the existing rows over.
+
+    Runs in one transaction holding an exclusive lock on the table, so reads
+    and writes wait until the rows are copied: schedule it like any other
+    table rewrite. Foreign keys pointing at the table are recreated.
+    """
+    if partitions < 0:
+        raise ValueError("partitions must be 0 or positive.")
+    if partition_count(connection) == partitions:
+        return
+
+    new_table = f"{TABLE}_new"
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        foreign_keys = _referencing_foreign_keys(cursor)
+        for table, name, _ in foreign_keys:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+        create_product_table(cursor, new_table, partitions)
+        cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {TABLE}")
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {CODE_TABLE}")
+        _rename_relations(cursor, new_table, TABLE)
+        cursor.execute(f"ALTER INDEX {TABLE}_brand_sku RENAME TO {BRAND_INDEX}")
+        cursor.execute(f"ALTER INDEX IF EXISTS {TABLE}_deleted_at RENAME TO {DELETED_INDEX}")
+        cursor.execute(f"ALTER INDEX IF EXISTS {TABLE}_attributes RENAME TO {ATTRIBUTES_INDEX}")
+
+        if partitions:
+            cursor.execute(f"CREATE TABLE {CODE_TABLE} (code varchar(64) PRIMARY KEY, sku uuid NOT NULL)")
+            cursor.execute(f"INSERT INTO {CODE_TABLE} SELECT code, sku FROM {TABLE} WHERE code IS NOT NULL")
+            cursor.execute(CODE_SYNC_FUNCTION)
+            cursor.execute(
+                f"CREATE TRIGGER {CODE_TABLE}_sync AFTER INSERT OR DELETE OR UPDATE OF code ON {TABLE} "
+                f"FOR EACH ROW EXECUTE FUNCTION {CODE_TABLE}_sync()")
+        else:
+            cursor.execute(f"DROP FUNCTION IF EXISTS {CODE_TABLE}_sync()")
+
+        for table, name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
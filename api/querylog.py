@@ -0,0 +1,196 @@
+"""
+Slow query log.
+
+SlowQueryLogMiddleware times every query run while serving a request with a
+database execute wrapper. Queries are aggregated by fingerprint, their SQL
+with literals and parameters replaced by `?` and lists of them collapsed, so
+one row counts every call of the same query. Queries taking at least
+SLOW_QUERY_THRESHOLD_MS are also logged to the `api.slow_queries` logger
+with the view that ran them and kept in a short list of recent ones.
+
+On PostgreSQL a sample (SLOW_QUERY_EXPLAIN_RATE) of the slow SELECTs is run
+again under EXPLAIN (ANALYZE, BUFFERS), so the log says why they were slow.
+This runs the query a second time: keep the rate low. SELECTs calling
+functions with side effects (pg_notify, nextval, ...) only get a plain
+EXPLAIN, which plans them without running them.
+
+Stats are kept per worker process, like the coalescing counters.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('api.slow_queries')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_SPACES = re.compile(r"\s+")
+# Functions that must not run twice, e.g. sending a notification again.
+_SIDE_EFFECTS = re.compile(
+    r"\b(?:pg_notify|nextval|setval|pg_(?:try_)?advisory_(?:xact_)?lock(?:_shared)?|pg_advisory_unlock\w*|"
+    r"pg_sleep\w*|pg_cancel_backend|pg_terminate_backend|pg_reload_conf|set_config)\s*\(",
+    re.IGNORECASE)
+# Fingerprints beyond SLOW_QUERY_MAX_FINGERPRINTS are counted under this one.
+OTHER = '(other)'
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """
+    Normalize a query so calls differing only in their values match. Most
+    queries pass their values as parameters, so the same SQL repeats and
+    the result is memoized.
+    """
+    sql = _LITERALS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _explainable(sql, many, connection):
+    statement = sql.lstrip().upper()
+    return (
+        connection.vendor == 'postgresql' and not many and statement.startswith('SELECT')
+        and 'FOR UPDATE' not in statement and not connection.needs_rollback
+    )
+
+
+def explain(connection, sql, params):
+    """
+    Run the query again under EXPLAIN (ANALYZE, BUFFERS) on the connection's
+    own cursor, out of reach of the execute wrappers, and return the plan.
+    Queries calling functions with side effects are only planned.
+    A failing EXPLAIN is rolled back to a savepoint so it cannot break the
+    transaction the query ran in.
+    """
+    in_transaction = connection.in_atomic_block
+    with connection.connection.cursor() as cursor:
+        if in_transaction:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            options = "" if _SIDE_EFFECTS.search(sql) else " (ANALYZE, BUFFERS)"
+            cursor.execute(f"EXPLAIN{options} {sql}", params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return f"EXPLAIN failed: {e}"
+        if in_transaction:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    return plan
+
+
+class QueryLog:
+    """
+    Query counts and times per fingerprint, and the recent slow queries.
+    """
+    random = random.random
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # fingerprint -> [count, total seconds, max seconds]
+        self._fingerprints = {}
+        self._slow = deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+
+    def execute(self, request, execute, sql, params, many, context):
+        """
+        Execute wrapper timing the query run for the request.
+        """
+        started = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        except Exception:
+            self.record(request, sql, params, many, context['connection'], time.perf_counter() - started, failed=True)
+            raise
+        self.record(request, sql, params, many, context['connection'], time.perf_counter() - started)
+        return result
+
+    def record(self, request, sql, params, many, connection, duration, failed=False):
+        key = fingerprint(sql)
+        with self._lock:
+            if key not in self._fingerprints and len(self._fingerprints) >= settings.SLOW_QUERY_MAX_FINGERPRINTS:
+                key = OTHER
+            stats = self._fingerprints.setdefault(key, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+        if duration * 1000 < settings.SLOW_QUERY_THRESHOLD_MS:
+            return
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path_info
+        plan = None
+        if not failed and _explainable(sql, many, connection) and self.random() < settings.SLOW_QUERY_EXPLAIN_RATE:
+            plan = explain(connection, sql, params)
+        entry = {
+            "at": timezone.now(),
+            "view": view,
+            "alias": connection.alias,
+            "duration_ms": round(duration * 1000, 1),
+            "sql": sql,
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        logger.warning(
+            "Slow query (%.1f ms) in %s on %s: %s%s", entry["duration_ms"], view, connection.alias, sql,
+            f"\n{plan}" if plan else "", extra={"view": view, "duration_ms": entry["duration_ms"]})
+
+    def fingerprints(self, order='total', limit=None):
+        """
+        Return the aggregated fingerprints, the most expensive first by
+        `total` time, call `count` or `max` time.
+        """
+        column = {'count': 0, 'total': 1, 'max': 2}[order]
+        with self._lock:
+            rows = sorted(self._fingerprints.items(), key=lambda item: item[1][column], reverse=True)
+        return [
+            {
+                "fingerprint": key,
+                "count": count,
+                "total_ms": round(total * 1000, 1),
+                "mean_ms": round(total * 1000 / count, 2),
+                "max_ms": round(maximum * 1000, 1),
+            }
+            for key, (count, total, maximum) in rows[:limit]
+        ]
+
+    def slow(self):
+        """
+        Return the recent slow queries, the latest first.
+        """
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints.clear()
+            self._slow.clear()
+
+
+queries = QueryLog()
+
+
+class SlowQueryLogMiddleware:
+    """
+    Time the queries of every request on every database, see QueryLog.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SLOW_QUERY_LOG:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(partial(queries.execute, request)))
+            return self.get_response(request)
@@ -0,0 +1,132 @@
+"""
+Read replica routing.
+
+Reads go to one of settings.DATABASE_REPLICAS unless the current request is
+pinned to the primary: requests with an unsafe method, code that already
+wrote or runs inside a transaction on the primary, and clients that wrote
+recently (read-your-writes, tracked with a cookie). Replicas lagging more
+than REPLICA_MAX_LAG seconds are skipped, and with no usable replica reads
+fall back to the primary.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Replay lag in seconds: 0 once a replica replayed everything it received,
+# or when the database is not a replica at all (e.g. a test mirror).
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+# alias -> (monotonic time of the check, replica is fresh)
+_lag_checks = {}
+
+
+def pin_to_primary():
+    """
+    Send the remaining reads of the current request (or command) to the primary.
+    """
+    _pinned.set(True)
+
+
+def is_pinned():
+    """
+    Tell whether the current request (or command) reads from the primary.
+    """
+    return _pinned.get()
+
+
+def replica_lag(alias):
+    """
+    Return how many seconds the replica is behind, or None if it can't tell.
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        return None
+    return None if lag is None else float(lag)
+
+
+def replica_is_fresh(alias):
+    """
+    Check the replica's lag, at most once per REPLICA_LAG_CHECK_INTERVAL.
+    """
+    now = time.monotonic()
+    checked_at, fresh = _lag_checks.get(alias, (None, False))
+    if checked_at is None or now - checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL:
+        lag = replica_lag(alias)
+        fresh = lag is not None and lag <= settings.REPLICA_MAX_LAG
+        _lag_checks[alias] = (now, fresh)
+    return fresh
+
+
+def clear_lag_checks():
+    """
+    Forget the cached lag checks so the next read checks the replicas again.
+    """
+    _lag_checks.clear()
+
+
+def pin_seconds():
+    """
+    How long a client stays on the primary after writing: long enough for
+    every replica still considered fresh to have replayed the write.
+    """
+    return int(settings.REPLICA_MAX_LAG + settings.REPLICA_LAG_CHECK_INTERVAL) + 1
+
+
+class ReplicaRouter:
+    """
+    Route reads to a fresh replica and everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_is_fresh(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinMiddleware:
+    """
+    Pin requests to the primary when they write or come from a client that
+    wrote recently, and mark clients that just wrote with the pin cookie.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        token = _pinned.set(writes or PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+
+        if writes and settings.DATABASE_REPLICAS and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,161 @@
+"""
+Refresh token revocation.
+
+Revoked tokens are stored as RevokedToken rows, but checking a refresh
+token only reads an in-memory Bloom filter of the revoked JTIs and of the
+users whose tokens were all revoked. The database is queried only when the
+filter reports a possible match, so refreshing a token that was never
+revoked costs no query (and a false positive, about 1 in 100, one query).
+
+Every worker rebuilds its filter from the unexpired rows at most every
+REVOCATION_SYNC_INTERVAL seconds, and right away when the generation
+number kept in the default cache changes, which revoking a token bumps. With
+a shared cache (CACHE_URL) a revocation is thus seen by every worker on its
+next refresh; otherwise after at most REVOCATION_SYNC_INTERVAL seconds.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken
+
+GENERATION_KEY = 'revocation:generation'
+# Issue time of the tokens given out at login, with microseconds: iat only
+# has seconds.
+ISSUED_AT_CLAIM = 'issued_at'
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and about `error_rate` false
+    positives once `capacity` keys were added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+_filter = BloomFilter(0)
+# monotonic time and cache generation of the last rebuild of _filter
+_synced_at = None
+_generation = None
+_lock = threading.Lock()
+
+
+def _jti_key(jti):
+    return f'jti:{jti}'
+
+
+def _user_key(user_id):
+    return f'user:{user_id}'
+
+
+def sync(force=False):
+    """
+    Rebuild this worker's filter from the unexpired revocations if it is
+    older than REVOCATION_SYNC_INTERVAL or another worker revoked a token.
+    """
+    global _filter, _synced_at, _generation
+    generation = cache.get(GENERATION_KEY)
+    now = time.monotonic()
+    if (not force and _synced_at is not None and generation == _generation
+            and now - _synced_at < settings.REVOCATION_SYNC_INTERVAL):
+        return _filter
+
+    with _lock:
+        rows = list(RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('jti', 'user_id'))
+        # Room to grow until the next sync without losing accuracy.
+        revoked = BloomFilter(2 * len(rows) + 1000)
+        for jti, user_id in rows:
+            revoked.add(_jti_key(jti) if jti else _user_key(user_id))
+        _filter, _synced_at, _generation = revoked, now, generation
+    return revoked
+
+
+def _revoked(*keys):
+    """
+    Add the keys to this worker's filter and make the other workers sync.
+    """
+    for key in keys:
+        _filter.add(key)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+    # Rows that can no longer match anything are dropped on the write path.
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+
+
+def revoke_token(token):
+    """
+    Revoke one refresh token, e.g. on logout.
+    """
+    RevokedToken.objects.create(
+        jti=token[jwt_settings.JTI_CLAIM],
+        user_id=token[jwt_settings.USER_ID_CLAIM],
+        expires_at=datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+    )
+    _revoked(_jti_key(token[jwt_settings.JTI_CLAIM]))
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke every refresh token issued to the user so far, e.g. after a
+    password change.
+    """
+    revoked_at = timezone.now()
+    RevokedToken.objects.create(
+        user_id=user_id, revoked_at=revoked_at, expires_at=revoked_at + jwt_settings.REFRESH_TOKEN_LIFETIME)
+    _revoked(_user_key(user_id))
+
+
+def token_for_user(user):
+    """
+    Issue a refresh token for the user, stamped with its precise issue time
+    so it outlives a revocation of the user's tokens in the same second.
+    """
+    refresh = RefreshToken.for_user(user)
+    refresh[ISSUED_AT_CLAIM] = timezone.now().timestamp()
+    return refresh
+
+
+def is_revoked(token):
+    """
+    Tell whether a valid refresh token was revoked, querying the database
+    only when the in-memory filter reports a possible match.
+    """
+    jti = token[jwt_settings.JTI_CLAIM]
+    user_id = token[jwt_settings.USER_ID_CLAIM]
+    revoked = sync()
+    if _jti_key(jti) not in revoked and _user_key(user_id) not in revoked:
+        return False
+    # iat has a one second resolution, so without the precise issue time a
+    # token issued during the second the user was revoked is revoked too.
+    issued_at = datetime.fromtimestamp(token.get(ISSUED_AT_CLAIM, token['iat']), tz=dt_timezone.utc)
+    return RevokedToken.objects.filter(
+        Q(jti=jti) | Q(jti='', user_id=user_id, revoked_at__gte=issued_at)).exists()
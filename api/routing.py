@@ -0,0 +1,79 @@
+from django.urls import URLPattern, URLResolver, Resolver404, include
+from django.urls.resolvers import RoutePattern
+from django.utils.functional import cached_property
+
+
+def _literal_ends(pattern):
+    """
+    Return the first and last path segments of a path() route when they are
+    literal, None in place of a segment starting with a converter. Paths
+    the route matches have the same first and last segments. Regexes and
+    included routes give (None, None).
+    """
+    if not isinstance(pattern, URLPattern) or not isinstance(pattern.pattern, RoutePattern):
+        return None, None
+    segments = str(pattern.pattern).rstrip('/').split('/')
+    first, last = segments[0], segments[-1]
+    return (first if first and '<' not in first else None), (last if last and '<' not in last else None)
+
+
+class SegmentDispatchResolver(URLResolver):
+    """
+    URLResolver that picks the routes worth trying by the first and last
+    path segments with a dict lookup, instead of trying every route in turn.
+
+    Each pair of segments gets a plain URLResolver over the routes that can
+    match it, in declaration order, which resolves the path: matches are
+    built by Django as for any include(). Reversing and URL introspection
+    use the full route list.
+    """
+
+    @cached_property
+    def _ends(self):
+        ends = [_literal_ends(pattern) for pattern in self.url_patterns]
+        return ends, {first for first, _ in ends} - {None}, {last for _, last in ends} - {None}
+
+    @cached_property
+    def _resolvers(self):
+        # (first, last) -> URLResolver, None standing for any other segment.
+        # At most (first segments + 1) * (last segments + 1) entries.
+        return {}
+
+    def _resolver_for(self, key):
+        resolver = self._resolvers.get(key)
+        if resolver is None:
+            ends, _, _ = self._ends
+            patterns = [
+                pattern for pattern, (first, last) in zip(self.url_patterns, ends)
+                if first in (key[0], None) and last in (key[1], None)
+            ]
+            # Handed the path past this resolver's prefix, which the caller
+            # prepends to the route of the match as for any include().
+            resolver = self._resolvers.setdefault(key, URLResolver(
+                RoutePattern('', is_endpoint=False), patterns, self.default_kwargs,
+                app_name=self.app_name, namespace=self.namespace))
+        return resolver
+
+    def resolve(self, path):
+        match = self.pattern.match(str(path))
+        if not match:
+            raise Resolver404({"path": path})
+        new_path, args, kwargs = match
+        if args or kwargs:
+            # The prefix captured arguments the routes must be given.
+            return super().resolve(path)
+        _, firsts, lasts = self._ends
+        segments = new_path.rstrip('/').split('/')
+        first, last = segments[0], segments[-1]
+        key = (first if first in firsts else None, last if last in lasts else None)
+        return self._resolver_for(key).resolve(new_path)
+
+
+def dispatch_include(route, arg, namespace=None):
+    """
+    Like path(route, include(arg, namespace)), but mounts the routes with a
+    SegmentDispatchResolver.
+    """
+    urlconf_module, app_name, namespace = include(arg, namespace=namespace)
+    return SegmentDispatchResolver(
+        RoutePattern(route, is_endpoint=False), urlconf_module, app_name=app_name, namespace=namespace)
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import threading
+from importlib import import_module, metadata
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+# URL format suffix -> (file name, content type)
+SCHEMA_FORMATS = {
+    '.json': ('openapi.json', 'application/json'),
+    '.yaml': ('openapi.yaml', 'application/yaml'),
+}
+FINGERPRINT_FILE = 'openapi.fingerprint'
+
+logger = logging.getLogger('api.schema')
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def get_api_info():
+    """
+    Describe the API for the schema generator. Built on demand so serving
+    the pre-generated schema does not import drf_yasg.
+    """
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Product API",
+        default_version='v1',
+        description="API for managing catalogue of products",
+        contact=openapi.Contact(email="ar.gutierrezrojo@gmail.com"),
+    )
+
+
+def source_fingerprint():
+    """
+    Hash the sources the schema is generated from: the api package, the root
+    URLconf and the drf_yasg version. A different hash means the schema on
+    disk is stale.
+    """
+    digest = hashlib.sha256(metadata.version('drf-yasg').encode())
+    api_dir = Path(__file__).resolve().parent
+    sources = sorted(path for path in api_dir.glob('*.py') if path.name != 'tests.py')
+    sources.append(Path(import_module(settings.ROOT_URLCONF).__file__))
+    for path in sources:
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _write_atomic(path, content):
+    """
+    Write a file so concurrent readers never see it half written.
+    """
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+def render_schema():
+    """
+    Generate the OpenAPI schema and return its content in every format,
+    keyed by URL format suffix.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(info=get_api_info()).get_schema(request=None, public=True)
+    codecs = {
+        '.json': OpenAPICodecJson(validators=[]),
+        '.yaml': OpenAPICodecYaml(validators=[]),
+    }
+    return {format: codecs[format].encode(schema) for format in SCHEMA_FORMATS}
+
+
+def generate_schema(schema_dir=None):
+    """
+    Generate the OpenAPI schema and write it to disk in every format,
+    along with the fingerprint of the sources it was generated from.
+    """
+    schema_dir = Path(schema_dir or settings.OPENAPI_SCHEMA_DIR)
+    schema_dir.mkdir(parents=True, exist_ok=True)
+
+    for format, content in render_schema().items():
+        _write_atomic(schema_dir / SCHEMA_FORMATS[format][0], content)
+    _write_atomic(schema_dir / FINGERPRINT_FILE, source_fingerprint().encode())
+
+
+def schema_is_current(schema_dir=None):
+    """
+    Check whether the schema on disk was generated from the current sources.
+    """
+    schema_dir = Path(schema_dir or settings.OPENAPI_SCHEMA_DIR)
+    try:
+        stored = (schema_dir / FINGERPRINT_FILE).read_text()
+    except FileNotFoundError:
+        return False
+    return stored == source_fingerprint() and all(
+        (schema_dir / filename).exists() for filename, _ in SCHEMA_FORMATS.values())
+
+
+def load_schema(format):
+    """
+    Return the (content, etag) of the schema in the given format.
+    The first call in a process reads the files `manage.py generate_schema`
+    wrote; if they are missing or the code changed since, it generates the
+    schema in memory instead, without writing: the directory may well be
+    read-only. Afterwards the schema is served from memory.
+    """
+    with _lock:
+        if not _loaded:
+            schema_dir = Path(settings.OPENAPI_SCHEMA_DIR)
+            if schema_is_current(schema_dir):
+                contents = {
+                    name: (schema_dir / filename).read_bytes()
+                    for name, (filename, _) in SCHEMA_FORMATS.items()
+                }
+            else:
+                logger.warning(
+                    "OpenAPI schema in %s is missing or out of date, generating it in memory; "
+                    "run `manage.py generate_schema` when deploying.", schema_dir)
+                contents = render_schema()
+            for name, content in contents.items():
+                _loaded[name] = (content, hashlib.sha256(content).hexdigest()[:32])
+        return _loaded[format]
+
+
+def clear_schema_cache():
+    """
+    Forget the schema held in memory so the next request reloads it.
+    """
+    with _lock:
+        _loaded.clear()
+
+
+@condition(etag_func=lambda request, format: load_schema(format)[1])
+def serve_schema(request, format):
+    """
+    Serve the pre-generated OpenAPI schema with ETag and cache headers.
+    """
+    content, _ = load_schema(format)
+    response = HttpResponse(content, content_type=SCHEMA_FORMATS[format][1])
+    response['Cache-Control'] = f'public, max-age={settings.OPENAPI_SCHEMA_MAX_AGE}'
+    return response
@@ -0,0 +1,244 @@
+"""
+Synthetic catalogue for scale testing.
+
+Products and admin users are drawn from a seed: chunk c of the products is
+generated by its own random.Random seeded with (seed, c), so a seed and a
+size always give the same rows (timestamps apart, which are relative to the
+load). Brands are few and popular ones hold most products, prices follow a
+log-normal curve per category and views a long tail, like a real catalogue.
+
+On PostgreSQL products are written with COPY, elsewhere with bulk_create.
+"""
+import io
+import json
+import math
+import random
+from bisect import bisect
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from .models import Product, ProductPriceHistory
+
+# category -> (nouns, median price, sizes or None)
+CATEGORIES = {
+    "audio": (["Headphones", "Speaker", "Earbuds", "Soundbar", "Turntable"], 80, None),
+    "computers": (["Laptop", "Monitor", "Keyboard", "Mouse", "Webcam", "Router"], 250, None),
+    "phones": (["Smartphone", "Phone Case", "Charger", "Power Bank"], 120, None),
+    "apparel": (["T-Shirt", "Hoodie", "Jacket", "Jeans", "Dress", "Sweater"], 40, ["XS", "S", "M", "L", "XL", "XXL"]),
+    "footwear": (["Sneakers", "Boots", "Sandals", "Loafers"], 70, ["36", "38", "40", "42", "44", "46"]),
+    "home": (["Lamp", "Blender", "Kettle", "Toaster", "Vacuum", "Coffee Maker"], 60, None),
+    "furniture": (["Chair", "Desk", "Sofa", "Bookshelf", "Bed Frame"], 300, ["S", "M", "L"]),
+    "sports": (["Yoga Mat", "Dumbbell", "Bicycle", "Tent", "Backpack"], 50, ["S", "M", "L"]),
+    "beauty": (["Shampoo", "Moisturizer", "Perfume", "Hair Dryer"], 25, None),
+    "toys": (["Puzzle", "Board Game", "Action Figure", "Building Set", "Plush"], 20, None),
+}
+ADJECTIVES = [
+    "Classic", "Compact", "Deluxe", "Essential", "Lightweight", "Premium", "Pro", "Smart",
+    "Ultra", "Vintage", "Wireless", "Portable", "Eco", "Advanced", "Mini", "Max",
+]
+COLORS = ["black", "white", "gray", "red", "blue", "green", "yellow", "pink", "brown", "silver"]
+MATERIALS = ["cotton", "leather", "metal", "plastic", "wood", "glass", "bamboo", "polyester"]
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ve", "zen", "nor", "ax", "el", "qu", "tri", "on", "sa", "lux", "ix"]
+FIRST_NAMES = [
+    "Ana", "Carlos", "Diana", "Eduardo", "Fernanda", "Gabriel", "Hugo", "Isabel", "Javier", "Karla",
+    "Luis", "Maria", "Nicolas", "Olivia", "Pablo", "Rosa", "Sofia", "Tomas", "Valeria", "Ximena",
+]
+LAST_NAMES = [
+    "Garcia", "Hernandez", "Lopez", "Martinez", "Gonzalez", "Perez", "Rodriguez", "Sanchez",
+    "Ramirez", "Torres", "Flores", "Rivera", "Gomez", "Diaz", "Cruz", "Morales",
+]
+
+# Product columns in the order generate_products yields them.
+COLUMNS = ["sku", "code", "name", "brand", "price", "currency", "views", "version", "deleted_at", "attributes"]
+# Share of products given a secondary code.
+CODE_RATE = 0.3
+# Model number prefixes, as in "Pro Laptop K245".
+MODELS = "ABCDEFGHKMSXZ"
+# Bits fixed by a version 4 UUID: its version and variant.
+UUID_MASK = ~((0xf000 << 64) | (0xc000 << 48))
+UUID_VERSION = (0x4000 << 64) | (0x8000 << 48)
+# Brand names are two or three syllables; a third of them are distinct
+# enough to be found quickly.
+MAX_BRANDS = (len(SYLLABLES) ** 2 + len(SYLLABLES) ** 3) // 3
+
+
+def _rng(seed, *parts):
+    return random.Random(":".join(map(str, (seed, *parts))))
+
+
+def generate_brands(seed, count):
+    """
+    Return `count` distinct brand names (at most MAX_BRANDS) and the
+    cumulative weights of a Zipf distribution over them, so the first brands
+    hold most products.
+    """
+    rng = _rng(seed, "brands")
+    brands = []
+    seen = set()
+    while len(brands) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        if name not in seen:
+            seen.add(name)
+            brands.append(name)
+    cumulative, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    return brands, cumulative
+
+
+def generate_products(seed, count, start=0, chunk_size=10000, brands=500, deleted_rate=0.02, now=None):
+    """
+    Yield `count` product rows as tuples of COLUMNS, from row `start` on.
+    Row i is the same for a given seed whatever `start` and `count` are, as
+    long as chunk_size does not change.
+    """
+    names, cumulative = generate_brands(seed, brands)
+    slugs = [name.lower() for name in names]
+    total = cumulative[-1]
+    now = now or timezone.now()
+    currency = settings.BASE_CURRENCY
+    categories = [(category, *values) for category, values in CATEGORIES.items()]
+
+    index = start
+    end = start + count
+    while index < end:
+        chunk = index // chunk_size
+        rng = _rng(seed, chunk)
+        getrandbits, uniform, gauss = rng.getrandbits, rng.random, rng.gauss
+        first = chunk * chunk_size
+        rows = min(end, first + chunk_size)
+        for row in range(first, rows):
+            # A version 4 UUID, formatted by hand: three times faster than uuid.UUID.
+            bits = getrandbits(128) & UUID_MASK | UUID_VERSION
+            hex = f"{bits:032x}"
+            sku = f"{hex[:8]}-{hex[8:12]}-{hex[12:16]}-{hex[16:20]}-{hex[20:]}"
+            brand_index = min(bisect(cumulative, uniform() * total), len(names) - 1)
+            category, nouns, median, sizes = categories[int(uniform() * len(categories))]
+            name = (
+                f"{names[brand_index]} {ADJECTIVES[int(uniform() * len(ADJECTIVES))]} "
+                f"{nouns[int(uniform() * len(nouns))]} {MODELS[int(uniform() * len(MODELS))]}{int(uniform() * 999) + 1}"
+            )
+            price = min(max(round(median * math.exp(gauss(0, 0.6))) - 0.01, 0.99), 99999999.99)
+            views = min(int(rng.paretovariate(1.16)) - 1, 10_000_000)
+            version = 1 + int(rng.expovariate(2))
+            attributes = {"category": category, "color": COLORS[int(uniform() * len(COLORS))]}
+            if sizes:
+                attributes["size"] = sizes[int(uniform() * len(sizes))]
+            if uniform() < 0.5:
+                attributes["material"] = MATERIALS[int(uniform() * len(MATERIALS))]
+            deleted_at = None
+            code = None
+            if uniform() < deleted_rate:
+                deleted_at = now - timedelta(seconds=int(uniform() * 30 * 24 * 3600))
+            elif uniform() < CODE_RATE:
+                code = f"{slugs[brand_index]}-{seed}-{row}"
+            # Rows of the chunk before `start` are drawn all the same, to
+            # keep the following ones unchanged.
+            if row >= index:
+                yield (sku, code, name, names[brand_index], f"{price:.2f}", currency, views, version,
+                       deleted_at, attributes)
+        index = rows
+
+
+def _copy_text(rows):
+    """
+    Format rows in the COPY text format. Generated values hold no tabs,
+    newlines or backslashes, so nothing needs escaping.
+    """
+    lines = []
+    for sku, code, name, brand, price, currency, views, version, deleted_at, attributes in rows:
+        lines.append("\t".join((
+            sku, code or "\\N", name, brand, price, currency, str(views), str(version),
+            deleted_at.isoformat() if deleted_at else "\\N", json.dumps(attributes),
+        )))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _copy(cursor, table, columns, text):
+    """
+    Run COPY FROM STDIN with psycopg 3 or psycopg2.
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    raw = cursor.cursor
+    # Raise Django's exceptions, e.g. IntegrityError for a duplicate code.
+    with connection.wrap_database_errors:
+        if hasattr(raw, "copy"):
+            with raw.copy(sql) as copy:
+                copy.write(text)
+        else:
+            raw.copy_expert(sql, io.StringIO(text))
+
+
+def write_products(rows, batch_size=50000, use_copy=None, progress=None):
+    """
+    Write product rows, with their price in the price history, in batches
+    and return how many were written. Runs in the caller's transaction;
+    progress, if given, is called with the running total after each batch.
+    """
+    if use_copy is None:
+        use_copy = connection.vendor == "postgresql"
+    now = timezone.now()
+    written = 0
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        if use_copy:
+            # Random SKUs land all over the primary key index; in order, the
+            # index pages of a batch are each visited once.
+            batch.sort()
+            history = "".join(
+                f"{row[0]}\t{row[4]}\t{row[5]}\t{now.isoformat()}\t{ProductPriceHistory.Source.IMPORT}\n"
+                for row in batch)
+            with connection.cursor() as cursor:
+                _copy(cursor, Product._meta.db_table, COLUMNS, _copy_text(batch))
+                _copy(cursor, ProductPriceHistory._meta.db_table,
+                      ["sku", "price", "currency", "effective_at", "source"], history)
+        else:
+            products = [Product(**dict(zip(COLUMNS, row))) for row in batch]
+            Product.all_objects.bulk_create(products)
+            ProductPriceHistory.objects.bulk_create([
+                ProductPriceHistory(sku=product.sku, price=product.price, currency=product.currency,
+                                    effective_at=now, source=ProductPriceHistory.Source.IMPORT)
+                for product in products
+            ])
+        written += len(batch)
+        if progress:
+            progress(written)
+    return written
+
+
+def _admin_names(seed, count):
+    rng = _rng(seed, "admins")
+    for index in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield first, last, f"{first}.{last}.{seed}.{index}".lower()
+
+
+def generate_admins(seed, count, password):
+    """
+    Return `count` unsaved staff users. They share one password, hashed
+    once: hashing it per user would take longer than the whole load.
+    """
+    hashed = make_password(password)
+    return [
+        User(username=username, email=f"{username}@example.com", first_name=first, last_name=last,
+             password=hashed, is_staff=True)
+        for first, last, username in _admin_names(seed, count)
+    ]
+
+
+def seed_is_loaded(seed):
+    """
+    Tell whether rows of the seed were loaded already, by looking up its
+    first product and first staff user, the same whatever the counts.
+    """
+    sku = next(generate_products(seed, 1))[0]
+    _, _, username = next(_admin_names(seed, 1))
+    return Product.all_objects.filter(sku=sku).exists() or User.objects.filter(username=username).exists()
@@ -1,6 +1,90 @@
+import json
+import re
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Product
+from .models import AuditEvent, CatalogueFacets, ExchangeRate, Product, ProductPriceHistory
+from .sku import encode_sku, parse_sku
+
+
+class SkuField(serializers.Field):
+    """
+    Field for a product SKU given as a UUID or as its base62 short form.
+    """
+    default_error_messages = {
+        'invalid': 'Must be a valid SKU.',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            return parse_sku(data)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+
+    def to_representation(self, value):
+        return str(value)
+
+
+class CurrencyField(serializers.CharField):
+    """
+    Field for the ISO 4217 code of a currency with a known exchange rate.
+    The rates are taken from the serializer context (`exchange_rates`) when
+    given, e.g. by import workers, which must not query the database.
+    """
+    default_error_messages = {
+        'unknown': 'Unknown currency "{value}".',
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_length', 3)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data).upper()
+        rates = self.context.get('exchange_rates')
+        if value not in (ExchangeRate.rates() if rates is None else rates):
+            self.fail('unknown', value=value)
+        return value
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin that only outputs the fields passed as `fields`, so a
+    client asking for ?fields=sku,name gets, and pays for, just those.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        """
+        Parse the comma-separated `fields` query parameter. Returns None when
+        it is absent and raises ValueError for fields the serializer lacks.
+        """
+        value = request.query_params.get('fields')
+        if value is None:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.Meta.fields]
+        if unknown or not fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+
+    @classmethod
+    def model_fields(cls, fields):
+        """
+        Return the model columns needed to output the given fields, for
+        QuerySet.only(). The primary key is always loaded.
+        """
+        meta = cls.Meta.model._meta
+        columns = {field.name for field in meta.concrete_fields} - {meta.pk.name}
+        return [meta.pk.name, *(name for name in fields if name in columns)]
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -35,24 +119,214 @@ class UserSerializer(serializers.ModelSerializer):
         return value
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Product model.
     Converts Product model instances to JSON format and vice versa.
     """
+    ATTRIBUTE_KEY = re.compile(r'[a-z][a-z0-9_]{0,49}')
+    MAX_ATTRIBUTES = 50
+
+    short_sku = serializers.SerializerMethodField()
+    currency = CurrencyField(required=False)
+    attributes = serializers.DictField(child=serializers.CharField(max_length=255), required=False)
 
     class Meta(object):
         """
         Meta class to specify the model and fields to be used in the serializer.
         """
         model = Product
-        fields = ["sku", "name", "brand", "price", "views"]
-
-        def validate(self, data):
-            """
-            Validate the data before saving.
-            """
-            if 'price' in data and data['price'] <= 0:
-                raise serializers.ValidationError(
-                    "Price must be a positive value.")
-            return data
+        fields = ["sku", "short_sku", "code", "name", "brand", "price", "currency", "attributes", "views", "version"]
+        read_only_fields = ["version"]
+
+    def validate(self, data):
+        """
+        Validate the data before saving.
+        """
+        if 'price' in data and data['price'] <= 0:
+            raise serializers.ValidationError(
+                "Price must be a positive value.")
+        return data
+
+    def validate_code(self, value):
+        """
+        Store blank codes as NULL so they don't collide on the unique index.
+        """
+        return value or None
+
+    def validate_attributes(self, value):
+        """
+        Attributes are a flat object of text values, numbers being stored
+        as text, so that filters match them exactly.
+        """
+        if len(value) > self.MAX_ATTRIBUTES:
+            raise serializers.ValidationError(f"Ensure there are no more than {self.MAX_ATTRIBUTES} attributes.")
+        invalid = [key for key in value if not self.ATTRIBUTE_KEY.fullmatch(key)]
+        if invalid:
+            raise serializers.ValidationError(
+                f"Invalid attribute names: {', '.join(invalid)}. Use lowercase letters, digits and underscores.")
+        return value
+
+    @classmethod
+    def requested_attributes(cls, request):
+        """
+        Parse the `attr.<name>=<value>` query parameters into {name: [values]}.
+        Raises ValueError for invalid attribute names.
+        """
+        filters = {}
+        for param, values in request.query_params.lists():
+            if param.startswith(Product.ATTRIBUTE_FILTER_PREFIX):
+                name = param[len(Product.ATTRIBUTE_FILTER_PREFIX):]
+                if not cls.ATTRIBUTE_KEY.fullmatch(name):
+                    raise ValueError(f"Invalid attribute name: {name}")
+                filters[name] = values
+        return filters
+
+    def get_short_sku(self, obj):
+        """
+        Return the base62 encoded SKU, usable in URLs instead of the UUID.
+        """
+        return encode_sku(obj.sku)
+
+
+class ProductImportSerializer(ProductSerializer):
+    """
+    Validates catalogue rows for bulk imports with the ProductSerializer rules.
+    The SKU is taken from the file, and codes are not checked for uniqueness
+    row by row since the database enforces that per batch.
+    """
+    sku = SkuField(required=False)
+    short_sku = None
+    code = serializers.SlugField(max_length=64, required=False, allow_null=True, allow_blank=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ["sku", "code", "name", "brand", "price", "currency", "attributes"]
+        read_only_fields = []
+
+    def to_internal_value(self, data):
+        # CSV cells hold the attributes as a JSON object.
+        if isinstance(data.get('attributes'), str):
+            try:
+                data = {**data, 'attributes': json.loads(data['attributes'])}
+            except json.JSONDecodeError:
+                raise serializers.ValidationError({'attributes': ["Must be a JSON object."]})
+        return super().to_internal_value(data)
+
+
+class PriceHistorySerializer(serializers.ModelSerializer):
+    """
+    Serializer for one entry of a product's price history.
+    """
+    source = serializers.CharField(source="get_source_display")
+
+    class Meta(object):
+        model = ProductPriceHistory
+        fields = ["price", "currency", "effective_at", "source"]
+
+
+class PriceRangeSerializer(serializers.Serializer):
+    """
+    Validates the optional date range of a price history request.
+    """
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
+
+
+class FacetsSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of a catalogue facets request.
+    """
+    brand = serializers.CharField(required=False)
+    buckets = serializers.IntegerField(min_value=1, max_value=CatalogueFacets.MAX_BUCKETS, default=10)
+
+
+class PricesAtSerializer(serializers.Serializer):
+    """
+    Validates a lookup of the prices of many SKUs at one point in time.
+    """
+    MAX_SKUS = 500
+
+    skus = serializers.ListField(child=SkuField(), min_length=1, max_length=MAX_SKUS)
+    at = serializers.DateTimeField(required=False)
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    """
+    Validates a request deleting many products at once.
+    """
+    MAX_SKUS = 500
+
+    skus = serializers.ListField(child=SkuField(), min_length=1, max_length=MAX_SKUS)
+
+
+class BatchLookupSerializer(serializers.Serializer):
+    """
+    Validates a lookup of many products by SKU, at most
+    PRODUCT_BATCH_MAX_SIZE of them.
+    """
+    skus = serializers.ListField(child=SkuField(), min_length=1)
+    record_views = serializers.BooleanField(default=True)
+
+    def validate_skus(self, value):
+        if len(value) > settings.PRODUCT_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {settings.PRODUCT_BATCH_MAX_SIZE} elements.")
+        return value
+
+
+class CurrencySerializer(serializers.Serializer):
+    """
+    Validates the optional currency product prices are returned in.
+    """
+    currency = CurrencyField(required=False)
+
+
+class ExchangeRatesSerializer(serializers.Serializer):
+    """
+    Validates exchange rates to load, as units of each currency worth one
+    BASE_CURRENCY.
+    """
+    rates = serializers.DictField(
+        child=serializers.DecimalField(max_digits=20, decimal_places=8, min_value=Decimal('0.00000001')),
+        allow_empty=False)
+
+    def validate_rates(self, value):
+        rates = {}
+        for currency, rate in value.items():
+            if not re.fullmatch(r'[A-Za-z]{3}', currency):
+                raise serializers.ValidationError(f'"{currency}" is not an ISO 4217 currency code.')
+            if currency.upper() == settings.BASE_CURRENCY:
+                raise serializers.ValidationError(f"The rate of {settings.BASE_CURRENCY} is always 1.")
+            rates[currency.upper()] = rate
+        return rates
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one audit log event.
+    """
+
+    class Meta(object):
+        model = AuditEvent
+        fields = ["at", "actor_id", "actor", "action", "sku", "target_user_id", "changes"]
+
+
+class AuditQuerySerializer(serializers.Serializer):
+    """
+    Validates the filters of an audit log query.
+    """
+    actor = serializers.IntegerField(required=False)
+    sku = SkuField(required=False)
+    action = serializers.ChoiceField(choices=AuditEvent.Action.choices, required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
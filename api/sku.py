@@ -0,0 +1,60 @@
+import uuid
+
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE62_INDEX = {char: index for index, char in enumerate(BASE62_ALPHABET)}
+
+# 62 ** 22 > 2 ** 128, so every UUID fits in 22 base62 characters.
+SHORT_SKU_LENGTH = 22
+
+UUID_PATTERN = r"[0-9a-fA-F]{8}(?:-?[0-9a-fA-F]{4}){3}-?[0-9a-fA-F]{12}"
+SHORT_SKU_PATTERN = r"[0-9A-Za-z]{1,%d}" % SHORT_SKU_LENGTH
+SKU_PATTERN = f"{UUID_PATTERN}|{SHORT_SKU_PATTERN}"
+
+
+def encode_sku(sku):
+    """
+    Encode a UUID SKU as a fixed width base62 string.
+    """
+    if not isinstance(sku, uuid.UUID):
+        sku = uuid.UUID(str(sku))
+
+    number = sku.int
+    chars = []
+    while number:
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[remainder])
+    return "".join(reversed(chars)).rjust(SHORT_SKU_LENGTH, BASE62_ALPHABET[0])
+
+
+def decode_sku(value):
+    """
+    Decode a base62 string back into a UUID SKU.
+    Raises ValueError when the value is not a valid short SKU.
+    """
+    if not value or len(value) > SHORT_SKU_LENGTH:
+        raise ValueError("Invalid short SKU")
+
+    number = 0
+    for char in value:
+        try:
+            number = number * 62 + BASE62_INDEX[char]
+        except KeyError:
+            raise ValueError("Invalid short SKU") from None
+
+    if number >= 1 << 128:
+        raise ValueError("Invalid short SKU")
+    return uuid.UUID(int=number)
+
+
+def parse_sku(value):
+    """
+    Parse a SKU given either as a UUID (with or without dashes) or as its
+    base62 short form. Raises ValueError for anything else.
+    """
+    if isinstance(value, uuid.UUID):
+        return value
+
+    value = str(value).strip()
+    if len(value) > SHORT_SKU_LENGTH:
+        return uuid.UUID(value)
+    return decode_sku(value)
@@ -1,10 +1,46 @@
+import asyncio
+import contextvars
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
 from decimal import Decimal
-from django.urls import reverse
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, URLResolver, include, resolve, reverse
+from django.urls.resolvers import RegexPattern
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
-from django.contrib.auth.models import User
+from rest_framework.test import APITestCase, APITransactionTestCase
+from django.contrib.auth.models import AnonymousUser, User
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Product
+from .models import AuditEvent, CatalogueFacets, ExchangeRate, Product, ProductCount, ProductPriceHistory
+from . import audit, events, querylog, replicas, revocation, schema, seeding, views, warming
+from .coalescing import SingleFlight, reads
+from .compression import choose_encoding
+from .routing import dispatch_include
+from .throttling import TokenBucketThrottle
+from .importer import validate_rows, write_records
+from .partitioning import partition_count, repartition_product_table
+from .importer import Checkpoint
+from .serializers import ProductSerializer
+from .management.commands.profile_startup import parse_import_times
+from .sku import decode_sku, encode_sku, parse_sku
 
 """ Product creation test case. """
 class ProductCreationTestCase(APITestCase):
@@ -68,6 +104,21 @@ class ProductCreationTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(Product.objects.count(), 0)
 
+    def test_create_product_with_non_positive_price(self):
+        """Test product creation with a zero or negative price."""
+        self.authenticate()
+
+        for price in [0, -10]:
+            data = {
+                "name": "Test Product",
+                "price": price,
+                "brand": "Test Brand"
+            }
+
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Product.objects.count(), 0)
+
     def test_success_message_and_product_info(self):
         """Test success message and product info in response."""
         self.authenticate()
@@ -133,6 +184,13 @@ class ProductListTestCase(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_filter_by_brand(self):
+        """Test listing only the products of one brand."""
+        url = reverse('list_products') + '?brand=Brand C'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['name'] for product in response.data['results']], ['Product 3'])
+
     def test_list_product_empty(self):
         """Test listing products when there are no products."""
         Product.objects.all().delete()
@@ -186,6 +244,60 @@ class ProductDetailTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(self.product.views, 1)
 
+    def test_view_counter_keeps_version(self):
+        """
+        Test that counting a view does not bump the product version,
+        so it never conflicts with concurrent admin updates.
+        """
+        url = reverse('product_detail', args=[self.product.sku])
+        response = self.client.get(url)
+
+        self.product.refresh_from_db()
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(self.product.views, 1)
+        self.assertEqual(self.product.version, 1)
+
+    def test_get_product_by_short_sku(self):
+        """Test the base62 short SKU resolves to the same product."""
+        self.authenticate()
+        short_sku = encode_sku(self.product.sku)
+        response = self.client.get(reverse('product_detail', args=[short_sku]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['sku'], str(self.product.sku))
+        self.assertEqual(response.data['short_sku'], short_sku)
+
+    def test_get_product_by_code(self):
+        """Test looking a product up by its human-readable code."""
+        self.authenticate()
+        Product.objects.filter(sku=self.product.sku).update(code='test-product')
+        response = self.client.get(reverse('product_detail_by_code', args=['test-product']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['code'], 'test-product')
+
+    def test_malformed_sku_is_rejected_without_query(self):
+        """Test a malformed SKU returns 404 before reaching the database."""
+        with self.assertNumQueries(0):
+            response = self.client.get('/product/not-a-sku!/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+""" SKU encoding test case. """
+class SkuEncodingTestCase(SimpleTestCase):
+    def test_round_trip(self):
+        """Test short SKUs decode back to the original UUID."""
+        sku = uuid.UUID('e4c0ce55-9a2b-44a7-b983-e1c875235134')
+        short_sku = encode_sku(sku)
+        self.assertEqual(len(short_sku), 22)
+        self.assertEqual(decode_sku(short_sku), sku)
+        self.assertEqual(parse_sku(short_sku), sku)
+        self.assertEqual(parse_sku(sku.hex), sku)
+
+    def test_invalid_values(self):
+        """Test invalid short SKUs are rejected."""
+        for value in ['', 'a' * 23, 'abc-def', 'zzzzzzzzzzzzzzzzzzzzzz']:
+            with self.assertRaises(ValueError):
+                parse_sku(value)
+
 
 """ Product update test case. """
 class ProductUpdateTestCase(APITestCase):
@@ -270,6 +382,54 @@ class ProductUpdateTestCase(APITestCase):
         response = self.client.put(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_update_product_with_matching_version(self):
+        """Test a conditional update with the current version succeeds and bumps it."""
+        self.authenticate()
+        url = reverse('update_product', args=[self.product.sku])
+        response = self.client.put(url, {"price": 120.0}, format='json', HTTP_IF_MATCH='"1"')
+        self.product.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(response.data['product']['version'], 2)
+        self.assertEqual(self.product.price, Decimal('120.00'))
+        self.assertEqual(self.product.version, 2)
+
+    def test_update_product_with_stale_version(self):
+        """Test a conditional update with an outdated version is rejected."""
+        self.authenticate()
+        url = reverse('update_product', args=[self.product.sku])
+        self.client.put(url, {"name": "First Update"}, format='json', HTTP_IF_MATCH='"1"')
+        response = self.client.put(url, {"name": "Second Update", "version": 1}, format='json')
+        self.product.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.product.name, 'First Update')
+        self.assertEqual(self.product.version, 2)
+
+    def test_update_product_keeps_other_columns(self):
+        """Test an update from a stale instance only writes the changed columns."""
+        Product.increment_views(self.product.sku)
+        self.assertTrue(self.product.apply_changes({"name": "Updated Product"}))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Updated Product')
+        self.assertEqual(self.product.views, 1)
+
+    def test_update_product_negative_views(self):
+        """Test an update never stores negative views, like save()."""
+        self.authenticate()
+        url = reverse('update_product', args=[self.product.sku])
+        response = self.client.put(url, {"views": -5}, format='json')
+        self.product.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.product.views, 0)
+
+    def test_failed_brand_change_keeps_counts(self):
+        """Test the cached counts of a brand change roll back with the update."""
+        ProductCount.store({'Test Brand': 1, 'Other Brand': 0})
+        with mock.patch.object(events, 'publish', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.product.apply_changes({"brand": "Other Brand"})
+        self.assertEqual(Product.objects.get(sku=self.product.sku).brand, 'Test Brand')
+        self.assertEqual(dict(ProductCount.objects.values_list('brand', 'count')), {'Test Brand': 1, 'Other Brand': 0})
+
 class ProductDeleteTestCase(APITestCase):
     def setUp(self):
         self.admin_user = User.objects.create_user(
@@ -562,3 +722,1968 @@ class DeleteAdminUserTestCase(APITestCase):
         self.assertTrue(User.objects.filter(id=user.id).exists())
                                         
                                 
+
+
+""" Legacy routes test case. """
+class LegacyRoutesTestCase(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Test Product', price=100.0, brand='Test Brand')
+        self.user = User.objects.create_user(username='admin', password='admin')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_sku_routes_with_trailing_slash(self):
+        """Test the update and delete routes accept the SKU with or without a trailing slash."""
+        for prefix, view in [('updateproduct', views.update_product), ('deleteproduct', views.delete_product)]:
+            for suffix in ('', '/'):
+                match = resolve(f'/{prefix}/{self.product.sku}{suffix}')
+                self.assertEqual(match.func, view)
+                self.assertEqual(match.kwargs, {'sku': self.product.sku})
+
+        response = self.client.put(f'/updateproduct/{self.product.sku}/', {'price': '90.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.delete(f'/deleteproduct/{self.product.sku}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Product.objects.filter(sku=self.product.sku).exists())
+
+
+""" API v1 routing test case. """
+class V1RoutingTestCase(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Test Product',
+            price=100.0,
+            brand='Test Brand'
+        )
+
+    def test_v1_routes_reverse_under_prefix(self):
+        """Test v1 route names reverse under /api/v1/."""
+        self.assertEqual(reverse('v1:list_products'), '/api/v1/catalogue/')
+        self.assertEqual(reverse('v1:update_product', args=[self.product.sku]),
+                         f'/api/v1/products/{self.product.sku}/update/')
+        self.assertEqual(reverse('v1:delete_admin_user', args=[1]), '/api/v1/admins/1/delete/')
+
+    def test_v1_resolve_match(self):
+        """Test v1 routes resolve with their full route and parsed SKU."""
+        match = resolve(f'/api/v1/products/{self.product.sku}/')
+        self.assertEqual(match.view_name, 'v1:product_detail')
+        self.assertEqual(match.route, 'api/v1/products/<sku:sku>/')
+        self.assertEqual(match.kwargs, {'sku': self.product.sku})
+
+    def test_v1_product_detail(self):
+        """Test retrieving a product through the v1 routes."""
+        response = self.client.get(reverse('v1:product_detail', args=[self.product.sku]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Test Product')
+
+    def test_segment_dispatch_matches_include(self):
+        """Test routes dispatched by path segments resolve exactly as with a plain include()."""
+        from django.urls import path
+
+        dispatched = URLResolver(RegexPattern(r'^/'), [dispatch_include('api/v1/', ('api.urls', 'api'), namespace='v1')])
+        included = URLResolver(RegexPattern(r'^/'), [path('api/v1/', include(('api.urls', 'api'), namespace='v1'))])
+        sku = self.product.sku
+        for url in ['/api/v1/catalogue/', '/api/v1/catalogue/facets/', '/api/v1/products/new/',
+                    '/api/v1/products/delete/', f'/api/v1/products/{sku}/', f'/api/v1/products/{sku}/delete/',
+                    f'/api/v1/products/{encode_sku(sku)}/update/', '/api/v1/products/code/some-code/',
+                    '/api/v1/admins/1/update/', '/api/v1/auth/login/']:
+            expected, match = included.resolve(url), dispatched.resolve(url)
+            self.assertEqual(
+                (match.func, match.kwargs, match.route, match.view_name),
+                (expected.func, expected.kwargs, expected.route, expected.view_name), url)
+        for url in ['/api/v1/', '/api/v1/products/', '/api/v1/products/new/extra/', '/api/v1/admins/x/update/']:
+            with self.assertRaises(Resolver404):
+                dispatched.resolve(url)
+
+    def test_v1_unknown_paths_return_404(self):
+        """Test paths that only contain a route name are not matched."""
+        for url in ['/api/v1/loginpage', '/api/v1/catalogue/old/', '/api/v1/products/new/extra/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+""" Pre-generated OpenAPI schema test case. """
+class OpenAPISchemaTestCase(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.schema_dir = Path(tmp_dir.name)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=str(self.schema_dir))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema.clear_schema_cache()
+        self.addCleanup(schema.clear_schema_cache)
+
+    def test_schema_served_from_disk(self):
+        """Test the schema written by generate_schema is served with cache headers."""
+        call_command('generate_schema', stdout=StringIO())
+        (self.schema_dir / 'openapi.json').write_text('{"paths": {"/from-disk/": {}}}')
+        response = self.client.get(reverse('schema-json', kwargs={'format': '.json'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'paths': {'/from-disk/': {}}})
+        self.assertIn('ETag', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+
+    def test_schema_generated_in_memory(self):
+        """Test a missing schema is generated on request without writing to disk."""
+        with self.assertLogs('api.schema', 'WARNING'):
+            response = self.client.get(reverse('schema-json', kwargs={'format': '.json'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('/api/v1/catalogue/', response.json()['paths'])
+        self.assertEqual(list(self.schema_dir.iterdir()), [])
+
+    def test_schema_not_modified(self):
+        """Test a matching If-None-Match returns 304 without a body."""
+        schema.generate_schema(self.schema_dir)
+        url = reverse('schema-json', kwargs={'format': '.yaml'})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_stale_schema_is_not_served(self):
+        """Test a schema generated from other sources is replaced in memory, not on disk."""
+        schema.generate_schema(self.schema_dir)
+        (self.schema_dir / schema.FINGERPRINT_FILE).write_text('stale')
+        (self.schema_dir / 'openapi.json').write_text('{}')
+        self.assertFalse(schema.schema_is_current(self.schema_dir))
+        with self.assertLogs('api.schema', 'WARNING'):
+            content, _ = schema.load_schema('.json')
+        self.assertIn(b'/api/v1/catalogue/', content)
+        self.assertEqual((self.schema_dir / 'openapi.json').read_text(), '{}')
+        call_command('generate_schema', stdout=StringIO())
+        self.assertTrue(schema.schema_is_current(self.schema_dir))
+
+
+""" Startup profiling test case. """
+class StartupProfilingTestCase(SimpleTestCase):
+    def test_parse_import_times(self):
+        """Test `python -X importtime` output is parsed with nesting depth."""
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     django.utils.version\n"
+            "import time:      2046 |       2166 |   django\n"
+            "import time:     33219 |      35385 | server.wsgi\n"
+        )
+        self.assertEqual(parse_import_times(output), [
+            ("django.utils.version", 120, 120, 2),
+            ("django", 2046, 2166, 1),
+            ("server.wsgi", 33219, 35385, 0),
+        ])
+
+
+""" Bulk product import test case. """
+class ImportProductsTestCase(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = Path(tmp_dir.name)
+        self.existing = Product.objects.create(
+            name='Old Name', price=10.0, brand='Old Brand', code='taken-code')
+
+    def import_file(self, name, content, **options):
+        """Write content to a temporary file and import it."""
+        path = self.tmp_dir / name
+        path.write_text(content)
+        call_command('import_products', str(path), stdout=StringIO(), **options)
+        return path
+
+    def test_import_csv_upserts_by_sku(self):
+        """Test CSV rows create new products and update existing SKUs."""
+        new_sku = uuid.uuid4()
+        self.import_file('catalogue.csv', (
+            "sku,code,name,brand,price\n"
+            f"{self.existing.sku},,New Name,New Brand,20.50\n"
+            f"{new_sku},new-code,Created,Brand,5\n"
+            ",,Generated SKU,Brand,7\n"
+        ), chunk_size=2)
+
+        self.existing.refresh_from_db()
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(self.existing.name, 'New Name')
+        self.assertEqual(self.existing.price, Decimal('20.50'))
+        self.assertEqual(self.existing.version, 2)
+        self.assertEqual(Product.objects.get(sku=new_sku).code, 'new-code')
+        self.assertTrue(Product.objects.filter(name='Generated SKU').exists())
+
+    def test_import_keeps_fields_left_out(self):
+        """Test re-importing a product without its optional fields keeps them and records no price change."""
+        Product.objects.filter(sku=self.existing.sku).update(currency='EUR', attributes={'color': 'red'})
+        ProductPriceHistory.record([Product.objects.get(sku=self.existing.sku)], ProductPriceHistory.Source.UPDATE)
+        history = ProductPriceHistory.objects.filter(sku=self.existing.sku).count()
+        self.import_file('catalogue.csv', f"sku,name,brand,price\n{self.existing.sku},Old Name,Old Brand,10\n")
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.code, self.existing.currency, self.existing.attributes),
+                         ('taken-code', 'EUR', {'color': 'red'}))
+        self.assertEqual(self.existing.version, 1)
+        self.assertEqual(ProductPriceHistory.objects.filter(sku=self.existing.sku).count(), history)
+
+    def test_import_ndjson_rejects_invalid_rows(self):
+        """Test invalid rows are written to the rejects file and skipped."""
+        path = self.import_file('catalogue.ndjson', "\n".join([
+            json.dumps({"name": "Valid", "brand": "Brand", "price": "1.00"}),
+            json.dumps({"name": "Negative", "brand": "Brand", "price": "-1.00"}),
+            json.dumps({"name": "Missing brand", "price": "1.00"}),
+            json.dumps({"name": "Duplicate code", "brand": "Brand", "price": "1.00", "code": "taken-code"}),
+            "{not json",
+        ]) + "\n")
+
+        rejects = [json.loads(line) for line in Path(f"{path}.rejects.ndjson").read_text().splitlines()]
+        self.assertEqual([reject["line"] for reject in sorted(rejects, key=lambda r: r["line"])], [2, 3, 4, 5])
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertTrue(Product.objects.filter(name='Valid').exists())
+
+    def test_import_with_workers(self):
+        """Test chunks validated in worker processes are all committed."""
+        rows = "".join(
+            json.dumps({"name": f"Product {i}", "brand": "Brand", "price": "1.00"}) + "\n" for i in range(10))
+        path = self.import_file('catalogue.ndjson', rows + "{not json\n", chunk_size=3, workers=2)
+
+        self.assertEqual(Product.objects.count(), 11)
+        self.assertEqual(len(Path(f"{path}.rejects.ndjson").read_text().splitlines()), 1)
+        self.assertFalse(Path(f"{path}.checkpoint.json").exists())
+
+    def test_resume_skips_committed_chunks(self):
+        """Test --resume continues after the chunks recorded in the checkpoint."""
+        path = self.tmp_dir / 'catalogue.csv'
+        path.write_text("name,brand,price\nFirst,Brand,1\nSecond,Brand,2\nThird,Brand,3\n")
+        checkpoint = Checkpoint(f"{path}.checkpoint.json", str(path), 2)
+        checkpoint.state.update(chunks=1, processed=2, created=2)
+        checkpoint.save()
+
+        out = StringIO()
+        call_command('import_products', str(path), chunk_size=2, resume=True, stdout=out)
+
+        self.assertEqual(list(Product.objects.exclude(sku=self.existing.sku).values_list('name', flat=True)), ['Third'])
+        self.assertIn("Imported 3 of 3 rows", out.getvalue())
+        self.assertFalse(Path(checkpoint.path).exists())
+
+    def test_replayed_chunk_changes_nothing(self):
+        """Test a chunk committed but not checkpointed before a crash is replayed harmlessly."""
+        path = self.import_file('catalogue.ndjson', "\n".join([
+            json.dumps({"sku": str(self.existing.sku), "name": "Renamed", "brand": "Old Brand", "price": "12.00"}),
+            "{not json",
+        ]) + "\n")
+        rejects_path = Path(f"{path}.rejects.ndjson")
+        rejects = rejects_path.read_text()
+        # The crash left the checkpoint of a fresh import behind.
+        Checkpoint(f"{path}.checkpoint.json", str(path), 2000).save()
+
+        call_command('import_products', str(path), resume=True, stdout=StringIO())
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.version), ('Renamed', 2))
+        # The price it was created with and the imported one.
+        self.assertEqual(ProductPriceHistory.objects.filter(sku=self.existing.sku).count(), 2)
+        self.assertEqual(rejects_path.read_text(), rejects)
+
+    def test_validation_with_given_rates(self):
+        """Test rows validated against given exchange rates, as in workers, run no query."""
+        row = json.dumps({"name": "Priced", "brand": "Brand", "price": "1.00", "currency": "eur"})
+        with self.assertNumQueries(0):
+            records, rejects = validate_rows([(1, row), (2, row.replace("eur", "gbp"))],
+                                             exchange_rates={"USD": Decimal(1), "EUR": Decimal("0.9")})
+        self.assertEqual([record["currency"] for _, _, record in records], ["EUR"])
+        self.assertEqual([line for line, _, _ in rejects], [2])
+
+    def test_resume_rejects_mismatched_checkpoint(self):
+        """Test a checkpoint written with another chunk size is refused."""
+        path = self.tmp_dir / 'catalogue.csv'
+        path.write_text("name,brand,price\nFirst,Brand,1\n")
+        Checkpoint(f"{path}.checkpoint.json", str(path), 500).save()
+
+        with self.assertRaises(CommandError):
+            call_command('import_products', str(path), chunk_size=2, resume=True, stdout=StringIO())
+
+
+""" Read replica routing test case. """
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_MAX_LAG=5.0, REPLICA_LAG_CHECK_INTERVAL=60.0)
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        replicas.clear_lag_checks()
+        self.addCleanup(replicas.clear_lag_checks)
+        self.router = replicas.ReplicaRouter()
+
+    def in_context(self, func):
+        """Run func in a fresh context, so pinning does not leak between tests."""
+        return contextvars.Context().run(func)
+
+    def test_reads_go_to_fresh_replica(self):
+        """Test reads are routed to a replica within the allowed lag."""
+        with mock.patch.object(replicas, 'replica_lag', return_value=0.5):
+            self.assertEqual(self.in_context(lambda: self.router.db_for_read(Product)), 'replica1')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        """Test a replica that is too far behind, or unreachable, is skipped."""
+        for lag in (30.0, None):
+            replicas.clear_lag_checks()
+            with mock.patch.object(replicas, 'replica_lag', return_value=lag):
+                self.assertEqual(self.in_context(lambda: self.router.db_for_read(Product)), 'default')
+
+    def test_lag_is_checked_once_per_interval(self):
+        """Test the lag check result is reused within the check interval."""
+        with mock.patch.object(replicas, 'replica_lag', return_value=0.0) as replica_lag:
+            for _ in range(3):
+                self.in_context(lambda: self.router.db_for_read(Product))
+        self.assertEqual(replica_lag.call_count, 1)
+
+    def test_reads_after_write_go_to_primary(self):
+        """Test reads following a write in the same context use the primary."""
+        def write_then_read():
+            self.router.db_for_write(Product)
+            return self.router.db_for_read(Product)
+
+        with mock.patch.object(replicas, 'replica_lag', return_value=0.0):
+            self.assertEqual(self.in_context(write_then_read), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        """Test migrations only run on the primary."""
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'api'))
+
+
+""" Read replica request pinning test case. """
+class ReplicaReadTestCase(APITransactionTestCase):
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        replicas.clear_lag_checks()
+        self.addCleanup(replicas.clear_lag_checks)
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.product = Product.objects.create(name='Test Product', price=100.0, brand='Test Brand')
+
+    def authenticate(self):
+        """Authenticate the test client with the user's access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+    def test_catalogue_reads_from_replica(self):
+        """Test anonymous catalogue reads are served by the replica."""
+        with CaptureQueriesContext(connections['replica1']) as replica_queries:
+            response = self.client.get(reverse('list_products'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(replica_queries.captured_queries)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_reads_after_write_are_pinned_to_primary(self):
+        """Test a client that just wrote reads its write from the primary."""
+        self.authenticate()
+        response = self.client.put(
+            reverse('update_product', args=[self.product.sku]), {"name": "Renamed"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        with CaptureQueriesContext(connections['replica1']) as replica_queries:
+            response = self.client.get(reverse('product_detail', args=[self.product.sku]))
+
+        self.assertEqual(response.data['name'], 'Renamed')
+        self.assertEqual(replica_queries.captured_queries, [])
+
+
+""" Product table partitioning test case. """
+class ProductPartitioningTestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Coded', price=10.0, brand='Brand', code='coded')
+        self.other = Product.objects.create(name='Other', price=20.0, brand='Brand')
+
+    def assertDuplicateCodeRejected(self, code):
+        """Assert creating another product with the given code fails."""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.create(name='Duplicate', price=1.0, brand='Brand', code=code)
+
+    def test_repartition_keeps_rows_and_unique_codes(self):
+        """Test the table can be partitioned and back without losing rows or code uniqueness."""
+        repartition_product_table(connection, 4)
+        self.assertEqual(partition_count(connection), 4)
+        self.assertEqual(Product.objects.get(code='coded').sku, self.product.sku)
+        self.assertDuplicateCodeRejected('coded')
+
+        # Codes are released when changed or deleted.
+        Product.objects.filter(sku=self.product.sku).update(code='recoded')
+        Product.objects.create(name='Reuses code', price=1.0, brand='Brand', code='coded')
+        self.other.delete()
+        self.assertDuplicateCodeRejected('recoded')
+
+        repartition_product_table(connection, 0)
+        self.assertEqual(partition_count(connection), 0)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertDuplicateCodeRejected('recoded')
+
+    def test_partitioned_upsert(self):
+        """Test the importer's upsert by SKU works on the partitioned table."""
+        repartition_product_table(connection, 4)
+        record = {"sku": self.product.sku, "code": "coded", "name": "Renamed", "brand": "Brand", "price": Decimal('5.00')}
+        created, updated, rejects = write_records([(1, {}, record)])
+
+        self.assertEqual((created, updated, rejects), (0, 1, []))
+        self.assertEqual(Product.objects.get(sku=self.product.sku).name, 'Renamed')
+
+    def test_sku_lookup_scans_one_partition(self):
+        """Test lookups by SKU are pruned to a single partition."""
+        repartition_product_table(connection, 4)
+        plan = Product.objects.filter(sku=self.product.sku).explain()
+        self.assertEqual(plan.count(' on api_product_p'), 1)
+
+
+""" Catalogue count strategies test case. """
+class CatalogueCountTestCase(APITestCase):
+    def setUp(self):
+        Product.objects.create(name='Product 1', price=100.00, brand='Brand A')
+        Product.objects.create(name='Product 2', price=150.00, brand='Brand A')
+        Product.objects.create(name='Product 3', price=200.00, brand='Brand B')
+        self.url = reverse('list_products')
+
+    def bulk_create_products(self, count, brand='Brand C'):
+        """Create products without going through Product.save, as the importer does."""
+        Product.objects.bulk_create(
+            [Product(name=f'Bulk {i}', price=1.00, brand=brand) for i in range(count)])
+
+    def test_exact_count_by_default(self):
+        """Test the catalogue counts exactly unless configured otherwise."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response['X-Count-Strategy'], 'exact')
+
+    def test_cached_count(self):
+        """Test cached counts follow model writes and are served from the counter table."""
+        self.assertEqual(self.client.get(self.url + '?count=cached').data['count'], 3)
+        self.assertEqual(self.client.get(self.url + '?count=cached&brand=Brand A').data['count'], 2)
+
+        Product.objects.create(name='Product 4', price=1.00, brand='Brand A')
+        Product.objects.get(name='Product 3').delete()
+        self.bulk_create_products(5)
+
+        self.assertEqual(self.client.get(self.url + '?count=cached').data['count'], 3)
+        self.assertEqual(self.client.get(self.url + '?count=cached&brand=Brand A').data['count'], 3)
+        with override_settings(PRODUCT_COUNT_TTL=0):
+            self.assertEqual(self.client.get(self.url + '?count=cached').data['count'], 8)
+
+    def test_empty_brand_counts_match_results(self):
+        """Test an empty brand lists and counts every product with each strategy."""
+        for strategy in ['exact', 'cached']:
+            response = self.client.get(self.url + f'?count={strategy}&brand=')
+            self.assertEqual((response.data['count'], len(response.data['results'])), (3, 3), strategy)
+
+    def test_brand_change_moves_cached_count(self):
+        """Test changing a product's brand moves it between cached brand counts."""
+        ProductCount.refresh()
+        Product.objects.get(name='Product 3').apply_changes({'brand': 'Brand A'})
+
+        self.assertEqual(self.client.get(self.url + '?count=cached&brand=Brand A').data['count'], 3)
+        self.assertEqual(self.client.get(self.url + '?count=cached&brand=Brand B').data['count'], 0)
+        self.assertEqual(self.client.get(self.url + '?count=cached').data['count'], 3)
+
+    def test_approximate_count(self):
+        """Test approximate counts come from table statistics on large tables and are exact on small ones."""
+        response = self.client.get(self.url + '?count=approximate')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response['X-Count-Strategy'], 'approximate')
+
+        self.bulk_create_products(20)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE api_product')
+        Product.objects.filter(brand='Brand C').delete()
+        with mock.patch('api.models.APPROXIMATE_COUNT_MIN', 0):
+            self.assertEqual(self.client.get(self.url + '?count=approximate').data['count'], 23)
+
+    def test_pages_past_an_undercount(self):
+        """Test pages beyond a stale count are still served, with working next links."""
+        self.client.get(self.url + '?count=cached')
+        self.bulk_create_products(13)
+
+        response = self.client.get(self.url + '?count=cached&page_size=5&page=3')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(self.url + '?count=cached&page_size=5&page=4')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        response = self.client.get(self.url + '?count=cached&page_size=5&page=5')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_count_strategy(self):
+        """Test an unknown count strategy is rejected."""
+        response = self.client.get(self.url + '?count=guess')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_product_counts(self):
+        """Test the refresh command recounts the whole catalogue and every brand."""
+        self.bulk_create_products(2)
+        call_command('refresh_product_counts', stdout=StringIO())
+        counts = dict(ProductCount.objects.values_list('brand', 'count'))
+        self.assertEqual(counts, {'': 5, 'Brand A': 2, 'Brand B': 1, 'Brand C': 2})
+
+
+""" Response compression test case. """
+class CompressionTestCase(APITestCase):
+    def setUp(self):
+        for i in range(30):
+            Product.objects.create(name=f'Product {i}', price=10.0, brand='Brand')
+        self.url = reverse('list_products') + '?page_size=30'
+
+    def test_compresses_large_responses(self):
+        """Test large JSON responses are gzipped for clients that accept it."""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 30)
+
+    def test_no_compression_without_accept_encoding(self):
+        """Test clients that don't accept compression get plain responses."""
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(json.loads(response.content)['results']), 30)
+
+    def test_small_responses_are_not_compressed(self):
+        """Test responses under COMPRESSION_MIN_SIZE are sent as they are."""
+        product = Product.objects.first()
+        url = reverse('product_detail', args=[product.sku])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        with override_settings(COMPRESSION_MIN_SIZE=0):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'W/"{product.version}"')
+
+    def test_choose_encoding(self):
+        """Test encodings are negotiated by client quality, then server preference."""
+        encodings = ['zstd', 'br', 'gzip']
+        self.assertEqual(choose_encoding('gzip, br', encodings), 'br')
+        self.assertEqual(choose_encoding('gzip;q=1.0, br;q=0.5', encodings), 'gzip')
+        self.assertEqual(choose_encoding('*', encodings), 'zstd')
+        self.assertEqual(choose_encoding('*;q=0.1, gzip;q=0', encodings), 'zstd')
+        self.assertIsNone(choose_encoding('identity', encodings))
+        self.assertIsNone(choose_encoding('', encodings))
+
+
+""" Sparse fieldsets test case. """
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Product', price=10.0, brand='Brand', code='product')
+
+    def test_list_requested_fields(self):
+        """Test the catalogue returns and selects only the requested fields."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('list_products') + '?fields=short_sku,name,price')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['short_sku', 'name', 'price'])
+        page_query = queries.captured_queries[-1]['sql']
+        self.assertIn('"api_product"."price"', page_query)
+        self.assertNotIn('"api_product"."brand"', page_query)
+
+    def test_detail_requested_fields(self):
+        """Test product detail returns only the requested fields and keeps its ETag."""
+        response = self.client.get(reverse('product_detail', args=[self.product.sku]) + '?fields=sku,views')
+        self.assertEqual(response.data, {'sku': str(self.product.sku), 'views': 1})
+        self.assertEqual(response['ETag'], '"1"')
+
+    def test_unknown_fields(self):
+        """Test asking for fields the product does not have is rejected."""
+        response = self.client.get(reverse('product_detail', args=[self.product.sku]) + '?fields=sku,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('list_products') + '?fields=secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+""" Price history test case. """
+class PriceHistoryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.product = Product.objects.create(name='Product', price=10.0, brand='Brand')
+
+    def authenticate(self):
+        """Authenticate the test client with the user's access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+    def set_history(self, sku, prices):
+        """Replace the price history of a SKU with (price, effective_at) pairs."""
+        ProductPriceHistory.objects.filter(sku=sku).delete()
+        ProductPriceHistory.objects.bulk_create([
+            ProductPriceHistory(sku=sku, price=price, effective_at=effective_at, source=ProductPriceHistory.Source.UPDATE)
+            for price, effective_at in prices
+        ])
+
+    def test_price_changes_are_recorded(self):
+        """Test creating, repricing and importing products append to the history."""
+        self.authenticate()
+        url = reverse('update_product', args=[self.product.sku])
+        self.client.put(url, {"price": 12.5}, format='json')
+        self.client.put(url, {"name": "Renamed"}, format='json')
+        write_records([(1, {}, {"sku": self.product.sku, "code": None, "name": "Renamed", "brand": "Brand", "price": Decimal('15.00')})])
+        write_records([(1, {}, {"sku": self.product.sku, "code": None, "name": "Renamed", "brand": "Brand", "price": Decimal('15.00')})])
+
+        history = ProductPriceHistory.objects.filter(sku=self.product.sku).order_by('effective_at', 'id')
+        self.assertEqual(
+            [(entry.price, entry.get_source_display()) for entry in history],
+            [(Decimal('10.00'), 'Create'), (Decimal('12.50'), 'Update'), (Decimal('15.00'), 'Import')])
+
+    def test_currency_changes_are_recorded(self):
+        """Test a currency-only change is recorded and returned with the prices."""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        ExchangeRate.load({'EUR': Decimal('0.9')})
+        self.authenticate()
+        self.client.put(reverse('update_product', args=[self.product.sku]), {"currency": "EUR"}, format='json')
+        write_records([(1, {}, {"sku": self.product.sku, "code": None, "name": "Product", "brand": "Brand",
+                                "price": Decimal('10.00'), "currency": "USD"})])
+
+        response = self.client.get(reverse('v1:price_history', args=[self.product.sku]))
+        self.assertEqual([(entry['price'], entry['currency']) for entry in response.data],
+                         [('10.00', 'USD'), ('10.00', 'EUR'), ('10.00', 'USD')])
+        response = self.client.get(reverse('v1:prices_at'), {'skus': str(self.product.sku)})
+        self.assertEqual(response.data['prices'][0]['currency'], 'USD')
+
+    def test_price_series_for_range(self):
+        """Test the series starts with the price in effect at the start of the range."""
+        self.authenticate()
+        self.set_history(self.product.sku, [
+            (Decimal('10.00'), '2026-01-01T00:00:00Z'),
+            (Decimal('11.00'), '2026-02-01T00:00:00Z'),
+            (Decimal('12.00'), '2026-03-01T00:00:00Z'),
+            (Decimal('13.00'), '2026-04-01T00:00:00Z'),
+        ])
+        url = reverse('v1:price_history', args=[self.product.sku])
+
+        response = self.client.get(url, {'start': '2026-02-15T00:00:00Z', 'end': '2026-03-15T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['price'] for entry in response.data], ['11.00', '12.00'])
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 4)
+
+        response = self.client.get(url, {'start': '2026-03-15T00:00:00Z', 'end': '2026-02-15T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_prices_at_time_for_many_skus(self):
+        """Test looking up the prices of several SKUs at one time in a single query."""
+        self.authenticate()
+        other = Product.objects.create(name='Other', price=5.0, brand='Brand')
+        self.set_history(self.product.sku, [(Decimal('10.00'), '2026-01-01T00:00:00Z'), (Decimal('11.00'), '2026-02-01T00:00:00Z')])
+        self.set_history(other.sku, [(Decimal('5.00'), '2026-01-20T00:00:00Z')])
+        unknown = uuid.uuid4()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('v1:prices_at'), {
+                'skus': f'{self.product.sku},{encode_sku(other.sku)},{unknown}',
+                'at': '2026-01-15T00:00:00Z',
+            })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['price'] for entry in response.data['prices']], ['10.00', None, None])
+        self.assertEqual(response.data['prices'][1]['sku'], str(other.sku))
+        self.assertEqual(sum('api_productpricehistory' in query['sql'] for query in queries.captured_queries), 1)
+
+    def test_prices_recorded_at_the_same_time(self):
+        """Test the last recorded of the prices sharing an effective time is the one in effect."""
+        self.authenticate()
+        self.set_history(self.product.sku, [
+            (Decimal('11.00'), '2026-01-01T00:00:00Z'),
+            (Decimal('12.00'), '2026-01-01T00:00:00Z'),
+            (Decimal('13.00'), '2026-02-01T00:00:00Z'),
+        ])
+
+        response = self.client.get(reverse('v1:prices_at'), {'skus': str(self.product.sku), 'at': '2026-01-15T00:00:00Z'})
+        self.assertEqual(response.data['prices'][0]['price'], '12.00')
+        response = self.client.get(reverse('v1:price_history', args=[self.product.sku]), {'start': '2026-01-15T00:00:00Z'})
+        self.assertEqual([entry['price'] for entry in response.data], ['12.00', '13.00'])
+
+    def test_prices_at_requires_valid_skus(self):
+        """Test malformed or missing SKUs are rejected."""
+        self.authenticate()
+        self.assertEqual(self.client.get(reverse('v1:prices_at')).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('v1:prices_at'), {'skus': 'not-a-sku!'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_price_history_requires_authentication(self):
+        """Test price history is only available to authenticated users."""
+        response = self.client.get(reverse('v1:price_history', args=[self.product.sku]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+""" Soft delete and purge test case. """
+class SoftDeleteTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.product = Product.objects.create(code='ABC', name='Product', price=10.0, brand='Brand')
+
+    def authenticate(self):
+        """Authenticate the test client with the user's access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+    def test_deleted_product_is_hidden(self):
+        """Test a deleted product is kept but no longer served, and its code can be reused."""
+        self.authenticate()
+        response = self.client.delete(reverse('delete_product', args=[self.product.sku]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        deleted = Product.all_objects.get(sku=self.product.sku)
+        self.assertIsNotNone(deleted.deleted_at)
+        self.assertIsNone(deleted.code)
+        self.assertEqual(self.client.get(reverse('product_detail', args=[self.product.sku])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('list_products')).data['count'], 0)
+        self.assertEqual(self.client.delete(reverse('delete_product', args=[self.product.sku])).status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post(reverse('create_product'), {"code": "ABC", "name": "New", "price": 5.0, "brand": "Brand"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_delete(self):
+        """Test deleting several products in one request reports the SKUs not found."""
+        self.authenticate()
+        other = Product.objects.create(name='Other', price=5.0, brand='Other')
+        kept = Product.objects.create(name='Kept', price=5.0, brand='Brand')
+        unknown = uuid.uuid4()
+        ProductCount.refresh()
+
+        response = self.client.post(
+            reverse('v1:delete_products'), {"skus": [str(self.product.sku), encode_sku(other.sku), str(unknown)]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"deleted": 2, "not_found": [str(unknown)]})
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), [kept.sku])
+        self.assertEqual(ProductCount.objects.get(brand='Brand').count, 1)
+        self.assertEqual(ProductCount.objects.get(brand='Other').count, 0)
+        self.assertEqual(ProductCount.objects.get(brand='').count, 1)
+
+    def test_bulk_delete_validation(self):
+        """Test bulk deletes need authentication and a list of valid SKUs."""
+        url = reverse('v1:delete_products')
+        self.assertEqual(self.client.post(url, {"skus": [str(self.product.sku)]}, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.authenticate()
+        self.assertEqual(self.client.post(url, {"skus": []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(url, {"skus": ["not-a-sku!"]}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Product.objects.filter(sku=self.product.sku).exists())
+
+    def test_purge_in_batches(self):
+        """Test the purge hard deletes old soft-deleted products only, batch by batch."""
+        products = [Product.objects.create(name=f'Product {i}', price=1.0, brand='Brand') for i in range(5)]
+        Product.soft_delete([product.sku for product in products])
+        Product.all_objects.filter(sku__in=[product.sku for product in products[:4]]).update(
+            deleted_at=timezone.now() - timedelta(days=40))
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_products', batch_size=3, pause=0, stdout=StringIO())
+
+        self.assertEqual(Product.all_objects.filter(sku__in=[product.sku for product in products]).count(), 1)
+        self.assertTrue(Product.objects.filter(sku=self.product.sku).exists())
+        self.assertEqual(sum(query['sql'].startswith('DELETE FROM "api_product"') for query in queries.captured_queries), 2)
+
+    def test_import_restores_deleted_product(self):
+        """Test importing the SKU of a deleted product brings it back."""
+        self.product.delete()
+        write_records([(1, {}, {"sku": self.product.sku, "code": None, "name": "Back", "brand": "Brand", "price": Decimal('10.00')})])
+        self.assertEqual(Product.objects.get(sku=self.product.sku).name, 'Back')
+
+
+""" Catalogue facets test case. """
+class CatalogueFacetsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for brand, price in [('Acme', 10), ('Acme', 20), ('Acme', 30), ('Other', 50), ('Other', 110)]:
+            Product.objects.create(name='Product', price=price, brand=brand)
+
+    def test_facets(self):
+        """Test brand counts, price bounds and the histogram of the catalogue."""
+        response = self.client.get(reverse('v1:catalogue_facets'), {'buckets': 4})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['brands'], [{'brand': 'Acme', 'count': 3}, {'brand': 'Other', 'count': 2}])
+        self.assertEqual((response.data['price']['min'], response.data['price']['max']), ('10.00', '110.00'))
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in response.data['price']['buckets']],
+            [('10.00', '35.00', 3), ('35.00', '60.00', 1), ('60.00', '85.00', 0), ('85.00', '110.00', 1)])
+
+    def test_brand_prices(self):
+        """Test the price facets can be limited to one brand."""
+        response = self.client.get(reverse('v1:catalogue_facets'), {'brand': 'Other', 'buckets': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['price']['buckets'], [{'min': '50.00', 'max': '110.00', 'count': 2}])
+        self.assertEqual(len(response.data['brands']), 2)
+
+        response = self.client.get(reverse('v1:catalogue_facets'), {'brand': 'Missing'})
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['price'], {'currency': 'USD', 'min': None, 'max': None, 'buckets': []})
+
+    def test_prices_in_base_currency(self):
+        """Test facet prices are converted to BASE_CURRENCY, leaving out currencies without a rate."""
+        ExchangeRate.load({'EUR': Decimal('0.5')})
+        Product.objects.create(name='Product', price=100, brand='Euro', currency='EUR')
+        Product.objects.create(name='Product', price=1, brand='Euro', currency='MXN')
+        response = self.client.get(reverse('v1:catalogue_facets'), {'brand': 'Euro', 'buckets': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['price'], {
+            'currency': 'USD', 'min': '200.00', 'max': '200.00',
+            'buckets': [{'min': '200.00', 'max': '200.00', 'count': 1}]})
+
+        # Updating the rates invalidates the facets.
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.load({'EUR': Decimal('0.8')})
+        response = self.client.get(reverse('v1:catalogue_facets'))
+        self.assertEqual(response.data['price']['max'], '125.00')
+
+    def test_imported_chunk_invalidates(self):
+        """Test every committed import chunk invalidates the facets, not only the end of the import."""
+        url = reverse('v1:catalogue_facets')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            write_records([(1, {}, {"sku": uuid.uuid4(), "code": None, "name": "Imported", "brand": "Imported",
+                                    "price": Decimal('1.00')})])
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(response.data['price']['min'], '1.00')
+
+    def test_facets_are_cached_until_a_write(self):
+        """Test facets come from the cache and are recomputed after a product write."""
+        url = reverse('v1:catalogue_facets')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Product', price=5, brand='New')
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(response.data['price']['min'], '5.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(brand='New').delete()
+        self.assertEqual(self.client.get(url).data['count'], 5)
+
+    def test_invalid_buckets(self):
+        """Test the number of buckets is validated."""
+        for buckets in ('0', '51', 'many'):
+            response = self.client.get(reverse('v1:catalogue_facets'), {'buckets': buckets})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+""" Batch product lookup test case. """
+class ProductBatchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.products = [Product.objects.create(name=f'Product {i}', price=10.0, brand='Brand') for i in range(3)]
+
+    def authenticate(self):
+        """Authenticate the test client with the user's access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+    def test_products_in_request_order(self):
+        """Test products come back in request order, with misses marked, from one product query."""
+        first, second, third = self.products
+        unknown = uuid.uuid4()
+        self.authenticate()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('v1:product_batch'), {
+                'skus': f'{third.sku},{unknown},{encode_sku(first.sku)},{third.sku}'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [product and product['name'] for product in response.data['products']],
+            ['Product 2', None, 'Product 0', 'Product 2'])
+        self.assertEqual(response.data['not_found'], [str(unknown)])
+        self.assertEqual(sum('"api_product"' in query['sql'] for query in queries.captured_queries), 1)
+
+    def test_anonymous_views_recorded_in_one_update(self):
+        """Test anonymous lookups count one view per product with a single UPDATE."""
+        skus = ','.join(str(product.sku) for product in self.products)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('v1:product_batch'), {'skus': skus})
+
+        self.assertEqual([product['views'] for product in response.data['products']], [1, 1, 1])
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+        self.assertEqual(list(Product.objects.values_list('views', flat=True).distinct()), [1])
+
+        self.client.get(reverse('v1:product_batch'), {'skus': skus, 'record_views': 'false'})
+        self.assertEqual(list(Product.objects.values_list('views', flat=True).distinct()), [1])
+
+    def test_sparse_fields(self):
+        """Test the batch lookup honours ?fields."""
+        response = self.client.get(reverse('v1:product_batch'), {'skus': str(self.products[0].sku), 'fields': 'sku,price'})
+        self.assertEqual(response.data['products'], [{'sku': str(self.products[0].sku), 'price': '10.00'}])
+
+    @override_settings(PRODUCT_BATCH_MAX_SIZE=2)
+    def test_batch_size_limit(self):
+        """Test batches larger than PRODUCT_BATCH_MAX_SIZE or with bad SKUs are rejected."""
+        url = reverse('v1:product_batch')
+        skus = ','.join(str(product.sku) for product in self.products)
+        self.assertEqual(self.client.get(url, {'skus': skus}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'skus': 'not-a-sku!'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def throttle_rates(**rates):
+    """Override the throttle rates for a test."""
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+""" Rate limiting test case. """
+class ThrottlingTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.now = 1_000_000.0
+        timer = mock.patch.object(TokenBucketThrottle, 'timer', side_effect=lambda: self.now)
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def authenticate(self):
+        """Authenticate the test client with the user's access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+    @throttle_rates(anon_read='3/min')
+    def test_anonymous_reads_limited(self):
+        """Test a client gets its burst, then 429 with Retry-After and RateLimit headers."""
+        url = reverse('list_products')
+        responses = [self.client.get(url) for _ in range(4)]
+
+        self.assertEqual([response.status_code for response in responses[:3]], [200, 200, 200])
+        self.assertEqual([response['RateLimit-Remaining'] for response in responses], ['2', '1', '0', '0'])
+        self.assertEqual(responses[0]['RateLimit-Limit'], '3')
+        self.assertEqual(responses[2]['RateLimit-Reset'], '60')
+        self.assertEqual(responses[3].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(responses[3]['Retry-After'], '20')
+
+    @throttle_rates(anon_read='3/min')
+    def test_tokens_refill(self):
+        """Test tokens come back at the configured rate."""
+        url = reverse('list_products')
+        for _ in range(3):
+            self.client.get(url)
+        self.now += 19
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.now += 1
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(anon_read='1/min', user_read='2/min', write='1/min')
+    def test_buckets_per_client_and_scope(self):
+        """Test IPs, users and read/write budgets are limited independently."""
+        url = reverse('list_products')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_200_OK)
+
+        self.authenticate()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url)['RateLimit-Limit'], '2')
+        create = reverse('create_product')
+        product = {"name": "Product", "price": 1.0, "brand": "Brand"}
+        self.assertEqual(self.client.post(create, product, format='json').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(create, product, format='json').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(auth='2/min')
+    def test_login_has_its_own_budget(self):
+        """Test login attempts are limited per IP by the auth budget only."""
+        url = reverse('login')
+        for _ in range(2):
+            response = self.client.post(url, {"username": "admin", "password": "wrong"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(url, {"username": "admin", "password": "admin"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(reverse('list_products')).status_code, status.HTTP_200_OK)
+
+
+""" Refresh token revocation test case. """
+class TokenRevocationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.refresh = RefreshToken.for_user(self.user)
+        # Issued a second earlier, so revoking the user's tokens now covers it.
+        self.refresh['iat'] -= 1
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def refresh_status(self, token):
+        """Refresh the given token and return the response status."""
+        return self.client.post(reverse('refresh_token'), {"refresh": str(token)}, format='json').status_code
+
+    def test_logout_revokes_refresh_token(self):
+        """Test a logged out refresh token can't be refreshed, other tokens can."""
+        other = RefreshToken.for_user(self.user)
+        response = self.client.post(reverse('v1:logout'), {"refresh": str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.refresh_status(self.refresh), status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.refresh_status(other), status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('v1:logout'), {"refresh": "garbage"}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_unrevoked_refresh_skips_database(self):
+        """Test refreshing a token the filter has never seen runs no query."""
+        self.client.credentials()
+        revocation.sync(force=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh_status(self.refresh), status.HTTP_200_OK)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_password_change_revokes_user_tokens(self):
+        """Test changing a password revokes the refresh tokens issued before."""
+        response = self.client.put(reverse('update_admin_user', args=[self.user.id]), {"password": "new"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh_status(self.refresh), status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('login'), {"username": "admin", "password": "new"}, format='json')
+        self.assertEqual(self.refresh_status(response.data['refresh']), status.HTTP_200_OK)
+
+    def test_token_issued_in_revocation_second_revoked(self):
+        """Test a token issued in the same second as the revocation of the user's tokens is revoked."""
+        token = RefreshToken.for_user(self.user)
+        # Revoked half a second into the second the token was issued in.
+        revoked_at = datetime.fromtimestamp(token['iat'] + 0.5, tz=dt_timezone.utc)
+        with mock.patch.object(revocation.timezone, 'now', return_value=revoked_at):
+            revocation.revoke_user_tokens(self.user.id)
+        self.assertTrue(revocation.is_revoked(token))
+        # A login later in that second gets a token stamped with its precise issue time.
+        with mock.patch.object(revocation.timezone, 'now', return_value=revoked_at + timedelta(milliseconds=100)):
+            self.assertFalse(revocation.is_revoked(revocation.token_for_user(self.user)))
+
+    def test_deleted_user_tokens_revoked(self):
+        """Test deleting an admin revokes their refresh tokens."""
+        other = User.objects.create_user(username='other', password='other', email="other@test.com")
+        token = RefreshToken.for_user(other)
+        token['iat'] -= 1
+        self.client.delete(reverse('delete_admin_user', args=[other.id]))
+        self.assertEqual(self.refresh_status(token), status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.refresh_status(self.refresh), status.HTTP_200_OK)
+
+    def test_other_workers_sync(self):
+        """Test a worker whose filter predates a revocation picks it up from the cache generation."""
+        revocation.sync(force=True)
+        revocation.revoke_token(self.refresh)
+        # Another worker: same cache, a filter built before the revocation.
+        with mock.patch.object(revocation, '_filter', revocation.BloomFilter(1000)):
+            self.assertTrue(revocation.is_revoked(self.refresh))
+
+    def test_bloom_filter(self):
+        """Test the filter has no false negatives and about the configured false positives."""
+        bloom = revocation.BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti:{i}')
+        self.assertTrue(all(f'jti:{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other:{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+""" Read coalescing test case. """
+class CoalescingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        # Writes of earlier tests pin the main context to the primary.
+        token = replicas._pinned.set(False)
+        self.addCleanup(replicas._pinned.reset, token)
+        self.now = 0.0
+        timer = mock.patch.object(SingleFlight, 'timer', side_effect=lambda: self.now)
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def test_concurrent_calls_share_one_query(self):
+        """Test callers asking for a key in flight wait for its result instead of running it."""
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def query():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.flight.do('key', query)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(self.flight.do('key', query))) for _ in range(5)]
+        for follower in followers:
+            follower.start()
+        while self.flight.stats['coalesced'] < 5:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(results, ['result'] * 6)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(dict(self.flight.stats), {'queries': 1, 'coalesced': 5})
+        self.assertEqual(self.flight.do('key', lambda: 'again'), 'again')
+
+    def test_errors_reach_every_caller(self):
+        """Test a failing query raises for its caller and is not kept."""
+        def query():
+            raise Product.DoesNotExist()
+
+        with self.assertRaises(Product.DoesNotExist):
+            self.flight.do('key', query)
+        self.assertEqual(self.flight.do('key', lambda: 'found'), 'found')
+
+    @override_settings(COALESCE_FRESH_SECONDS=1, COALESCE_STALE_SECONDS=10)
+    def test_stale_while_revalidate(self):
+        """Test fresh results are reused, then served stale while refreshed in the background."""
+        refreshed = threading.Event()
+
+        def query(value):
+            refreshed.set()
+            return value
+
+        self.assertEqual(self.flight.do('key', lambda: query('v1')), 'v1')
+        self.now = 0.5
+        self.assertEqual(self.flight.do('key', lambda: query('v2')), 'v1')
+
+        refreshed.clear()
+        self.now = 5
+        with mock.patch('api.coalescing.connections'):
+            self.assertEqual(self.flight.do('key', lambda: query('v2')), 'v1')
+            refreshed.wait(5)
+            while self.flight._calls:
+                time.sleep(0.001)
+        self.assertEqual(self.flight.do('key', lambda: query('v3')), 'v2')
+
+        self.now = 100
+        self.assertEqual(self.flight.do('key', lambda: query('v4')), 'v4')
+        self.assertEqual(
+            dict(self.flight.stats), {'queries': 2, 'fresh': 2, 'stale': 1, 'refreshes': 1})
+
+    @override_settings(COALESCE_FRESH_SECONDS=60)
+    def test_pinned_requests_bypass(self):
+        """Test requests pinned to the primary after a write always run their query."""
+        self.flight.do('key', lambda: 'old')
+
+        def pinned():
+            replicas.pin_to_primary()
+            return self.flight.do('key', lambda: 'new')
+
+        self.assertEqual(contextvars.Context().run(pinned), 'new')
+
+
+""" Read coalescing in views test case. """
+class CoalescedReadsTestCase(APITestCase):
+    def setUp(self):
+        reads.clear()
+        self.addCleanup(reads.clear)
+        self.product = Product.objects.create(name='Product', price=10.0, brand='Brand')
+
+    @override_settings(COALESCE_FRESH_SECONDS=60)
+    def test_views_reuse_results(self):
+        """Test product and catalogue reads reuse recent results, views still counted per request."""
+        url = reverse('product_detail', args=[self.product.sku])
+        self.client.get(url)
+        self.client.get(reverse('list_products'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(reverse('list_products')).data['count'], 1)
+
+        self.assertEqual(response.data['views'], 1)
+        self.assertEqual([query['sql'].split()[0] for query in queries.captured_queries], ['UPDATE'])
+        self.assertEqual(Product.objects.get(sku=self.product.sku).views, 2)
+        self.assertEqual(reads.stats['fresh'], 2)
+
+    def test_metrics(self):
+        """Test the worker's coalescing counters are exposed to admins."""
+        user = User.objects.create_user(username='admin', password='admin', email="admin@test.com")
+        self.client.get(reverse('product_detail', args=[self.product.sku]))
+        self.assertEqual(self.client.get(reverse('v1:coalescing_metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        response = self.client.get(reverse('v1:coalescing_metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['queries'], 1)
+        self.assertEqual(response.data['coalesced'], 0)
+
+
+""" Cache warming test case. """
+class CacheWarmingTestCase(APITransactionTestCase):
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for i in range(3):
+            Product.objects.create(name=f'Product {i}', price=10.0 + i, brand='Brand', views=i)
+
+    def test_warm_cache(self):
+        """Test every task runs and the facets end up in the cache."""
+        out = StringIO()
+        call_command('warm_cache', pages=2, top=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("catalogue: 3 products on the first 2 pages of 3", output)
+        self.assertIn("top_products: 2 most viewed products", output)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(CatalogueFacets.get()['count'], 3)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_time_budget(self):
+        """Test tasks still running when the budget is spent are reported as timed out."""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        tasks = {'slow': lambda **options: release.wait(5), 'facets': warming.warm_facets}
+        with mock.patch.dict(warming.TASKS, tasks, clear=True):
+            results = {task: outcome for task, outcome, _ in warming.warm(budget=0.5)}
+        self.assertEqual(results, {'slow': "timed out", 'facets': "catalogue facets"})
+
+    def test_worker_warming(self):
+        """Test a worker warms in the background once per process, on its first request."""
+        self.addCleanup(setattr, warming, '_started_in', None)
+        with mock.patch('api.warming.threading.Thread') as thread:
+            warming.warm_on_startup()
+            warming.warm_on_startup()
+            thread.assert_called_once_with(target=warming.warm, kwargs={'in_worker': True}, name='warm_cache', daemon=True)
+            # A forked worker warms again.
+            with mock.patch('api.warming.os.getpid', return_value=os.getpid() + 1):
+                warming.warm_on_startup()
+        self.assertEqual(thread.call_count, 2)
+
+        results = {task: outcome for task, outcome, _ in warming.warm(in_worker=True)}
+        self.assertTrue(results['worker'].startswith("worker state"))
+
+    def test_startup_warming_hook(self):
+        """Test the warming receiver is only connected when enabled, and not on import."""
+        receivers = len(request_started.receivers)
+        apps.get_app_config('api').ready()
+        self.assertEqual(len(request_started.receivers), receivers)
+        with override_settings(WARM_CACHE_ON_STARTUP=True):
+            apps.get_app_config('api').ready()
+            apps.get_app_config('api').ready()
+        self.addCleanup(request_started.disconnect, dispatch_uid="api.warming.warm_on_startup")
+        self.assertEqual(len(request_started.receivers), receivers + 1)
+
+    def test_import_warms(self):
+        """Test a bulk import warms the caches unless told not to."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'products.ndjson'
+            path.write_text(json.dumps({"name": "Imported", "brand": "Brand", "price": "1.00"}) + "\n")
+            with mock.patch('api.management.commands.import_products.warm', return_value=[]) as warm:
+                call_command('import_products', str(path), stdout=StringIO())
+                call_command('import_products', str(path), warm=False, stdout=StringIO())
+        warm.assert_called_once_with()
+
+
+""" Product events test case. """
+@override_settings(EVENTS_HEARTBEAT=60, EVENTS_QUEUE_SIZE=100, EVENTS_BUFFER_SIZE=1000)
+class ProductEventsTestCase(APITestCase):
+    def setUp(self):
+        self.broker = events.LocalBroker()
+        patcher = mock.patch.object(events, '_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+
+    def test_writes_publish_on_commit(self):
+        """Test product writes publish their event once committed."""
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Product', price=10.0, brand='Brand')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.apply_changes({'price': Decimal('12.00')})
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+
+        buffered = list(self.broker._buffer)
+        self.assertEqual([event.type for event in buffered], ['product.created', 'product.updated', 'products.deleted'])
+        self.assertEqual([event.id for event in buffered], [1, 2, 3])
+        self.assertIn(f'"sku": "{product.sku}"', buffered[0].encode().decode())
+        self.assertIn('"changes": {"price": "12.00"}', buffered[1].encode().decode())
+
+    def test_resume_from_last_event_id(self):
+        """Test a resuming client gets the events it missed, or a resync once they left the buffer."""
+        with override_settings(EVENTS_BUFFER_SIZE=3):
+            broker = events.LocalBroker()
+        for i in range(5):
+            broker._publish('product.updated', {"i": i})
+        subscriber = mock.Mock()
+
+        self.assertEqual(broker.subscribe(subscriber), [])
+        self.assertEqual([event.id for event in broker.subscribe(subscriber, last_event_id=3)], [4, 5])
+        self.assertEqual([event.id for event in broker.subscribe(subscriber, last_event_id=2)], [3, 4, 5])
+        missed = broker.subscribe(subscriber, last_event_id=1)
+        self.assertEqual([event.type for event in missed], ['resync', 'product.updated', 'product.updated', 'product.updated'])
+
+        # Ids of the postgres broker are timestamps, not consecutive.
+        with override_settings(EVENTS_BUFFER_SIZE=3):
+            broker = events.LocalBroker()
+        for event_id in (100, 250, 400, 900):
+            broker.deliver(events.Event(event_id, 'product.updated', {}))
+        self.assertEqual([event.id for event in broker.subscribe(subscriber, last_event_id=100)], [250, 400, 900])
+        self.assertEqual(broker.subscribe(subscriber, last_event_id=99)[0], events.RESYNC)
+
+    def test_resync_after_gap(self):
+        """Test events possibly missed tell resuming clients and connected streams to resync."""
+        self.broker.deliver(events.Event(100, 'product.updated', {}))
+        subscriber = mock.Mock()
+        self.broker.subscribe(subscriber)
+        self.broker.resync(200)
+        subscriber.put.assert_called_once_with(events.RESYNC)
+        self.broker.deliver(events.Event(300, 'product.updated', {}))
+        self.assertEqual([event.id for event in self.broker.subscribe(subscriber, last_event_id=100)], [0, 300])
+        self.assertEqual([event.id for event in self.broker.subscribe(subscriber, last_event_id=200)], [300])
+
+    def test_postgres_listener_reconnect(self):
+        """Test the postgres broker resyncs clients after its listener reconnects."""
+        import psycopg
+
+        class Stop(Exception):
+            pass
+
+        def listener(lost, notifies, error):
+            def receive():
+                for event_id in notifies:
+                    yield mock.Mock(payload=json.dumps({"id": event_id, "type": "product.updated", "data": {}}))
+                raise error
+            connection = mock.MagicMock()
+            connection.__enter__.return_value = connection
+            connection.execute.return_value.fetchone.return_value = (lost,)
+            connection.notifies = receive
+            return connection
+
+        broker = events.PostgresBroker()
+        # Subscribed without starting the listener thread, run below.
+        subscribe = partial(events.LocalBroker.subscribe, broker)
+        subscriber = mock.Mock()
+        self.assertEqual(subscribe(subscriber, last_event_id=50), [events.RESYNC])
+        connections_made = [listener(100, [150], psycopg.OperationalError()), listener(300, [400], Stop())]
+        with mock.patch('psycopg.connect', side_effect=connections_made), mock.patch('time.sleep'):
+            with self.assertRaises(Stop):
+                broker._listen()
+
+        self.assertEqual([call.args[0].id for call in subscriber.put.call_args_list], [150, 0, 400])
+        self.assertEqual([event.id for event in subscribe(subscriber, last_event_id=150)], [0, 400])
+        self.assertEqual([event.id for event in subscribe(subscriber, last_event_id=300)], [400])
+
+    def test_postgres_payload_limit(self):
+        """Test a bulk delete of 500 SKUs is published through postgres in notifications it accepts."""
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=1, brand='Brand') for i in range(500)])
+        skus = [product.sku for product in products]
+        update = {"sku": str(skus[0]), "changes": {"attributes": {f"key_{i}": "x" * 200 for i in range(50)}}}
+        self.assertEqual(json.loads(events.payloads(update)[0]), {"sku": str(skus[0]), "truncated": True})
+
+        with mock.patch.object(events, '_broker', events.PostgresBroker()), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(Product.soft_delete(skus)), 500)
+        notifies = [query['sql'] for query in queries.captured_queries if 'pg_notify' in query['sql']]
+        self.assertGreater(len(notifies), 1)
+        published = [sku for payload in events.payloads({"skus": skus}) for sku in json.loads(payload)['skus']]
+        self.assertEqual(published, [str(sku) for sku in skus])
+
+    def test_failed_publish_keeps_the_write(self):
+        """Test a notification postgres refuses is logged without rolling back the write."""
+        product = Product.objects.create(name='Product', price=1, brand='Brand')
+        with mock.patch.object(events, '_broker', events.PostgresBroker()), \
+                mock.patch.object(events, 'MAX_PAYLOAD', 100_000), self.assertLogs('api.events', 'ERROR'):
+            self.assertTrue(product.apply_changes({"attributes": {f"key_{i}": "x" * 200 for i in range(50)}}))
+        product.refresh_from_db()
+        self.assertEqual(len(product.attributes), 50)
+
+    def test_slow_client_disconnected(self):
+        """Test a stream whose queue fills up ends, so the client resumes instead of lagging."""
+        with override_settings(EVENTS_QUEUE_SIZE=2):
+            stream = events.stream_sync(broker=self.broker)
+            next(stream)
+        for i in range(3):
+            self.broker._publish('product.updated', {"i": i})
+        self.assertEqual(list(stream), [])
+        self.assertEqual(self.broker.subscribers, 0)
+
+    def test_idle_streams(self):
+        """Test thousands of idle streams are served without a thread each and all get the next event."""
+        async def listen(count):
+            streams = [events.stream_async(broker=self.broker) for _ in range(count)]
+            for stream in streams:
+                await anext(stream)
+            waiting = [asyncio.ensure_future(anext(stream)) for stream in streams]
+            await asyncio.sleep(0)
+            threads = threading.active_count()
+            started = time.perf_counter()
+            # Published from another thread, as a committing request would.
+            publisher = threading.Thread(target=self.broker._publish, args=('product.created', {"sku": "x"}))
+            publisher.start()
+            received = await asyncio.gather(*waiting)
+            publisher.join()
+            elapsed = time.perf_counter() - started
+            for stream in streams:
+                await stream.aclose()
+            return received, threads, elapsed
+
+        received, threads, elapsed = asyncio.run(listen(2000))
+        self.assertEqual(threads, threading.active_count())
+        self.assertEqual(set(received), {self.broker._buffer[0].encode()})
+        self.assertEqual(len(received), 2000)
+        self.assertEqual(self.broker.subscribers, 0)
+        self.assertLess(elapsed, 5)
+
+    def test_stream_requires_authentication(self):
+        """Test the stream rejects requests without a valid access token."""
+        url = reverse('v1:product_events')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(url, {'access_token': 'invalid'}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stream(self):
+        """Test the stream sends the retry delay and the events missed since Last-Event-ID."""
+        self.broker._publish('product.created', {"sku": "x"})
+        response = self.client.get(
+            reverse('v1:product_events'), {'access_token': self.access_token}, HTTP_LAST_EVENT_ID='0')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertEqual(next(content), b"retry: 3000\n\n")
+        self.assertEqual(next(content), b'id: 1\nevent: product.created\ndata: {"sku": "x"}\n\n')
+        response._iterator.close()
+        self.assertEqual(self.broker.subscribers, 0)
+
+    async def test_stream_asgi(self):
+        """Test the stream is served by a coroutine under ASGI."""
+        response = await AsyncClient().get(
+            reverse('v1:product_events'), headers={'Authorization': f'Bearer {self.access_token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        content = response.streaming_content
+        self.assertEqual(await anext(content), b"retry: 3000\n\n")
+        waiting = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        self.broker._publish('product.updated', {"sku": "x"})
+        self.assertEqual(await waiting, b'id: 1\nevent: product.updated\ndata: {"sku": "x"}\n\n')
+
+        # The ASGI handler cancels the stream when the client disconnects.
+        waiting = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(self.broker.subscribers, 0)
+
+
+""" Multi-currency pricing test case. """
+class MultiCurrencyTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        ExchangeRate.load({'EUR': Decimal('0.9'), 'JPY': Decimal('150.5')})
+        self.usd = Product.objects.create(name='Dollars', price=10.0, brand='Brand')
+        self.eur = Product.objects.create(name='Euros', price=Decimal('9.99'), brand='Brand', currency='EUR')
+
+    def test_convert(self):
+        """Test prices are converted from their own currency and rounded half up to the target's minor unit."""
+        products = [
+            {"price": "10.00", "currency": "USD"},
+            {"price": "9.99", "currency": "EUR"},
+            {"price": "0.05", "currency": "EUR"},
+            {"name": "No price"},
+            None,
+        ]
+        ExchangeRate.convert(products, 'USD')
+        self.assertEqual(products[:3], [
+            {"price": "10.00", "currency": "USD"},
+            {"price": "11.10", "currency": "USD"},
+            {"price": "0.06", "currency": "USD"},
+        ])
+        self.assertEqual(ExchangeRate.convert([{"price": "9.99", "currency": "EUR"}], 'JPY'), [
+            {"price": "1671", "currency": "JPY"},
+        ])
+
+    def test_catalogue_in_currency(self):
+        """Test a catalogue page is converted without extra queries once the rates are cached."""
+        url = reverse('list_products')
+        self.client.get(url, {'currency': 'eur'})
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as converted:
+            response = self.client.get(url, {'currency': 'eur'})
+        self.assertEqual(len(converted.captured_queries), len(plain.captured_queries))
+        prices = {product['name']: (product['price'], product['currency']) for product in response.data['results']}
+        self.assertEqual(prices, {'Dollars': ('9.00', 'EUR'), 'Euros': ('9.99', 'EUR')})
+
+        response = self.client.get(url, {'currency': 'USD', 'fields': 'name,price'})
+        self.assertEqual({product['name']: product['price'] for product in response.data['results']},
+                         {'Dollars': '10.00', 'Euros': '11.10'})
+
+    def test_catalogue_with_missing_rate(self):
+        """Test products priced in a currency without a rate keep their own price instead of failing the page."""
+        Product.objects.create(name='Pesos', price=Decimal('180.00'), brand='Brand', currency='MXN')
+        with self.assertLogs('api.exchange_rates', 'ERROR'):
+            response = self.client.get(reverse('list_products'), {'currency': 'EUR'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        prices = {product['name']: (product['price'], product['currency']) for product in response.data['results']}
+        self.assertEqual(prices['Pesos'], ('180.00', 'MXN'))
+        self.assertEqual(prices['Dollars'], ('9.00', 'EUR'))
+
+    def test_detail_and_batch_in_currency(self):
+        """Test single and batch lookups convert prices too."""
+        response = self.client.get(reverse('product_detail', args=[self.usd.sku]), {'currency': 'JPY'})
+        self.assertEqual((response.data['price'], response.data['currency']), ('1505', 'JPY'))
+
+        response = self.client.get(
+            reverse('v1:product_batch'), {'skus': f'{self.usd.sku},{self.eur.sku}', 'currency': 'EUR'})
+        self.assertEqual([product['price'] for product in response.data['products']], ['9.00', '9.99'])
+
+    def test_unknown_currency(self):
+        """Test currencies without a rate are rejected when reading and writing."""
+        for url in (reverse('list_products'), reverse('product_detail', args=[self.usd.sku])):
+            response = self.client.get(url, {'currency': 'XYZ'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['detail'], 'Unknown currency "XYZ".')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        response = self.client.post(
+            reverse('create_product'), {'name': 'Pounds', 'price': '5.00', 'brand': 'Brand', 'currency': 'GBP'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            reverse('create_product'), {'name': 'Yen', 'price': '500', 'brand': 'Brand', 'currency': 'jpy'})
+        self.assertEqual(response.data['product']['currency'], 'JPY')
+
+    def test_update_exchange_rates(self):
+        """Test admins load rates through the API and conversions use them right away."""
+        url = reverse('v1:update_exchange_rates')
+        payload = {'rates': {'EUR': '0.8', 'gbp': '0.75'}}
+        self.assertEqual(self.client.put(url, payload, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(self.client.put(url, payload, format='json').status_code, status.HTTP_200_OK)
+        response = self.client.put(url, {'rates': {'USD': '2'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse('v1:exchange_rates'))
+        self.assertEqual(response.data, {
+            'base': 'USD', 'rates': {'EUR': '0.80000000', 'GBP': '0.75000000', 'JPY': '150.50000000', 'USD': '1'}})
+        response = self.client.get(reverse('product_detail', args=[self.usd.sku]), {'currency': 'GBP'})
+        self.assertEqual(response.data['price'], '7.50')
+
+    def test_load_exchange_rates_command(self):
+        """Test rates load from a CSV file."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'rates.csv'
+            path.write_text("currency,rate\nEUR,0.95\nMXN,17.2\n")
+            out = StringIO()
+            call_command('load_exchange_rates', str(path), stdout=out)
+        self.assertIn("Loaded 2 exchange rates against USD.", out.getvalue())
+        self.assertEqual(ExchangeRate.rates()['MXN'], Decimal('17.2'))
+
+
+""" Product attributes test case. """
+class ProductAttributesTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.red_m = Product.objects.create(
+            name='Red M', price=10.0, brand='Brand', attributes={'color': 'red', 'size': 'm'})
+        self.red_l = Product.objects.create(
+            name='Red L', price=10.0, brand='Brand', attributes={'color': 'red', 'size': 'l'})
+        self.blue_m = Product.objects.create(
+            name='Blue M', price=10.0, brand='Other', attributes={'color': 'blue', 'size': 'm'})
+        Product.objects.create(name='Plain', price=10.0, brand='Brand')
+
+    def catalogue_names(self, params):
+        response = self.client.get(reverse('list_products'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {product['name'] for product in response.data['results']}, response.data['count']
+
+    def test_validation(self):
+        """Test attributes must be a flat object of text values with valid names."""
+        url = reverse('create_product')
+        product = {'name': 'Shoe', 'price': '50.00', 'brand': 'Brand'}
+        response = self.client.post(url, {**product, 'attributes': {'size': 42, 'color': 'black'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['product']['attributes'], {'size': '42', 'color': 'black'})
+
+        for attributes in ({'Size': '42'}, {'size': {'eu': 42}}, ['red'], {f'a{i}': 'x' for i in range(51)}):
+            response = self.client.post(url, {**product, 'attributes': attributes}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, attributes)
+            self.assertIn('attributes', response.data)
+
+    def test_filter(self):
+        """Test attribute filters match by containment, ANDed across names and ORed across values."""
+        self.assertEqual(self.catalogue_names({'attr.color': 'red'}), ({'Red M', 'Red L'}, 2))
+        self.assertEqual(self.catalogue_names({'attr.color': 'red', 'attr.size': 'm'}), ({'Red M'}, 1))
+        self.assertEqual(self.catalogue_names({'attr.size': ['m', 'l'], 'brand': 'Brand'}), ({'Red M', 'Red L'}, 2))
+        self.assertEqual(self.catalogue_names({'attr.color': 'green'}), (set(), 0))
+
+        response = self.client.get(reverse('list_products'), {'attr.Color': 'red'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filtered_counts_not_cached(self):
+        """Test the cached count strategy counts attribute-filtered pages exactly."""
+        ProductCount.refresh()
+        self.assertEqual(self.catalogue_names({'attr.color': 'red', 'brand': 'Brand', 'count': 'cached'})[1], 2)
+
+    def test_filter_uses_index(self):
+        """Test attribute-filtered counts are planned on the partial GIN index."""
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=10.0, brand='Brand', attributes={'color': f'color_{i % 500}', 'size': 'm'})
+            for i in range(5000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE api_product")
+            # Small partitions are cheaper to scan than to look up.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = Product.objects.filter(attributes__contains={'color': 'color_7', 'size': 'm'}).explain()
+        self.assertRegex(plan, r'Bitmap Index Scan on \S*attributes')
+
+    def test_import_attributes(self):
+        """Test CSV imports read attributes from a JSON cell."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'products.csv'
+            path.write_text('name,brand,price,attributes\nShirt,Brand,20.00,"{""color"": ""green""}"\nBad,Brand,1.00,{oops\n')
+            call_command('import_products', str(path), warm=False, stdout=StringIO())
+        self.assertEqual(Product.objects.get(name='Shirt').attributes, {'color': 'green'})
+        self.assertFalse(Product.objects.filter(name='Bad').exists())
+
+
+""" Slow query log test case. """
+@override_settings(SLOW_QUERY_LOG=True, SLOW_QUERY_THRESHOLD_MS=200, SLOW_QUERY_EXPLAIN_RATE=1)
+class SlowQueryLogTestCase(APITestCase):
+    def setUp(self):
+        querylog.queries.clear()
+        self.addCleanup(querylog.queries.clear)
+        self.admin = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User',
+            is_staff=True)
+        self.product = Product.objects.create(name='Product', price=10.0, brand='Brand')
+
+    def test_fingerprint(self):
+        """Test queries differing only in their values share a fingerprint."""
+        self.assertEqual(
+            querylog.fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s, %s) LIMIT 21"),
+            "SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?")
+        self.assertEqual(
+            querylog.fingerprint("INSERT INTO t_p1 (a, b)\n VALUES (%s, %s), (%s, %s)"),
+            "INSERT INTO t_p1 (a, b) VALUES (...)")
+
+    def test_request_queries_aggregated(self):
+        """Test the queries of requests are counted per fingerprint, without logging fast ones."""
+        with self.assertNoLogs('api.slow_queries'):
+            for _ in range(3):
+                self.client.get(reverse('product_detail', args=[self.product.sku]))
+        select = [row for row in querylog.queries.fingerprints() if row['fingerprint'].startswith('SELECT')]
+        self.assertEqual(select[0]['count'], 3)
+        self.assertEqual(querylog.queries.slow(), [])
+
+    def test_slow_query_logged_with_plan(self):
+        """Test slow queries are logged with their view and, for sampled SELECTs, an EXPLAIN ANALYZE plan."""
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('api.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('list_products'))
+        self.assertIn('in list_products', logs.output[0])
+
+        slow = querylog.queries.slow()
+        self.assertTrue(all(entry['view'] == 'list_products' for entry in slow))
+        self.assertIn('Execution Time', slow[0]['plan'])
+        self.assertIn('Buffers', slow[0]['plan'])
+
+        querylog.queries.clear()
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('api.slow_queries', 'WARNING'), \
+                mock.patch.object(querylog.QueryLog, 'random', return_value=0.5), \
+                override_settings(SLOW_QUERY_EXPLAIN_RATE=0.1):
+            self.client.get(reverse('list_products'))
+        self.assertTrue(all(entry['plan'] is None for entry in querylog.queries.slow()))
+
+    def test_writes_not_explained(self):
+        """Test slow writes are logged but never run again under EXPLAIN ANALYZE."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('api.slow_queries', 'WARNING'):
+            self.client.put(reverse('update_product', args=[self.product.sku]), {'price': '12.00'}, format='json')
+        updates = [entry for entry in querylog.queries.slow() if entry['sql'].startswith('UPDATE')]
+        self.assertTrue(updates)
+        self.assertTrue(all(entry['plan'] is None for entry in updates))
+        self.assertEqual(Product.objects.get(sku=self.product.sku).version, 2)
+
+    def test_side_effects_only_planned(self):
+        """Test SELECTs calling functions with side effects are explained without running them."""
+        connection.ensure_connection()
+        plan = querylog.explain(connection, "SELECT pg_notify(%s, %s)", ['querylog_test', 'payload'])
+        self.assertNotIn('Execution Time', plan)
+        plan = querylog.explain(connection, "SELECT nextval(pg_get_serial_sequence('api_productpricehistory', 'id'))", None)
+        self.assertNotIn('Execution Time', plan)
+        self.assertIn('Execution Time', querylog.explain(connection, "SELECT 1", None))
+
+    def test_failed_explain_keeps_transaction(self):
+        """Test a failing EXPLAIN is rolled back without breaking the transaction it ran in."""
+        self.assertTrue(connection.in_atomic_block)
+        connection.ensure_connection()
+        self.assertTrue(querylog.explain(connection, "SELECT missing FROM api_product", None).startswith("EXPLAIN failed"))
+        self.assertTrue(Product.objects.filter(sku=self.product.sku).exists())
+
+    def test_fingerprint_limit(self):
+        """Test fingerprints beyond the limit are counted together."""
+        request = mock.Mock(resolver_match=None)
+        with override_settings(SLOW_QUERY_MAX_FINGERPRINTS=2):
+            for table in ('a', 'b', 'c', 'd'):
+                querylog.queries.record(request, f"SELECT 1 FROM {table}", None, False, connection, 0.001)
+        counts = {row['fingerprint']: row['count'] for row in querylog.queries.fingerprints()}
+        self.assertEqual(counts, {"SELECT ? FROM a": 1, "SELECT ? FROM b": 1, querylog.OTHER: 2})
+
+    def test_metrics_endpoint_staff_only(self):
+        """Test only staff users read the query metrics."""
+        url = reverse('v1:query_metrics')
+        user = User.objects.create_user(username='user', password='user')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+        response = self.client.get(url, {'order': 'count', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(response.data['fingerprints']), 2)
+        self.assertEqual(self.client.get(url, {'order': 'slowest'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_slow_queries_command(self):
+        """Test the command profiles the given paths and reports their fingerprints and slow queries."""
+        out = StringIO()
+        with self.assertLogs('api.slow_queries', 'WARNING'):
+            call_command(
+                'slow_queries', reverse('list_products'), requests=2, threshold_ms=0, limit=3, stdout=out)
+        output = out.getvalue()
+        self.assertIn('SELECT COUNT(*)', output)
+        self.assertIn('ms in list_products', output)
+        self.assertIn('Execution Time', output)
+
+    def test_slow_queries_command_writes(self):
+        """Test the command only sends writes when allowed, and then once per path."""
+        product = Product.objects.create(name='Doomed', price=1, brand='Brand')
+        url = reverse('v1:delete_product', kwargs={'sku': product.sku})
+        options = {'method': 'DELETE', 'user': self.admin.username, 'stdout': StringIO()}
+        with self.assertRaisesMessage(CommandError, '--allow-writes'):
+            call_command('slow_queries', url, **options)
+        with self.assertRaisesMessage(CommandError, '--requests must be 1'):
+            call_command('slow_queries', url, allow_writes=True, requests=2, **options)
+        self.assertTrue(Product.objects.filter(sku=product.sku).exists())
+
+        call_command('slow_queries', url, allow_writes=True, **options)
+        self.assertFalse(Product.objects.filter(sku=product.sku).exists())
+
+
+""" Audit log test case. """
+class AuditLogTestCase(APITestCase):
+    def setUp(self):
+        self.log = audit.AuditLog(background=False)
+        patcher = mock.patch.object(audit, 'log', self.log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_user(
+            username='admin', password='admin', email="admin@test.com", first_name='Admin', last_name='User',
+            is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+
+    def test_admin_actions_recorded(self):
+        """Test every admin action is queued without a query and written with one INSERT."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_product'), {'name': 'Product', 'price': '10.00', 'brand': 'Brand'})
+        sku = uuid.UUID(response.data['product']['sku'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('update_product', args=[sku]), {'price': '12.00'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('delete_product', args=[sku]))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_admin_users'), {
+                'username': 'other', 'password': 'secret', 'email': 'other@test.com',
+                'first_name': 'Other', 'last_name': 'Admin'})
+        user_id = response.data['user']['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('update_admin_user', args=[user_id]), {'password': 'changed'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('delete_admin_user', args=[user_id]))
+
+        self.assertFalse(AuditEvent.objects.exists())
+        self.assertEqual(self.log.pending, 6)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.log.flush(), 6)
+
+        events = list(AuditEvent.objects.order_by('at'))
+        self.assertEqual([event.action for event in events], [
+            'product.create', 'product.update', 'product.delete', 'admin.create', 'admin.update', 'admin.delete'])
+        self.assertTrue(all(event.actor_id == self.admin.id and event.actor == 'admin' for event in events))
+        self.assertEqual({event.sku for event in events[:3]}, {sku})
+        self.assertEqual(events[1].changes, {'price': '12.00'})
+        self.assertNotIn('password', events[3].changes)
+        self.assertEqual(events[4].changes, {'password_changed': True})
+        self.assertEqual({event.target_user_id for event in events[3:]}, {user_id})
+
+    def test_rolled_back_action_not_recorded(self):
+        """Test actions whose transaction rolls back leave no event."""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    audit.record(mock.Mock(user=self.admin), AuditEvent.Action.PRODUCT_DELETE, sku=uuid.uuid4())
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(self.log.pending, 0)
+
+    def test_failed_flush_kept(self):
+        """Test events the database could not take are kept, in order, for the next flush."""
+        request = mock.Mock(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                audit.record(request, AuditEvent.Action.PRODUCT_DELETE, sku=uuid.uuid4())
+        queued = list(self.log._pending)
+        with mock.patch.object(AuditEvent.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('api.audit', 'ERROR'):
+            self.assertEqual(self.log.flush(), 0)
+        self.assertEqual(list(self.log._pending), queued)
+        self.assertEqual(self.log.flush(), 3)
+
+    @override_settings(AUDIT_MAX_PENDING=3)
+    def test_backpressure(self):
+        """Test the request reaching AUDIT_MAX_PENDING writes the queue itself."""
+        request = mock.Mock(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                audit.record(request, AuditEvent.Action.PRODUCT_DELETE, sku=uuid.uuid4())
+        self.assertEqual(self.log.pending, 0)
+        self.assertEqual(AuditEvent.objects.count(), 3)
+
+    def test_query(self):
+        """Test the audit log is filtered by actor, SKU, action and time range and paginated by cursor."""
+        now = timezone.now()
+        sku = uuid.uuid4()
+        AuditEvent.objects.bulk_create([
+            AuditEvent(at=now - timedelta(minutes=i), actor_id=self.admin.id if i % 2 else 999, actor='admin',
+                       action='product.update' if i % 3 else 'product.delete', sku=sku if i < 5 else uuid.uuid4())
+            for i in range(10)
+        ])
+        url = reverse('v1:audit_log')
+
+        def ats(params):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [(now - timezone.datetime.fromisoformat(event['at'])) // timedelta(minutes=1)
+                    for event in response.data['results']]
+
+        self.assertEqual(ats({'actor': self.admin.id}), [1, 3, 5, 7, 9])
+        self.assertEqual(ats({'sku': str(sku), 'action': 'product.update'}), [1, 2, 4])
+        self.assertEqual(ats({'start': (now - timedelta(minutes=2.5)).isoformat(), 'actor': 999}), [0, 2])
+
+        response = self.client.get(url, {'page_size': 4})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(len(self.client.get(response.data['next']).data['results']), 4)
+
+        self.assertEqual(self.client.get(url, {'action': 'nope'}).status_code, status.HTTP_400_BAD_REQUEST)
+        user = User.objects.create_user(username='user', password='user')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_events_of_one_batch_paginated(self):
+        """Test events sharing their time are each listed once, newest id first."""
+        now = timezone.now()
+        AuditEvent.objects.bulk_create([
+            AuditEvent(at=now, actor_id=self.admin.id, actor='admin', action='product.update', changes={'n': i})
+            for i in range(5)
+        ])
+
+        listed = []
+        response = self.client.get(reverse('v1:audit_log'), {'page_size': 2})
+        while True:
+            listed += [event['changes']['n'] for event in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(listed, [4, 3, 2, 1, 0])
+
+
+""" Audit log background flush test case. """
+class AuditFlushTestCase(APITransactionTestCase):
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def wait_for_events(self, count):
+        deadline = time.monotonic() + 5
+        while AuditEvent.objects.count() < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return AuditEvent.objects.count()
+
+    @override_settings(AUDIT_FLUSH_INTERVAL=0.05)
+    def test_flush_on_interval(self):
+        """Test the background thread writes queued events after AUDIT_FLUSH_INTERVAL."""
+        log = audit.AuditLog()
+        log.record(mock.Mock(user=AnonymousUser()), AuditEvent.Action.PRODUCT_DELETE, sku=uuid.uuid4())
+        self.assertEqual(self.wait_for_events(1), 1)
+        self.assertEqual(log.pending, 0)
+
+    @override_settings(AUDIT_FLUSH_INTERVAL=60, AUDIT_BATCH_SIZE=2)
+    def test_flush_on_batch_size(self):
+        """Test a full batch wakes the background thread before the interval."""
+        log = audit.AuditLog()
+        for _ in range(2):
+            log.record(mock.Mock(user=AnonymousUser()), AuditEvent.Action.PRODUCT_DELETE, sku=uuid.uuid4())
+        self.assertEqual(self.wait_for_events(2), 2)
+
+
+""" Seed catalogue test case. """
+class SeedCatalogueTestCase(APITestCase):
+    def test_generation_deterministic(self):
+        """Test a seed always gives the same, valid products, whatever part of them is generated."""
+        now = timezone.now()
+        rows = list(seeding.generate_products(1, 1200, chunk_size=500, now=now))
+        self.assertEqual(list(seeding.generate_products(1, 1200, chunk_size=500, now=now)), rows)
+        self.assertEqual(list(seeding.generate_products(1, 300, start=700, chunk_size=500, now=now)), rows[700:1000])
+        self.assertNotEqual(list(seeding.generate_products(2, 1200, chunk_size=500, now=now)), rows)
+        self.assertEqual(len({row[0] for row in rows}), 1200)
+
+        for row in rows[:100]:
+            values = dict(zip(seeding.COLUMNS, row))
+            serializer = ProductSerializer(data=values)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            self.assertEqual(str(uuid.UUID(values['sku'])), values['sku'])
+        brands = Counter(row[3] for row in rows)
+        self.assertGreater(brands.most_common(1)[0][1], 10 * brands.most_common()[-1][1])
+
+    def test_seed_catalogue(self):
+        """Test the command loads the products, staff users and counts, and refuses a seed twice."""
+        call_command(
+            'seed_catalogue', products=400, admins=5, admin_password='admin', seed=3, batch_size=150, stdout=StringIO())
+        self.assertEqual(Product.all_objects.count(), 400)
+        self.assertEqual(ProductPriceHistory.objects.count(), 400)
+        live = Product.objects.count()
+        self.assertLess(live, 400)
+        self.assertEqual(ProductCount.objects.get(brand='').count, live)
+        self.assertEqual(User.objects.filter(is_staff=True).count(), 5)
+        self.assertTrue(User.objects.filter(is_staff=True).first().check_password('admin'))
+
+        response = self.client.get(reverse('v1:list_products'), {'attr.category': 'apparel'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(all(product['attributes']['category'] == 'apparel' for product in response.data['results']))
+
+        with self.assertRaisesMessage(CommandError, "Seed 3 is already loaded"):
+            call_command('seed_catalogue', products=10, admins=0, seed=3, stdout=StringIO())
+        self.assertEqual(Product.all_objects.count(), 400)
+
+    def test_seed_catalogue_errors(self):
+        """Test staff users need a password, and a failed load is not taken for a loaded seed."""
+        with self.assertRaisesMessage(CommandError, "--admin-password is required"):
+            call_command('seed_catalogue', products=10, admins=1, seed=5, stdout=StringIO())
+
+        code = next(row[1] for row in seeding.generate_products(5, 100) if row[1])
+        Product.objects.create(name='Taken', price=1, brand='Brand', code=code)
+        with self.assertRaises(CommandError) as error:
+            call_command('seed_catalogue', products=100, admins=0, seed=5, stdout=StringIO())
+        self.assertIn("could not be loaded", str(error.exception))
+        self.assertEqual(Product.all_objects.count(), 1)
+
+    def test_bulk_create_fallback(self):
+        """Test bulk_create writes the same rows as COPY, for databases without it."""
+        rows = list(seeding.generate_products(4, 250))
+        loaded = []
+        for use_copy in (True, False):
+            self.assertEqual(seeding.write_products(rows, batch_size=100, use_copy=use_copy), 250)
+            loaded.append(list(Product.all_objects.order_by('sku').values_list(*seeding.COLUMNS)))
+            self.assertEqual(ProductPriceHistory.objects.count(), 250)
+            Product.all_objects.all().delete()
+            ProductPriceHistory.objects.all().delete()
+        self.assertEqual(loaded[0], loaded[1])
+        self.assertEqual(len(loaded[0]), 250)
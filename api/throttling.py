@@ -0,0 +1,121 @@
+"""
+Token-bucket rate limiting.
+
+Every client has one bucket per scope holding up to N tokens, refilled at N
+per period for a rate of "N/period" in REST_FRAMEWORK's
+DEFAULT_THROTTLE_RATES. A request takes a token or is rejected with 429 and
+a Retry-After header, so clients get short bursts but not a sustained rate
+above their budget. Scopes:
+
+- "anon_read" / "user_read": safe methods, per IP address / per user token.
+- "write": other methods.
+- "auth": login and token refresh, always per IP address.
+
+Buckets live in the default cache, which must be shared between workers
+(CACHE_URL) for the limits to hold across them. A bucket costs one cache
+read and one write per request whatever the number of clients; concurrent
+requests of the same client may race and both take the last token, which
+only lets a burst slightly exceed the budget.
+"""
+import math
+import time
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a rate such as "100/min" into (requests, period in seconds).
+    """
+    requests, _, period = rate.partition('/')
+    return int(requests), PERIODS[period.strip()[0]]
+
+
+@dataclass
+class RateLimit:
+    """
+    State of the bucket that admitted or rejected a request, reported in the
+    RateLimit-* response headers.
+    """
+    limit: int
+    remaining: int
+    reset: int
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle requests with a token bucket per client and scope. The scope is
+    the class' `scope`, or picked from the method and user when None.
+    """
+    scope = None
+    timer = time.time
+
+    def get_scope(self, request):
+        if self.scope is not None:
+            return self.scope
+        if request.method not in SAFE_METHODS:
+            return 'write'
+        return 'user_read' if request.user.is_authenticated else 'anon_read'
+
+    def get_cache_key(self, request, scope):
+        if request.user.is_authenticated and scope != 'auth':
+            return f'throttle:{scope}:user:{request.user.pk}'
+        return f'throttle:{scope}:ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        capacity, period = parse_rate(rate)
+        refill = capacity / period
+
+        key = self.get_cache_key(request, scope)
+        now = self.timer()
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Once expired, the bucket is back to full, which the default gives.
+        full_in = (capacity - tokens) / refill
+        cache.set(key, (tokens, now), max(1, math.ceil(full_in)))
+
+        self.wait_seconds = 0 if allowed else (1 - tokens) / refill
+        request._request.rate_limit = RateLimit(capacity, int(tokens), math.ceil(full_in))
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AuthThrottle(TokenBucketThrottle):
+    """
+    Throttle for the login and token endpoints, per IP address.
+    """
+    scope = 'auth'
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Add RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset (seconds
+    until the bucket is full again) to throttled responses.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            response['RateLimit-Limit'] = str(rate_limit.limit)
+            response['RateLimit-Remaining'] = str(rate_limit.remaining)
+            response['RateLimit-Reset'] = str(rate_limit.reset)
+        return response
@@ -0,0 +1,42 @@
+from django.urls import path
+
+# Registers the <sku:> converter.
+from . import converters  # noqa: F401
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('auth/login/', views.login, name='login'),
+    path('auth/refresh/', views.refresh_token, name='refresh_token'),
+    path('auth/logout/', views.logout, name='logout'),
+
+    path('catalogue/', views.list_products, name='list_products'),
+    path('catalogue/facets/', views.catalogue_facets, name='catalogue_facets'),
+
+    path('products/new/', views.create_product, name='create_product'),
+    path('products/delete/', views.delete_products, name='delete_products'),
+    path('products/batch/', views.product_batch, name='product_batch'),
+    path('products/code/<slug:code>/', views.product_detail, name='product_detail_by_code'),
+    path('products/<sku:sku>/', views.product_detail, name='product_detail'),
+    path('products/<sku:sku>/update/', views.update_product, name='update_product'),
+    path('products/<sku:sku>/delete/', views.delete_product, name='delete_product'),
+    path('products/<sku:sku>/prices/', views.price_history, name='price_history'),
+
+    path('prices/at/', views.prices_at, name='prices_at'),
+
+    path('exchange-rates/', views.exchange_rates, name='exchange_rates'),
+    path('exchange-rates/update/', views.update_exchange_rates, name='update_exchange_rates'),
+
+    path('metrics/coalescing/', views.coalescing_metrics, name='coalescing_metrics'),
+    path('metrics/queries/', views.query_metrics, name='query_metrics'),
+
+    path('events/products/', views.product_events, name='product_events'),
+
+    path('audit/', views.audit_log, name='audit_log'),
+
+    path('admins/', views.list_admin_users, name='list_admin_users'),
+    path('admins/new/', views.create_admin_users, name='create_admin_users'),
+    path('admins/<int:id>/update/', views.update_admin_user, name='update_admin_user'),
+    path('admins/<int:id>/delete/', views.delete_admin_user, name='delete_admin_user'),
+]
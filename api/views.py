@@ -1,19 +1,80 @@
-from api.models import Product, ProductPagination
-from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from api.models import AuditEvent, AuditPagination, CatalogueFacets, ExchangeRate, Product, ProductPagination, ProductPriceHistory
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
 
-from .serializers import ProductSerializer, UserSerializer
+from . import audit, events, querylog, revocation
+from .coalescing import reads
+from .docs import openapi, swagger_auto_schema
+from .throttling import AuthThrottle
+from .serializers import AuditEventSerializer, AuditQuerySerializer, BatchLookupSerializer, BulkDeleteSerializer, CurrencySerializer, ExchangeRatesSerializer, FacetsSerializer, PriceHistorySerializer, PriceRangeSerializer, PricesAtSerializer, ProductSerializer, UserSerializer
+import os
 import re
+from functools import reduce
+from operator import or_
 from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
+from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def _etag(product):
+    """
+    Build the ETag header value for a product from its version.
+    """
+    return f'"{product.version}"'
+
+
+def _expected_version(request):
+    """
+    Read the version a client expects to update, from the If-Match header
+    or the "version" field of the body. Returns None when the client did
+    not ask for a conditional update and raises ValueError when malformed.
+    """
+    if_match = request.headers.get("If-Match")
+    if if_match is not None:
+        if_match = if_match.strip()
+        if if_match == "*":
+            return None
+        if if_match.startswith("W/"):
+            if_match = if_match[2:]
+        return int(if_match.strip('"'))
+
+    version = request.data.get("version")
+    if version is not None:
+        return int(version)
+    return None
+
+
+def _requested_currency(request):
+    """
+    Parse the optional `currency` query parameter. Returns None when it is
+    absent and raises ValueError for currencies without a known rate.
+    """
+    params = CurrencySerializer(data=request.query_params)
+    if not params.is_valid():
+        raise ValueError(params.errors["currency"][0])
+    return params.validated_data.get("currency")
+
+
+def _with_currency(fields, currency):
+    """
+    Add the currency to the requested fields when converting a price,
+    which needs the stored one.
+    """
+    if currency and fields is not None and "price" in fields and "currency" not in fields:
+        return [*fields, "currency"]
+    return fields
+
 
 @swagger_auto_schema(
     method='post',
@@ -27,6 +88,7 @@ from django.conf import settings
     responses={200: 'JWT tokens returned', 400: 'Bad Request', 404: 'Not Found'}
 )
 @api_view(["POST"])
+@throttle_classes([AuthThrottle])
 def login(request):
     """
     Handle user login and return JWT tokens.
@@ -42,7 +104,7 @@ def login(request):
     if not user.check_password(password):
         return Response({"detail": "Incorrect username or password"}, status=status.HTTP_404_NOT_FOUND)
 
-    refresh = RefreshToken.for_user(user)
+    refresh = revocation.token_for_user(user)
 
     return Response({
         'refresh': str(refresh),
@@ -62,6 +124,7 @@ def login(request):
     responses={200: 'New access token returned', 400: 'Bad Request'}
 )
 @api_view(["POST"])
+@throttle_classes([AuthThrottle])
 def refresh_token(request):
     """
     Handle refresh token and return new access token.
@@ -72,6 +135,8 @@ def refresh_token(request):
     
     try:
         refresh = RefreshToken(refresh_token)
+        if revocation.is_revoked(refresh):
+            return Response({"detail": "Token has been revoked"}, status=status.HTTP_400_BAD_REQUEST)
         access_token = refresh.access_token
 
         return Response({
@@ -82,6 +147,37 @@ def refresh_token(request):
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
 
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'refresh': openapi.Schema(type=openapi.TYPE_STRING, description='Refresh token'),
+        }
+    ),
+    responses={200: 'Refresh token revoked', 400: 'Bad Request'}
+)
+@api_view(["POST"])
+@throttle_classes([AuthThrottle])
+def logout(request):
+    """
+    Revoke a refresh token so it can no longer be refreshed. Access tokens
+    already issued stay valid until they expire.
+    """
+    refresh_token = request.data.get("refresh")
+    if not refresh_token:
+        return Response({"detail": "Refresh token is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        refresh = RefreshToken(refresh_token)
+    except Exception as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not revocation.is_revoked(refresh):
+        revocation.revoke_token(refresh)
+    return Response({"message": "Logged out successfully"}, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(
     method='post',
     request_body=ProductSerializer,
@@ -98,6 +194,7 @@ def create_product(request):
     
     if serializer.is_valid():
         product = serializer.save()
+        audit.record(request, AuditEvent.Action.PRODUCT_CREATE, sku=product.sku, changes=serializer.validated_data)
         return Response({
             "message": "Product created successfully",
             "product": serializer.data
@@ -108,31 +205,112 @@ def create_product(request):
 
 @swagger_auto_schema(
     method='get',
-    responses={200: ProductSerializer, 404: 'Product not found'}
+    manual_parameters=[
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('currency', openapi.IN_QUERY, description="Currency to convert prices to", type=openapi.TYPE_STRING)
+    ],
+    responses={200: ProductSerializer, 400: 'Unknown fields or currency', 404: 'Product not found'}
 )
 @api_view(["GET"])
-def product_detail(request, sku):
+def product_detail(request, sku=None, code=None):
     """
-    Retrieve a product by SKU.
+    Retrieve a product by SKU, short SKU or human-readable code.
+    The SKU is already parsed by the URL converter, so this is a single
+    indexed lookup.
     """
     try:
-        product = get_object_or_404(Product, sku=sku)
+        currency = _requested_currency(request)
+        fields = _with_currency(ProductSerializer.requested_fields(request), currency)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Increment the views count only if user is not authenticated
-        if not request.user.is_authenticated:
-            product.views += 1
-            product.save()
+    lookup = {"sku": sku} if code is None else {"code": code}
+    products = Product.objects.all()
+    if fields is not None:
+        # The version is needed for the ETag and views for the counter.
+        products = products.only(*ProductSerializer.model_fields(fields), "version", "views")
 
-        serializer = ProductSerializer(product)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    except:
+    def load():
+        product = products.get(**lookup)
+        return product, ProductSerializer(product, fields=fields).data
+
+    try:
+        # Concurrent requests for the same product share one query.
+        product, data = reads.do(("product", tuple(lookup.items()), fields and tuple(fields)), load)
+    except Product.DoesNotExist:
         return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    # Increment the views count only if user is not authenticated
+    data = dict(data)
+    if not request.user.is_authenticated:
+        Product.increment_views(product.sku)
+        if "views" in data:
+            data["views"] += 1
+    if currency:
+        ExchangeRate.convert([data], currency)
+
+    return Response(data, status=status.HTTP_200_OK,
+                    headers={"ETag": _etag(product)})
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('skus', openapi.IN_QUERY, description="Comma-separated SKUs or short SKUs", type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('record_views', openapi.IN_QUERY, description="Count a view of each product found (anonymous users only, default true)", type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('currency', openapi.IN_QUERY, description="Currency to convert prices to", type=openapi.TYPE_STRING)
+    ],
+    responses={200: 'Products in request order, null for SKUs not found', 400: 'Bad Request'}
+)
+@api_view(["GET"])
+def product_batch(request):
+    """
+    Retrieve many products by SKU or short SKU with a single query.
+    Products are returned in request order, with null in place of (and
+    the SKU listed in `not_found` for) the ones that don't exist. Views of
+    anonymous users are counted for all products with one UPDATE.
+    """
+    data = {"skus": [sku for value in request.query_params.getlist("skus") for sku in value.split(",") if sku]}
+    if "record_views" in request.query_params:
+        data["record_views"] = request.query_params["record_views"]
+    params = BatchLookupSerializer(data=data)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        currency = _requested_currency(request)
+        fields = _with_currency(ProductSerializer.requested_fields(request), currency)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    skus = params.validated_data["skus"]
+    products = Product.objects.filter(sku__in=skus)
+    if fields is not None:
+        products = products.only(*ProductSerializer.model_fields(fields), "views")
+    found = {product.sku: product for product in products}
+
+    if params.validated_data["record_views"] and not request.user.is_authenticated and found:
+        Product.increment_views_many(found)
+        for product in found.values():
+            product.views += 1
+
+    # One serializer for the whole batch; its items follow found's order.
+    serialized = dict(zip(found, ProductSerializer(found.values(), many=True, fields=fields).data))
+    if currency:
+        ExchangeRate.convert(serialized.values(), currency)
+    return Response({
+        "products": [serialized.get(sku) for sku in skus],
+        "not_found": list(dict.fromkeys(str(sku) for sku in skus if sku not in found)),
+    }, status=status.HTTP_200_OK)
+
 
 @swagger_auto_schema(
     method='put',
     request_body=ProductSerializer,
-    responses={200: 'Product updated successfully', 400: 'Bad Request', 404: 'Product not found'},
+    manual_parameters=[
+        openapi.Parameter('If-Match', openapi.IN_HEADER, description="Expected product version (ETag)", type=openapi.TYPE_STRING)
+    ],
+    responses={200: 'Product updated successfully', 400: 'Bad Request', 404: 'Product not found', 412: 'Product was modified by another request'},
     security=[{'Bearer': []}]
 )
 @api_view(["PUT"])
@@ -140,7 +318,14 @@ def product_detail(request, sku):
 def update_product(request, sku):
     """
     Update a product by SKU.
+    Supports optimistic concurrency through the If-Match header or a
+    "version" field, answering 412 when the product changed meanwhile.
     """
+    try:
+        expected_version = _expected_version(request)
+    except (TypeError, ValueError):
+        return Response({"detail": "Invalid version"}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         product = Product.objects.get(sku=sku)
     except Product.DoesNotExist:
@@ -149,7 +334,10 @@ def update_product(request, sku):
     serializer = ProductSerializer(product, data=request.data, partial=True)
     
     if serializer.is_valid():
-        serializer.save()
+        if not product.apply_changes(serializer.validated_data, expected_version):
+            return Response({"detail": "Product was modified by another request"},
+                            status=status.HTTP_412_PRECONDITION_FAILED)
+        audit.record(request, AuditEvent.Action.PRODUCT_UPDATE, sku=product.sku, changes=serializer.validated_data)
         
         users = User.objects.all()
         recipient_list = [user.email for user in users if user.email]
@@ -165,7 +353,7 @@ def update_product(request, sku):
         return Response({
             "message": "Product updated successfully",
             "product": serializer.data
-        }, status=status.HTTP_200_OK)
+        }, status=status.HTTP_200_OK, headers={"ETag": _etag(product)})
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -179,39 +367,359 @@ def update_product(request, sku):
 @permission_classes([IsAuthenticated])
 def delete_product(request, sku):
     """
-    Delete a product by SKU.
+    Delete a product by SKU. The product is soft deleted and purged later by
+    the purge_products command.
     """
     try:
         product = Product.objects.get(sku=sku)
         product.delete()
+        audit.record(request, AuditEvent.Action.PRODUCT_DELETE, sku=product.sku)
         return Response({"message": "Product deleted successfully"}, status=status.HTTP_200_OK)
     except Product.DoesNotExist:
         return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+@swagger_auto_schema(
+    method='post',
+    request_body=BulkDeleteSerializer,
+    responses={200: 'Number of deleted products and the SKUs not found', 400: 'Bad Request'},
+    security=[{'Bearer': []}]
+)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def delete_products(request):
+    """
+    Soft delete up to 500 products by SKU with a single update.
+    """
+    params = BulkDeleteSerializer(data=request.data)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    skus = list(dict.fromkeys(params.validated_data["skus"]))
+    deleted = set(Product.soft_delete(skus))
+    for sku in deleted:
+        audit.record(request, AuditEvent.Action.PRODUCT_DELETE, sku=sku)
+    return Response({
+        "deleted": len(deleted),
+        "not_found": [str(sku) for sku in skus if sku not in deleted],
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('start', openapi.IN_QUERY, description="Start of the range (ISO 8601)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+        openapi.Parameter('end', openapi.IN_QUERY, description="End of the range (ISO 8601)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME)
+    ],
+    responses={200: PriceHistorySerializer(many=True), 400: 'Bad Request'},
+    security=[{'Bearer': []}]
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def price_history(request, sku):
+    """
+    Return the price series of a SKU between `start` and `end`, beginning
+    with the price already in effect at `start`. History outlives deleted
+    products, so an unknown SKU just has an empty series.
+    """
+    params = PriceRangeSerializer(data=request.query_params)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+    start = params.validated_data.get('start')
+    end = params.validated_data.get('end')
+
+    history = ProductPriceHistory.objects.filter(sku=sku).order_by('effective_at', 'id')
+    entries = history
+    if end is not None:
+        entries = entries.filter(effective_at__lte=end)
+    if start is not None:
+        entries = list(entries.filter(effective_at__gte=start))
+        in_effect = history.filter(effective_at__lt=start).last()
+        if in_effect is not None:
+            entries.insert(0, in_effect)
+
+    serializer = PriceHistorySerializer(entries, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('skus', openapi.IN_QUERY, description="Comma-separated SKUs or short SKUs", type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('at', openapi.IN_QUERY, description="Point in time (ISO 8601, default now)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME)
+    ],
+    responses={200: 'Price of every SKU at the given time', 400: 'Bad Request'},
+    security=[{'Bearer': []}]
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def prices_at(request):
+    """
+    Return the price each of the given SKUs had at time `at`, looked up for
+    all of them in a single query. SKUs without a price then get null.
+    """
+    data = {"skus": [sku for value in request.query_params.getlist("skus") for sku in value.split(",") if sku]}
+    if "at" in request.query_params:
+        data["at"] = request.query_params["at"]
+    params = PricesAtSerializer(data=data)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    skus = params.validated_data["skus"]
+    at = params.validated_data.get("at", timezone.now())
+    prices = ProductPriceHistory.prices_at(skus, at)
+    entries = []
+    for sku in skus:
+        price, currency, effective_at = prices.get(sku) or (None, None, None)
+        entries.append({
+            "sku": str(sku),
+            "price": None if price is None else str(price),
+            "currency": currency,
+            "effective_at": effective_at,
+        })
+    return Response({"at": at, "prices": entries}, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
         openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
-        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER)
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('brand', openapi.IN_QUERY, description="Only list products of this brand", type=openapi.TYPE_STRING),
+        openapi.Parameter('attr.<name>', openapi.IN_QUERY, description="Only list products with this attribute value, e.g. attr.color=red", type=openapi.TYPE_STRING),
+        openapi.Parameter('count', openapi.IN_QUERY, description="How to count the products", type=openapi.TYPE_STRING, enum=['exact', 'cached', 'approximate']),
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('currency', openapi.IN_QUERY, description="Currency to convert prices to", type=openapi.TYPE_STRING)
     ],
     responses={200: ProductSerializer(many=True), 400: 'Incorrect query parameters'}
 )
 @api_view(["GET"])
 def list_products(request):
     """
-    List all products paginated.
+    List all products paginated, ordered by SKU, optionally filtered by brand
+    and by attributes (?attr.color=red, repeated to match any of the values).
+    With `currency`, the prices of the page are converted in one pass.
     """
     try:
-        products = Product.objects.all()
+        currency = _requested_currency(request)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def load():
+        fields = _with_currency(ProductSerializer.requested_fields(request), currency)
+        products = Product.objects.order_by('sku')
+        # An empty brand is no filter, as for the cached counts.
+        if request.query_params.get('brand'):
+            products = products.filter(brand=request.query_params['brand'])
+        attributes = ProductSerializer.requested_attributes(request)
+        # Single values are tested in one containment, which the planner
+        # estimates better than several ANDed ones; each is served by the
+        # GIN index.
+        required = {name: values[0] for name, values in attributes.items() if len(values) == 1}
+        if required:
+            products = products.filter(attributes__contains=required)
+        for name, values in attributes.items():
+            if len(values) > 1:
+                products = products.filter(reduce(or_, (Q(attributes__contains={name: value}) for value in values)))
+        if fields is not None:
+            products = products.only(*ProductSerializer.model_fields(fields))
         paginator = ProductPagination()
         paginated_products = paginator.paginate_queryset(products, request)
-        serializer = ProductSerializer(paginated_products, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        serializer = ProductSerializer(paginated_products, many=True, fields=fields)
+        if currency:
+            ExchangeRate.convert(serializer.data, currency)
+        return paginator.get_paginated_response(serializer.data).data, paginator.count_strategy
+
+    try:
+        # Concurrent requests for the same page share one query.
+        data, count_strategy = reads.do(("catalogue", request.build_absolute_uri()), load)
+        return Response(data, headers={"X-Count-Strategy": count_strategy})
     except:
         return Response({"detail": "Incorrect query parameters" }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('brand', openapi.IN_QUERY, description="Only compute the price facets of this brand", type=openapi.TYPE_STRING),
+        openapi.Parameter('buckets', openapi.IN_QUERY, description="Number of price buckets (1-50, default 10)", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: 'Product count, price range and histogram, and products per brand', 400: 'Incorrect query parameters'}
+)
+@api_view(["GET"])
+def catalogue_facets(request):
+    """
+    Return the facets of the catalogue for filter UIs: products per brand
+    and the price range split into equal-width buckets. Served from the
+    cache until a product write invalidates it.
+    """
+    params = FacetsSerializer(data=request.query_params)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+    facets = CatalogueFacets.get(params.validated_data.get('brand'), params.validated_data['buckets'])
+    return Response(facets, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    responses={200: 'Units of each currency worth one of the base currency'}
+)
+@api_view(["GET"])
+def exchange_rates(request):
+    """
+    Return the exchange rates prices are converted with.
+    """
+    return Response({
+        "base": settings.BASE_CURRENCY,
+        "rates": {currency: str(rate) for currency, rate in sorted(ExchangeRate.rates().items())},
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='put',
+    request_body=ExchangeRatesSerializer,
+    responses={200: 'Exchange rates loaded', 400: 'Bad Request'},
+    security=[{'Bearer': []}]
+)
+@api_view(["PUT"])
+@permission_classes([IsAuthenticated])
+def update_exchange_rates(request):
+    """
+    Insert or update exchange rates, as units of each currency worth one
+    of the base currency. Currencies left out keep their rate.
+    """
+    serializer = ExchangeRatesSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    ExchangeRate.load(serializer.validated_data["rates"])
+    return Response({"message": f"Loaded {len(serializer.validated_data['rates'])} exchange rates"},
+                    status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    responses={200: 'Read coalescing counters of the worker serving the request'},
+    security=[{'Bearer': []}]
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def coalescing_metrics(request):
+    """
+    Return how many product and catalogue reads this worker ran
+    (`queries`), shared with an identical read in flight (`coalesced`),
+    served from a recent result (`fresh`, `stale`) and refreshed in the
+    background (`refreshes`). Counters are per worker process.
+    """
+    stats = reads.stats
+    return Response({
+        "pid": os.getpid(),
+        **{name: stats[name] for name in ("queries", "coalesced", "fresh", "stale", "refreshes")},
+    }, status=status.HTTP_200_OK)
+
+
+@require_GET
+def product_events(request):
+    """
+    Stream product changes to an authenticated admin as Server-Sent Events:
+    product.created, product.updated, products.deleted and
+    products.imported. The access token is read from the Authorization
+    header or, for EventSource clients which cannot set headers, from
+    ?access_token=. Reconnecting with Last-Event-ID replays the events
+    missed meanwhile, or sends a resync event when they are no longer kept.
+    """
+    if 'access_token' in request.GET:
+        request.META['HTTP_AUTHORIZATION'] = f"Bearer {request.GET['access_token']}"
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    # Under ASGI the stream is a coroutine and holds no thread while idle.
+    stream = events.stream_async if isinstance(request, ASGIRequest) else events.stream_sync
+    response = StreamingHttpResponse(stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep proxies such as nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('order', openapi.IN_QUERY, description="Rank fingerprints by total time, call count or max time", type=openapi.TYPE_STRING, enum=['total', 'count', 'max']),
+        openapi.Parameter('limit', openapi.IN_QUERY, description="Number of fingerprints to return (default 20)", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: 'Query fingerprints and recent slow queries of the worker serving the request', 400: 'Incorrect query parameters'},
+    security=[{'Bearer': []}]
+)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def query_metrics(request):
+    """
+    Return the queries this worker ran, aggregated by fingerprint with
+    their count and total, mean and max time, and its recent slow queries
+    with the view that ran them and, when sampled, their plan. Staff only,
+    since queries can include product and user data.
+    """
+    order = request.query_params.get("order", "total")
+    try:
+        limit = int(request.query_params.get("limit", 20))
+    except ValueError:
+        limit = -1
+    if order not in ("total", "count", "max") or limit < 1:
+        return Response({"detail": "Incorrect query parameters"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "pid": os.getpid(),
+        "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+        "fingerprints": querylog.queries.fingerprints(order, limit),
+        "slow": querylog.queries.slow(),
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('actor', openapi.IN_QUERY, description="Only events of this user id", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('sku', openapi.IN_QUERY, description="Only events of this product (SKU or short SKU)", type=openapi.TYPE_STRING),
+        openapi.Parameter('action', openapi.IN_QUERY, description="Only events of this action", type=openapi.TYPE_STRING, enum=AuditEvent.Action.values),
+        openapi.Parameter('start', openapi.IN_QUERY, description="Only events at or after this time", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+        openapi.Parameter('end', openapi.IN_QUERY, description="Only events at or before this time", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Page cursor from the next or previous link", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of events per page (max 200)", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: AuditEventSerializer(many=True), 400: 'Bad Request'},
+    security=[{'Bearer': []}]
+)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def audit_log(request):
+    """
+    List the audit log of admin actions, newest first, optionally filtered
+    by actor, product, action and time range. Events are written in batches,
+    so the last seconds of actions may not be listed yet.
+    """
+    params = AuditQuerySerializer(data=request.query_params)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    filters = {
+        "actor_id": params.validated_data.get("actor"),
+        "sku": params.validated_data.get("sku"),
+        "action": params.validated_data.get("action"),
+        "at__gte": params.validated_data.get("start"),
+        "at__lte": params.validated_data.get("end"),
+    }
+    events = AuditEvent.objects.filter(**{name: value for name, value in filters.items() if value is not None})
+    paginator = AuditPagination()
+    page = paginator.paginate_queryset(events, request)
+    return paginator.get_paginated_response(AuditEventSerializer(page, many=True).data)
+
+
 @swagger_auto_schema(
     method='post',
     request_body=UserSerializer,
@@ -240,6 +748,8 @@ def create_admin_users(request):
         user.set_password(password)
         user.is_staff = True
         user.save()
+        audit.record(request, AuditEvent.Action.ADMIN_CREATE, target_user_id=user.id,
+                     changes={name: value for name, value in serializer.validated_data.items() if name != "password"})
         return Response({
             "message": "Admin user created successfully",
             "user": serializer.data
@@ -274,7 +784,8 @@ def list_admin_users(request):
 @permission_classes([IsAuthenticated])
 def update_admin_user(request, id):
     """
-    Update an admin user by ID.
+    Update an admin user by ID. Changing the password revokes the user's
+    refresh tokens.
     """
     try:
         user = User.objects.get(id=id)
@@ -282,7 +793,8 @@ def update_admin_user(request, id):
         return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
     data = request.data.copy()
-    if 'password' in data:
+    password_changed = 'password' in data
+    if password_changed:
         user.set_password(data['password'])
         data.pop('password')
 
@@ -290,6 +802,10 @@ def update_admin_user(request, id):
     
     if serializer.is_valid():
         serializer.save()
+        if password_changed:
+            revocation.revoke_user_tokens(user.id)
+        audit.record(request, AuditEvent.Action.ADMIN_UPDATE, target_user_id=user.id,
+                     changes={**serializer.validated_data, "password_changed": password_changed})
         return Response({
             "message": "User updated successfully",
             "user": serializer.data
@@ -307,11 +823,13 @@ def update_admin_user(request, id):
 @permission_classes([IsAuthenticated])
 def delete_admin_user(request, id):
     """
-    Delete an admin user by ID.
+    Delete an admin user by ID and revoke their refresh tokens.
     """
     try:
         user = User.objects.get(id=id)
         user.delete()
+        revocation.revoke_user_tokens(id)
+        audit.record(request, AuditEvent.Action.ADMIN_DELETE, target_user_id=id)
         return Response({"message": "User deleted successfully"}, status=status.HTTP_200_OK)
     except User.DoesNotExist:
         return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,145 @@
+"""
+Cache warming after deploys, restarts and bulk imports.
+
+What is cold after a restart is the database's buffer cache (the first
+catalogue pages and the most viewed products), the catalogue counts and
+facets, and, in every worker process, its URL resolver, revoked token
+filter and replica lag checks. warm() refreshes the shared ones with a few
+bulk queries run concurrently, each bounded by what is left of a time
+budget; in a worker it warms that process too. The results a worker keeps
+for coalesced reads (api.coalescing) are not warmed: they are keyed by
+request URL and only kept for seconds.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import resolve
+
+from . import replicas, revocation
+from .models import COUNT_STRATEGIES, CatalogueFacets, Product, ProductPagination
+
+
+def _limit_statements(deadline):
+    """
+    Make the databases cancel queries of this thread running past the
+    deadline, on the primary and on the replicas reads may be routed to.
+    """
+    remaining = str(max(1, int((deadline - time.monotonic()) * 1000)))
+    for alias in (DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS):
+        if connections[alias].vendor == 'postgresql':
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, false)", [remaining])
+
+
+def warm_catalogue(pages, page_size, **options):
+    """
+    Read the first catalogue pages with one query and count the catalogue
+    with the default strategy.
+    """
+    products = Product.objects.order_by('sku')
+    rows = len(products[:pages * page_size])
+    count = COUNT_STRATEGIES[settings.PRODUCT_COUNT_STRATEGY](products)
+    return f"{rows} products on the first {pages} pages of {count}"
+
+
+def warm_top_products(top, **options):
+    """
+    Read the most viewed products, then look them up again by SKU to load
+    the primary key index entries product_detail uses.
+    """
+    skus = list(Product.objects.order_by('-views').values_list('sku', flat=True)[:top])
+    found = len(Product.objects.filter(sku__in=skus).only('sku', 'name', 'brand', 'price'))
+    return f"{found} most viewed products"
+
+
+def warm_facets(**options):
+    CatalogueFacets.get()
+    return "catalogue facets"
+
+
+def warm_worker(**options):
+    """
+    Warm the state shared by the threads of this process.
+    """
+    resolve('/api/v1/catalogue/')
+    revocation.sync(force=True)
+    replicas.clear_lag_checks()
+    fresh = [alias for alias in settings.DATABASE_REPLICAS if replicas.replica_is_fresh(alias)]
+    return f"worker state, {len(fresh)} of {len(settings.DATABASE_REPLICAS)} replicas fresh"
+
+
+TASKS = {
+    'catalogue': warm_catalogue,
+    'top_products': warm_top_products,
+    'facets': warm_facets,
+}
+
+
+def warm(pages=None, page_size=None, top=None, budget=None, workers=4, in_worker=False):
+    """
+    Run the warming tasks concurrently for at most `budget` seconds.
+    Queries still running then are cancelled by the database. Returns
+    (task, outcome, seconds) triples.
+    """
+    options = {
+        'pages': settings.WARM_CACHE_PAGES if pages is None else pages,
+        'page_size': page_size or ProductPagination.page_size,
+        'top': settings.WARM_CACHE_TOP_PRODUCTS if top is None else top,
+    }
+    budget = settings.WARM_CACHE_BUDGET if budget is None else budget
+    deadline = time.monotonic() + budget
+    tasks = dict(TASKS, worker=warm_worker) if in_worker else TASKS
+
+    def run(task):
+        started = time.monotonic()
+        try:
+            _limit_statements(deadline)
+            outcome = task(**options)
+        except Exception as e:
+            outcome = f"failed: {e}"
+        finally:
+            # Each task runs in its own thread, with its own connections.
+            connections.close_all()
+        return outcome, time.monotonic() - started
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warm_cache')
+    futures = {name: executor.submit(run, task) for name, task in tasks.items()}
+    wait(futures.values(), timeout=max(0, deadline - time.monotonic()))
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for name, future in futures.items():
+        if future.done():
+            outcome, seconds = future.result()
+            results.append((name, outcome, round(seconds, 3)))
+        else:
+            results.append((name, "timed out", round(budget, 3)))
+    return results
+
+
+_started_lock = threading.Lock()
+# Process id of the worker that started warming, if any.
+_started_in = None
+
+
+def warm_on_startup(**kwargs):
+    """
+    request_started receiver, connected when WARM_CACHE_ON_STARTUP is set:
+    warm in the background on the first request of each worker process, so
+    it does not delay serving. Warming on import would run in the master of
+    a preloading server instead of its forked workers, and in management
+    commands importing the WSGI application.
+    """
+    global _started_in
+    pid = os.getpid()
+    if _started_in == pid:
+        return
+    with _started_lock:
+        if _started_in == pid:
+            return
+        _started_in = pid
+    threading.Thread(target=warm, kwargs={'in_worker': True}, name='warm_cache', daemon=True).start()
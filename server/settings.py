@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import datetime
 from pathlib import Path
 import os
+import sys
 from environ import Env
 
 
@@ -61,10 +62,24 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False, 
+    # The UIs load the pre-generated schema instead of generating it per request
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
 }
 
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+# Pre-generated OpenAPI schema, see `manage.py generate_schema`
+OPENAPI_SCHEMA_DIR = env("OPENAPI_SCHEMA_DIR", default=str(BASE_DIR / "openapi"))
+OPENAPI_SCHEMA_MAX_AGE = env.int("OPENAPI_SCHEMA_MAX_AGE", default=300)
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.compression.CompressionMiddleware",
+    "api.querylog.SlowQueryLogMiddleware",
+    "api.replicas.ReplicaPinMiddleware",
+    "api.throttling.RateLimitHeadersMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -80,10 +95,31 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',  # Default permission can be set here, overridden in views
     ),
+    # Token buckets per client, see api.throttling. Rates are "N/period"
+    # with a period of s, min, hour or day; unset scopes are not limited.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon_read': env("THROTTLE_ANON_READ", default="300/min"),
+        'user_read': env("THROTTLE_USER_READ", default="1200/min"),
+        'write': env("THROTTLE_WRITE", default="120/min"),
+        'auth': env("THROTTLE_AUTH", default="10/min"),
+    },
+    # Proxies in front of the app, so the client IP is read from X-Forwarded-For.
+    'NUM_PROXIES': env.int("NUM_PROXIES", default=None),
 }
 
+# Response compression, see api.compression. Encodings whose package is not
+# installed (brotli for "br", zstandard for "zstd") are skipped.
+COMPRESSION_ENCODINGS = env.list("COMPRESSION_ENCODINGS", default=["zstd", "br", "gzip"])
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=1024)
+
 ROOT_URLCONF = "server.urls"
 
+# Keep serving the pre-v1 routes (/login, /catalogue, ...) next to /api/v1/.
+LEGACY_ROUTES = env.bool("LEGACY_ROUTES", default=True)
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -117,6 +153,60 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma-separated hosts sharing the primary's name and
+# credentials. Catalogue reads are routed to them by api.replicas.
+DB_REPLICA_HOSTS = env.list("DB_REPLICA_HOSTS", default=[])
+if not DB_REPLICA_HOSTS and sys.argv[1:2] == ["test"]:
+    # Tests read through a replica alias mirroring the test database.
+    DB_REPLICA_HOSTS = [DATABASES["default"]["HOST"]]
+DATABASE_REPLICAS = [f"replica{index}" for index in range(1, len(DB_REPLICA_HOSTS) + 1)]
+DATABASES.update({
+    alias: {**DATABASES["default"], "HOST": host, "TEST": {"MIRROR": "default"}}
+    for alias, host in zip(DATABASE_REPLICAS, DB_REPLICA_HOSTS)
+})
+DATABASE_ROUTERS = ["api.replicas.ReplicaRouter"]
+
+# Replicas further behind than this many seconds are not read from.
+REPLICA_MAX_LAG = env.float("REPLICA_MAX_LAG", default=5.0)
+REPLICA_LAG_CHECK_INTERVAL = env.float("REPLICA_LAG_CHECK_INTERVAL", default=1.0)
+
+# How catalogue pages count the products: "exact", "cached" or
+# "approximate" (overridable per request with ?count=).
+PRODUCT_COUNT_STRATEGY = env("PRODUCT_COUNT_STRATEGY", default="exact")
+# Seconds before a cached count is recomputed.
+PRODUCT_COUNT_TTL = env.int("PRODUCT_COUNT_TTL", default=300)
+
+# Shared by every worker when pointed at Redis or Memcached, e.g.
+# CACHE_URL=redis://cache:6379/0; the default is per process.
+CACHES = {"default": env.cache_url("CACHE_URL", default="locmemcache://")}
+
+# Seconds catalogue facets stay cached; writes through the API invalidate
+# them sooner.
+FACETS_CACHE_TTL = env.int("FACETS_CACHE_TTL", default=300)
+
+# Most products one batch lookup (products/batch/) may ask for.
+PRODUCT_BATCH_MAX_SIZE = env.int("PRODUCT_BATCH_MAX_SIZE", default=100)
+
+# Identical concurrent product and catalogue reads of a worker share one
+# query, see api.coalescing. Results are reused for COALESCE_FRESH_SECONDS,
+# then served stale for COALESCE_STALE_SECONDS while refreshed in the
+# background; 0 only shares the queries in flight.
+COALESCE_FRESH_SECONDS = env.float("COALESCE_FRESH_SECONDS", default=0)
+COALESCE_STALE_SECONDS = env.float("COALESCE_STALE_SECONDS", default=0)
+COALESCE_MAX_ENTRIES = env.int("COALESCE_MAX_ENTRIES", default=1024)
+
+# Cache warming (`manage.py warm_cache`, after imports and, when
+# WARM_CACHE_ON_STARTUP is set, on the first request of every web worker):
+# catalogue pages and most viewed products read, and seconds allowed.
+WARM_CACHE_ON_STARTUP = env.bool("WARM_CACHE_ON_STARTUP", default=False)
+WARM_CACHE_PAGES = env.int("WARM_CACHE_PAGES", default=5)
+WARM_CACHE_TOP_PRODUCTS = env.int("WARM_CACHE_TOP_PRODUCTS", default=500)
+WARM_CACHE_BUDGET = env.float("WARM_CACHE_BUDGET", default=10.0)
+
+# Days a soft-deleted product is kept before `manage.py purge_products`
+# removes it.
+PRODUCT_PURGE_AFTER_DAYS = env.int("PRODUCT_PURGE_AFTER_DAYS", default=30)
+
 # EMAIL
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
@@ -173,4 +263,40 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=5),  # Example: 5 minutes
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(days=1),    # Example: 1 day
     # ... other settings ...
-}
\ No newline at end of file
+}
+
+# Seconds between rebuilds of the in-memory revoked token filter, see
+# api.revocation; revocations made through a shared cache apply sooner.
+REVOCATION_SYNC_INTERVAL = env.float("REVOCATION_SYNC_INTERVAL", default=30.0)
+
+
+# Product change events streamed at events/products/, see api.events.
+# EVENTS_BROKER is "local" (events of this process) or "postgres"
+# (LISTEN/NOTIFY, events of every process). The last EVENTS_BUFFER_SIZE
+# events are kept for clients resuming with Last-Event-ID.
+EVENTS_BROKER = env.str("EVENTS_BROKER", default="local")
+EVENTS_BUFFER_SIZE = env.int("EVENTS_BUFFER_SIZE", default=1000)
+EVENTS_QUEUE_SIZE = env.int("EVENTS_QUEUE_SIZE", default=100)
+EVENTS_HEARTBEAT = env.float("EVENTS_HEARTBEAT", default=15.0)
+EVENTS_RETRY_MS = env.int("EVENTS_RETRY_MS", default=3000)
+
+# Currency of product prices by default and of the exchange rates, which
+# are cached for EXCHANGE_RATES_CACHE_TTL seconds, see ExchangeRate.
+BASE_CURRENCY = env.str("BASE_CURRENCY", default="USD")
+EXCHANGE_RATES_CACHE_TTL = env.int("EXCHANGE_RATES_CACHE_TTL", default=300)
+
+# Query timing, see api.querylog: queries taking SLOW_QUERY_THRESHOLD_MS or
+# more are logged, with an EXPLAIN ANALYZE plan for SLOW_QUERY_EXPLAIN_RATE
+# of the SELECTs on PostgreSQL. EXPLAIN ANALYZE runs the slow query again,
+# so plans are off unless asked for (e.g. 0.01).
+SLOW_QUERY_LOG = env.bool("SLOW_QUERY_LOG", default=True)
+SLOW_QUERY_THRESHOLD_MS = env.float("SLOW_QUERY_THRESHOLD_MS", default=200.0)
+SLOW_QUERY_EXPLAIN_RATE = env.float("SLOW_QUERY_EXPLAIN_RATE", default=0.0)
+SLOW_QUERY_LOG_SIZE = env.int("SLOW_QUERY_LOG_SIZE", default=100)
+SLOW_QUERY_MAX_FINGERPRINTS = env.int("SLOW_QUERY_MAX_FINGERPRINTS", default=500)
+
+# Audit log of admin actions, written in batches of AUDIT_BATCH_SIZE by a
+# background thread at least every AUDIT_FLUSH_INTERVAL seconds, see api.audit.
+AUDIT_BATCH_SIZE = env.int("AUDIT_BATCH_SIZE", default=100)
+AUDIT_FLUSH_INTERVAL = env.float("AUDIT_FLUSH_INTERVAL", default=2.0)
+AUDIT_MAX_PENDING = env.int("AUDIT_MAX_PENDING", default=10000)
\ No newline at end of file
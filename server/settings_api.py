@@ -0,0 +1,46 @@
+"""
+Settings profile for workers that only serve the API.
+
+Drops the apps and middleware the JSON API doesn't use (admin, sessions,
+messages, CSRF, static files, API docs) so workers boot faster. Select it
+with DJANGO_SETTINGS_MODULE=server.settings_api; `manage.py profile_startup
+server.settings server.settings_api` compares the two.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in {
+        "django.contrib.admin",
+        "django.contrib.sessions",
+        "django.contrib.messages",
+        "django.contrib.staticfiles",
+        "rest_framework.authtoken",
+        "drf_yasg",
+    }
+]
+
+# JWT authentication is done by DRF, so neither sessions nor Django's
+# authentication middleware are needed.
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware not in {
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.middleware.csrf.CsrfViewMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+    }
+]
+
+TEMPLATES[0]["OPTIONS"]["context_processors"] = [
+    processor for processor in TEMPLATES[0]["OPTIONS"]["context_processors"]
+    if processor != "django.contrib.messages.context_processors.messages"
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+}
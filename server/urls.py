@@ -1,36 +1,51 @@
-from django.urls import re_path
+from django.apps import apps
+from django.conf import settings
+from django.urls import path, re_path
+# Registers the <sku:> converter used by the legacy routes below.
+from api import converters  # noqa: F401
 from api import views
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from api.routing import dispatch_include
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Product API",
-        default_version='v1',
-        description="API for managing catalogue of products",
-        contact=openapi.Contact(email="ar.gutierrezrojo@gmail.com"),
-    ),
-    public=True,
-)
 urlpatterns = [
-    re_path('login', views.login, name='login'),
-    re_path('catalogue', views.list_products, name='list_products'),
-    re_path('product/(?P<sku>[^/]+)/$', views.product_detail, name='product_detail'),  
-    re_path('updateproduct/(?P<sku>[^/]+)', views.update_product, name='update_product'), 
-    re_path('deleteproduct/(?P<sku>[^/]+)', views.delete_product, name='delete_product'),
-    re_path('refresh_token', views.refresh_token, name='refresh_token'),
-    re_path('newproduct', views.create_product, name='create_product'),
-    re_path('newadmin', views.create_admin_users, name='create_admin_users'),
-    re_path('admins', views.list_admin_users, name='list_admin_users'),
-    re_path('updateadmin/(?P<id>[^/]+)', views.update_admin_user, name='update_admin_user'),
-    re_path('deleteadmin/(?P<id>[^/]+)', views.delete_admin_user, name='delete_admin_user'),
-
-    # Swagger UI
-    re_path('swagger(?P<format>\.json|\.yaml)', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    re_path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    re_path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-  
+    # Resolved by first and last path segments, see api.routing.
+    dispatch_include('api/v1/', ('api.urls', 'api'), namespace='v1'),
 ]
 
+# API docs are only served when drf_yasg is installed, so API-only workers
+# (server/settings_api.py) never import the Swagger stack.
+if apps.is_installed('drf_yasg'):
+    from api.schema import get_api_info, serve_schema
+    from drf_yasg.views import get_schema_view
+
+    schema_view = get_schema_view(get_api_info(), public=True)
 
+    # Swagger UI
+    urlpatterns += [
+        re_path(r'^swagger(?P<format>\.json|\.yaml)$', serve_schema, name='schema-json'),
+        path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+        path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    ]
+
+# Pre-v1 routes, kept for existing clients while LEGACY_ROUTES is enabled.
+# The regexes are anchored at the start so they can no longer capture paths
+# under /api/v1/, but still accept the suffixes old clients may send; the
+# update and delete routes take their SKU with or without a trailing slash.
+legacy_urlpatterns = [
+    path('product/code/<slug:code>/', views.product_detail, name='product_detail_by_code'),
+    path('product/<sku:sku>/', views.product_detail, name='product_detail'),
+    path('updateproduct/<sku:sku>', views.update_product, name='update_product'),
+    path('updateproduct/<sku:sku>/', views.update_product),
+    path('deleteproduct/<sku:sku>', views.delete_product, name='delete_product'),
+    path('deleteproduct/<sku:sku>/', views.delete_product),
+    re_path('^login', views.login, name='login'),
+    re_path('^catalogue', views.list_products, name='list_products'),
+    re_path('^refresh_token', views.refresh_token, name='refresh_token'),
+    re_path('^newproduct', views.create_product, name='create_product'),
+    re_path('^newadmin', views.create_admin_users, name='create_admin_users'),
+    re_path('^admins', views.list_admin_users, name='list_admin_users'),
+    re_path('^updateadmin/(?P<id>[^/]+)', views.update_admin_user, name='update_admin_user'),
+    re_path('^deleteadmin/(?P<id>[^/]+)', views.delete_admin_user, name='delete_admin_user'),
+]
 
+if settings.LEGACY_ROUTES:
+    urlpatterns += legacy_urlpatterns